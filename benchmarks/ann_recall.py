@@ -0,0 +1,81 @@
+"""
+Approximate nearest-neighbour benchmark
+
+Builds the exact flat backend and the IVF backend over the same synthetic,
+clustered, normalized vectors and reports single-query latency and recall@k
+of IVF against the exact results for several nprobe settings.
+
+Usage:
+    python -m benchmarks.ann_recall [--size N] [--dim D] [--queries Q] [--k K]
+"""
+
+import argparse
+import time
+import numpy as np
+from rag_demo.vector_index import FlatIndex, IVFIndex, normalize_rows
+
+def synthetic_vectors(size: int, dim: int, clusters: int, rng: np.random.Generator) -> np.ndarray:
+    """Normalized vectors drawn around random cluster centres, generated in blocks"""
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = np.empty((size, dim), dtype=np.float32)
+    for start in range(0, size, 100000):
+        n = min(100000, size - start)
+        labels = rng.integers(0, clusters, size=n)
+        noise = rng.standard_normal((n, dim)).astype(np.float32)
+        vectors[start:start + n] = normalize_rows(centres[labels] + 1.0 * noise)
+    return vectors
+
+def time_queries(index, queries: np.ndarray, k: int):
+    """Search one query at a time, returning ids and per-query latencies in ms"""
+    ids = np.empty((len(queries), k), dtype=np.int64)
+    latencies = []
+    for i, query in enumerate(queries):
+        start = time.perf_counter()
+        _, found = index.search(query[None, :], k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        ids[i] = found[0]
+    return ids, np.array(latencies)
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the exact top-k neighbours that were found"""
+    hits = sum(len(np.intersect1d(f, t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def run(size: int, dim: int, num_queries: int, k: int, nlist: int):
+    rng = np.random.default_rng(42)
+    print(f"Generating {size} vectors of dimension {dim}")
+    data = synthetic_vectors(size + num_queries, dim, max(16, size // 1000), rng)
+    vectors, queries = data[:size], data[size:]
+    
+    flat = FlatIndex()
+    flat.add(vectors)
+    truth, flat_latency = time_queries(flat, queries, k)
+    
+    ivf = IVFIndex(nlist=nlist)
+    ivf.add(vectors)
+    start = time.perf_counter()
+    ivf.train()
+    train_seconds = time.perf_counter() - start
+    print(f"IVF trained {len(ivf.centroids)} lists in {train_seconds:.1f}s\n")
+    
+    print(f"{'backend':<14} {'recall@' + str(k):>10} {'p50 ms':>8} {'p99 ms':>8}")
+    print(f"{'flat':<14} {1.0:>10.3f} {np.percentile(flat_latency, 50):>8.2f} "
+          f"{np.percentile(flat_latency, 99):>8.2f}")
+    for nprobe in (1, 4, 8, 16, 32, 64):
+        ivf.nprobe = nprobe
+        found, latency = time_queries(ivf, queries, k)
+        print(f"{'ivf nprobe=' + str(nprobe):<14} {recall_at_k(found, truth):>10.3f} "
+              f"{np.percentile(latency, 50):>8.2f} {np.percentile(latency, 99):>8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="ANN recall/latency benchmark")
+    parser.add_argument("--size", type=int, default=200000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--nlist", type=int, default=0, help="IVF lists (0 = sqrt(size))")
+    args = parser.parse_args()
+    run(args.size, args.dim, args.queries, args.k, args.nlist)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Batch query throughput benchmark
+
+Builds a small index against the local stub API server and answers a file of
+synthetic queries with rag_demo.batch.answer_batch at several generation
+concurrencies, reporting queries per second. One RAGPipeline.query call per
+query, as a loop over the file would do, is measured as the baseline, and a
+retrieve-only run shows the cost of batched embedding and search alone.
+
+Usage:
+    python -m benchmarks.batch_throughput [--chunks N] [--queries Q] [--chat-latency SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import tempfile
+import time
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from rag_demo.rag_pipeline import RAGPipeline
+from rag_demo.batch import answer_batch
+from benchmarks.stub_server import StubServer
+
+def run(chunks: int, num_queries: int, chat_latency: float):
+    stub = StubServer(latency=0.01, chat_latency=chat_latency, token_latency=0.0).start()
+    Config.INDEX_LLM_API_KEY = Config.CHAT_LLM_API_KEY = "stub"
+    Config.INDEX_LLM_API_BASE = Config.CHAT_LLM_API_BASE = stub.base_url
+    Config.EMBEDDING_CACHE_ENABLED = False
+    Config.RESPONSE_CACHE_ENABLED = False
+    logger.setLevel(logging.WARNING)
+    
+    with tempfile.TemporaryDirectory() as work_dir:
+        db = VectorDatabase(os.path.join(work_dir, "db"))
+        db.add_documents([f"Synthetic document {i} on topic {i % 97}. " * 20 for i in range(chunks)])
+        pipeline = RAGPipeline()
+        pipeline.vector_db = db
+        
+        input_path = os.path.join(work_dir, "queries.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(num_queries):
+                f.write(json.dumps({"id": i, "query": f"question {i} about topic {i % 97}"}) + "\n")
+        
+        print(f"{'mode':<22} {'queries':>8} {'seconds':>8} {'QPS':>8}")
+        
+        # Baseline: one blocking pipeline call per query
+        serial = min(num_queries, 50)
+        start = time.perf_counter()
+        for i in range(serial):
+            pipeline.query(f"question {i} about topic {i % 97}")
+        seconds = time.perf_counter() - start
+        print(f"{'query() loop':<22} {serial:>8} {seconds:>8.2f} {serial / seconds:>8.1f}")
+        
+        async def batches():
+            runs = [("retrieve only", 16, True)] + [(f"batch c={c}", c, False) for c in (4, 16, 64)]
+            for number, (label, concurrency, retrieve_only) in enumerate(runs):
+                output_path = os.path.join(work_dir, f"results_{number}.jsonl")
+                stats = await answer_batch(pipeline, input_path, output_path, concurrency=concurrency,
+                                           retrieve_only=retrieve_only)
+                print(f"{label:<22} {stats['answered']:>8} {stats['seconds']:>8.2f} {stats['queries_per_second']:>8.1f}")
+        
+        # One event loop for every run, since the async chat client is bound to it
+        asyncio.run(batches())
+    stub.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch query throughput benchmark")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of indexed chunks")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries in the batch file")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Simulated LLM latency (s)")
+    args = parser.parse_args()
+    run(args.chunks, args.queries, args.chat_latency)
+
+if __name__ == "__main__":
+    main()
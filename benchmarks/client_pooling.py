@@ -0,0 +1,93 @@
+"""
+LLM client pooling and request coalescing benchmark
+
+Sends sequential embedding and chat requests to the local stub API server,
+once with a new OpenAI client (and connection pool) per request, as the
+code did before the shared provider layer, and once through the pooled
+clients of rag_demo.providers. The difference is the connection setup and
+client construction saved per request; over TLS to a remote API it also
+includes the handshake round trips, so it is larger than measured here.
+Then many coroutines embed the same query at once, with and without
+coalescing, counting the HTTP requests that reach the server.
+
+Usage:
+    python -m benchmarks.client_pooling [--requests N] [--latency SECONDS] [--duplicates D]
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import numpy as np
+import openai
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.embedding import EmbeddingEngine
+from rag_demo.providers import close_providers, get_provider
+from benchmarks.stub_server import StubServer
+
+def time_requests(requests: int, send) -> np.ndarray:
+    """Per-request latencies in ms of `requests` sequential calls, after a warm-up call"""
+    send()
+    latencies = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        send()
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+def compare_clients(label: str, requests: int, call):
+    """Print latencies of `call(client)` with a new client per request and with the pooled client"""
+    def new_client():
+        with openai.OpenAI(api_key=Config.CHAT_LLM_API_KEY, base_url=Config.CHAT_LLM_API_BASE) as client:
+            call(client)
+    
+    unpooled = time_requests(requests, new_client)
+    pooled = time_requests(requests, lambda: call(get_provider("chat").client))
+    saved = np.mean(unpooled) - np.mean(pooled)
+    for mode, latency in (("new client", unpooled), ("pooled", pooled)):
+        print(f"{label:<11} {mode:<12} {np.mean(latency):>8.2f} {np.percentile(latency, 50):>8.2f} "
+              f"{np.percentile(latency, 99):>8.2f}")
+    print(f"{label:<11} {'saved':<12} {saved:>8.2f}")
+
+def run(requests: int, latency: float, duplicates: int):
+    stub = StubServer(latency=latency, chat_latency=latency, token_latency=0.0).start()
+    Config.INDEX_LLM_API_KEY = Config.CHAT_LLM_API_KEY = "stub"
+    Config.INDEX_LLM_API_BASE = Config.CHAT_LLM_API_BASE = stub.base_url
+    logger.setLevel(logging.WARNING)
+    
+    try:
+        print(f"{'request':<11} {'client':<12} {'mean ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        compare_clients("embedding", requests, lambda client: client.embeddings.create(
+            input=["what is the warranty period?"], model=Config.INDEX_LLM_MODEL))
+        compare_clients("chat", requests, lambda client: client.chat.completions.create(
+            model=Config.CHAT_LLM_MODEL, messages=[{"role": "user", "content": "hello"}]))
+        
+        print(f"\n{'coalescing':<11} {'callers':>8} {'requests':>9} {'ms':>8}")
+        engine = EmbeddingEngine(use_cache=False)
+        for coalesce in (False, True):
+            Config.LLM_COALESCE_REQUESTS = coalesce
+            
+            async def embed_duplicates():
+                await engine.aembed(["warm-up"])
+                stub.request_count = 0
+                start = time.perf_counter()
+                await asyncio.gather(*(engine.aembed(["what is the warranty period?"]) for _ in range(duplicates)))
+                return (time.perf_counter() - start) * 1000
+            
+            elapsed = asyncio.run(embed_duplicates())
+            print(f"{'on' if coalesce else 'off':<11} {duplicates:>8} {stub.request_count:>9} {elapsed:>8.2f}")
+    finally:
+        close_providers()
+        stub.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="LLM client pooling and request coalescing benchmark")
+    parser.add_argument("--requests", type=int, default=200, help="Sequential requests per client mode")
+    parser.add_argument("--latency", type=float, default=0.005, help="Simulated API latency (s)")
+    parser.add_argument("--duplicates", type=int, default=64, help="Concurrent callers embedding the same query")
+    args = parser.parse_args()
+    run(args.requests, args.latency, args.duplicates)
+
+if __name__ == "__main__":
+    main()
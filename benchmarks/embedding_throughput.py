@@ -0,0 +1,55 @@
+"""
+Embedding throughput benchmark
+
+Measures chunks/sec of EmbeddingEngine against a local stub embedding server
+while varying request concurrency and batch size.
+
+Usage:
+    python -m benchmarks.embedding_throughput [--chunks N] [--latency SECONDS]
+"""
+
+import argparse
+import time
+from rag_demo.config import Config
+from rag_demo.embedding import EmbeddingEngine
+from benchmarks.stub_server import StubServer
+
+def run(chunks: int, latency: float, rate_limit_fraction: float):
+    server = StubServer(latency=latency, rate_limit_fraction=rate_limit_fraction).start()
+    Config.INDEX_LLM_API_KEY = "stub"
+    Config.INDEX_LLM_API_BASE = server.base_url
+    Config.EMBEDDING_RETRY_BASE_DELAY = 0.01
+    
+    texts = [f"Synthetic chunk {i}: " + "lorem ipsum dolor sit amet " * 30 for i in range(chunks)]
+    
+    print(f"{'batch':>6} {'concurrency':>12} {'requests':>9} {'seconds':>8} {'chunks/sec':>11}")
+    try:
+        for batch_size in (1, 16, 64, 256):
+            for concurrency in (1, 4, 16):
+                if batch_size == 1 and concurrency == 1 and chunks > 500:
+                    # Serial single-input requests are the baseline; cap their cost
+                    sample = texts[:500]
+                else:
+                    sample = texts
+                engine = EmbeddingEngine(batch_size=batch_size, concurrency=concurrency, use_cache=False)
+                server.request_count = 0
+                start = time.perf_counter()
+                engine.embed(sample)
+                elapsed = time.perf_counter() - start
+                engine.close()
+                print(f"{batch_size:>6} {concurrency:>12} {server.request_count:>9} "
+                      f"{elapsed:>8.2f} {len(sample) / elapsed:>11.0f}")
+    finally:
+        server.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Embedding throughput benchmark")
+    parser.add_argument("--chunks", type=int, default=5000, help="Number of chunks to embed")
+    parser.add_argument("--latency", type=float, default=0.02, help="Simulated per-request latency (s)")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="Fraction of requests the stub answers with HTTP 429")
+    args = parser.parse_args()
+    run(args.chunks, args.latency, args.rate_limit)
+
+if __name__ == "__main__":
+    main()
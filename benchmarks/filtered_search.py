@@ -0,0 +1,80 @@
+"""
+Metadata-filtered search benchmark
+
+Indexes synthetic normalized vectors spread evenly over 100 collections and
+measures single-query latency of VectorDatabase.search_by_vector without a
+filter and with filters admitting a decreasing share of the collections.
+Selective filters only score the matching vectors, so latency should fall
+roughly in proportion to the matching fraction; the first query of each
+filter also evaluates the filter mask, later ones reuse it.
+
+Usage:
+    python -m benchmarks.filtered_search [--size N] [--dim D] [--index-type flat] [--queries Q]
+"""
+
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+import numpy as np
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from benchmarks.ann_recall import synthetic_vectors
+
+COLLECTIONS = 100
+
+# Percent of the collections admitted by each filter (100 = no filter)
+MATCHING_PERCENTS = [100, 50, 25, 10, 1]
+
+def time_search(db: VectorDatabase, queries: np.ndarray, k: int, filters: dict) -> np.ndarray:
+    """Per-query latencies in ms, after a warm-up pass"""
+    for query in queries[:10]:
+        db.search_by_vector(query, k, filters)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        db.search_by_vector(query, k, filters)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+def run(size: int, dim: int, index_type: str, num_queries: int, k: int):
+    logger.setLevel(logging.WARNING)
+    rng = np.random.default_rng(42)
+    print(f"Generating {size} vectors of dimension {dim} ({index_type} index)")
+    data = synthetic_vectors(size + num_queries, dim, max(16, size // 1000), rng)
+    vectors, queries = data[:size], data[size:]
+    
+    db_path = tempfile.mkdtemp(prefix="filter_bench_")
+    try:
+        db = VectorDatabase(db_path, index_type)
+        collections = rng.integers(0, COLLECTIONS, size)
+        db.add_vectors(vectors, [{"text": "", "collection": f"c{c}"} for c in collections])
+        del vectors, data
+        
+        print(f"\n{'matching':<10} {'mask ms':>8} {'p50 ms':>8} {'p99 ms':>8}")
+        for percent in MATCHING_PERCENTS:
+            filters = None
+            mask_ms = 0.0
+            if percent < 100:
+                filters = {"collection": [f"c{c}" for c in range(percent * COLLECTIONS // 100)]}
+                start = time.perf_counter()
+                db.filter_index.mask(filters)
+                mask_ms = (time.perf_counter() - start) * 1000
+            latency = time_search(db, queries, k, filters)
+            print(f"{str(percent) + '%':<10} {mask_ms:>8.2f} {np.percentile(latency, 50):>8.2f} {np.percentile(latency, 99):>8.2f}")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Metadata-filtered search benchmark")
+    parser.add_argument("--size", type=int, default=200000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--index-type", default="flat", help="Index backend, see VECTOR_DB_TYPE")
+    parser.add_argument("--queries", type=int, default=100, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    args = parser.parse_args()
+    run(args.size, args.dim, args.index_type, args.queries, args.k)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Live update benchmark: ingestion and search at the same time
+
+Saves an index of random vectors, then appends batches of new vectors
+(through the write-ahead log and the live segment) while reader threads
+search continuously. Reports search latency on the idle index and during
+ingestion, the latency of each logged write, ingestion throughput, the
+number of background merges, and whether every written vector was its own
+nearest neighbour right after the write returned. Runs once with fsync of
+every write and once without (WAL_FSYNC).
+
+Usage:
+    python -m benchmarks.live_updates [--base N] [--dim D] [--batch B] [--batches M] [--readers R] [--segment S]
+"""
+
+import argparse
+import logging
+import shutil
+import tempfile
+import threading
+import time
+import numpy as np
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from rag_demo.vector_index import normalize_rows
+
+def search_latencies(db: VectorDatabase, queries: np.ndarray, stop: threading.Event, latencies: list):
+    """Search random queries until stopped, appending latencies in ms"""
+    rng = np.random.default_rng()
+    while not stop.is_set():
+        query = queries[rng.integers(0, len(queries))]
+        start = time.perf_counter()
+        db.search_by_vector(query, Config.TOP_K_RESULTS)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+def percentiles(latencies: list) -> str:
+    return f"{np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f}"
+
+def run_once(base: int, dim: int, batch: int, batches: int, readers: int, fsync: bool):
+    Config.WAL_FSYNC = fsync
+    rng = np.random.default_rng(0)
+    queries = normalize_rows(rng.standard_normal((1000, dim)).astype(np.float32))
+    new_vectors = normalize_rows(rng.standard_normal((batch * batches, dim)).astype(np.float32))
+    
+    db_path = tempfile.mkdtemp(prefix="live_bench_")
+    try:
+        db = VectorDatabase(db_path, "flat")
+        db.add_vectors(rng.standard_normal((base, dim)).astype(np.float32),
+                       [{"text": f"chunk {i}"} for i in range(base)])
+        db.save()
+        
+        # Idle baseline
+        stop, idle = threading.Event(), []
+        threads = [threading.Thread(target=search_latencies, args=(db, queries, stop, idle)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(2.0)
+        stop.set()
+        for thread in threads:
+            thread.join()
+        
+        # Ingestion while the readers keep searching
+        stop, busy, writes, fresh = threading.Event(), [], [], 0
+        threads = [threading.Thread(target=search_latencies, args=(db, queries, stop, busy)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        generation = db.generation
+        ingest_start = time.perf_counter()
+        for number in range(batches):
+            block = new_vectors[number * batch:(number + 1) * batch]
+            start = time.perf_counter()
+            db.add_vectors(block, [{"text": f"new chunk {number}-{i}"} for i in range(len(block))])
+            writes.append((time.perf_counter() - start) * 1000)
+            top, _ = db.search_by_vector(block[-1], 1)[0]
+            fresh += top["document_index"] == len(db) - 1
+        ingest_seconds = time.perf_counter() - ingest_start
+        stop.set()
+        for thread in threads:
+            thread.join()
+        
+        print(f"{'on' if fsync else 'off':<6} {percentiles(idle)} {percentiles(busy)} {percentiles(writes)} "
+              f"{batch * batches / ingest_seconds:>10.0f} {db.generation - generation:>7} {fresh:>5}/{batches}")
+        db.merge_segments()
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def run(base: int, dim: int, batch: int, batches: int, readers: int, segment: int):
+    logger.setLevel(logging.WARNING)
+    Config.LIVE_SEGMENT_MAX_VECTORS = segment
+    print(f"Base index {base} x {dim}, {batches} writes of {batch} vectors, {readers} search threads, "
+          f"segments of {segment} vectors")
+    print(f"\n{'':<6} {'idle search ms':>17} {'busy search ms':>17} {'write ms':>17}")
+    print(f"{'fsync':<6} {'p50':>8} {'p99':>8} {'p50':>8} {'p99':>8} {'p50':>8} {'p99':>8} "
+          f"{'vectors/s':>10} {'merges':>7} {'fresh':>11}")
+    for fsync in (True, False):
+        run_once(base, dim, batch, batches, readers, fsync)
+
+def main():
+    parser = argparse.ArgumentParser(description="Live update benchmark")
+    parser.add_argument("--base", type=int, default=100000, help="Vectors in the saved index")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--batch", type=int, default=64, help="Vectors per write")
+    parser.add_argument("--batches", type=int, default=500, help="Number of writes")
+    parser.add_argument("--readers", type=int, default=2, help="Concurrent search threads")
+    parser.add_argument("--segment", type=int, default=10000, help="LIVE_SEGMENT_MAX_VECTORS")
+    args = parser.parse_args()
+    run(args.base, args.dim, args.batch, args.batches, args.readers, args.segment)
+
+if __name__ == "__main__":
+    main()
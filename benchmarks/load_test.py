@@ -0,0 +1,163 @@
+"""
+HTTP serving load test
+
+Builds a small index against the local stub API server, serves it with
+RAGServer and measures end-to-end query latency (p50/p99) and throughput
+(QPS) at increasing numbers of concurrent clients, plus time-to-first-token
+of streamed responses. The synchronous RAGPipeline.query path, one query at
+a time, is measured as the baseline.
+
+Usage:
+    python -m benchmarks.load_test [--chunks N] [--requests R] [--chat-latency SECONDS]
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import tempfile
+import threading
+import time
+import numpy as np
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from rag_demo.rag_pipeline import RAGPipeline
+from rag_demo.server import RAGServer
+from benchmarks.stub_server import StubServer
+
+async def post_query(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query: str) -> dict:
+    """Send one POST /query on a keep-alive connection and read the JSON response"""
+    body = json.dumps({"query": query}).encode("utf-8")
+    writer.write(
+        b"POST /query HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    payload = json.loads(await reader.readexactly(length))
+    if status != 200:
+        raise RuntimeError(f"Query failed with HTTP {status}: {payload}")
+    return payload
+
+async def stream_query(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, query: str) -> float:
+    """Send one streamed POST /query, read the chunked response and return seconds to the first chunk"""
+    start = time.perf_counter()
+    body = json.dumps({"query": query, "stream": True}).encode("utf-8")
+    writer.write(
+        b"POST /query HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\n"
+        + f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body
+    )
+    await writer.drain()
+    
+    while (await reader.readline()) not in (b"\r\n", b""):
+        pass
+    first_chunk = None
+    while True:
+        size = int((await reader.readline()).strip(), 16)
+        await reader.readexactly(size + 2)
+        if size == 0:
+            return first_chunk
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+
+async def run_clients(port: int, concurrency: int, total: int, stream: bool = False) -> tuple:
+    """
+    Run `concurrency` clients issuing `total` queries
+    
+    Returns:
+        Tuple of (latencies in ms, times to first chunk in ms (streamed only), seconds)
+    """
+    latencies = []
+    first_chunks = []
+    counter = iter(range(total))
+    
+    async def client():
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        try:
+            for i in counter:
+                start = time.perf_counter()
+                query = f"load test question {i} about topic {i % 97}"
+                if stream:
+                    first_chunks.append(await stream_query(reader, writer, query) * 1000)
+                else:
+                    await post_query(reader, writer, query)
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            writer.close()
+    
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return np.array(latencies), np.array(first_chunks), time.perf_counter() - start
+
+def report(label: str, latencies: np.ndarray, seconds: float, first_chunks: np.ndarray = None):
+    ttft = f"{np.percentile(first_chunks, 50):>9.1f}" if first_chunks is not None and len(first_chunks) else f"{'-':>9}"
+    print(f"{label:<14} {len(latencies):>9} {np.percentile(latencies, 50):>9.1f} "
+          f"{np.percentile(latencies, 99):>9.1f} {ttft} {len(latencies) / seconds:>9.1f}")
+
+def run(chunks: int, requests: int, chat_latency: float):
+    stub = StubServer(latency=0.01, chat_latency=chat_latency).start()
+    Config.INDEX_LLM_API_KEY = Config.CHAT_LLM_API_KEY = "stub"
+    Config.INDEX_LLM_API_BASE = Config.CHAT_LLM_API_BASE = stub.base_url
+    # Every query must reach the stub so the embedding call is part of the latency
+    Config.EMBEDDING_CACHE_ENABLED = False
+    Config.RESPONSE_CACHE_ENABLED = False
+    logger.setLevel(logging.WARNING)
+    
+    with tempfile.TemporaryDirectory() as db_path:
+        db = VectorDatabase(db_path)
+        db.add_documents([f"Synthetic document {i} on topic {i % 97}. " * 20 for i in range(chunks)])
+        pipeline = RAGPipeline()
+        pipeline.vector_db = db
+        
+        print(f"{'mode':<14} {'requests':>9} {'p50 ms':>9} {'p99 ms':>9} {'TTFT p50':>9} {'QPS':>9}")
+        
+        # Baseline: the blocking path, one query at a time
+        serial = min(requests, 20)
+        latencies = []
+        start = time.perf_counter()
+        for i in range(serial):
+            query_start = time.perf_counter()
+            pipeline.query(f"serial question {i}")
+            latencies.append((time.perf_counter() - query_start) * 1000)
+        report("sync serial", np.array(latencies), time.perf_counter() - start)
+        
+        # Serve from a dedicated event loop thread, as main.py --serve does
+        loop = asyncio.new_event_loop()
+        server = RAGServer(pipeline, "127.0.0.1", 0, max_concurrency=256)
+        threading.Thread(target=loop.run_forever, daemon=True).start()
+        asyncio.run_coroutine_threadsafe(server.start(), loop).result()
+        
+        try:
+            for stream in (False, True):
+                for concurrency in (1, 8, 32, 128):
+                    total = max(requests, concurrency) if concurrency > 1 else min(requests, 20)
+                    latencies, first_chunks, seconds = asyncio.run(
+                        run_clients(server.port, concurrency, total, stream)
+                    )
+                    label = f"{'stream' if stream else 'http'} c={concurrency}"
+                    report(label, latencies, seconds, first_chunks)
+        finally:
+            asyncio.run_coroutine_threadsafe(server.stop(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            stub.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="RAG HTTP server load test")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of indexed chunks")
+    parser.add_argument("--requests", type=int, default=400, help="Queries per concurrency level")
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Simulated LLM latency (s)")
+    args = parser.parse_args()
+    run(args.chunks, args.requests, args.chat_latency)
+
+if __name__ == "__main__":
+    main()
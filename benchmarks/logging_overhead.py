@@ -0,0 +1,123 @@
+"""
+Per-query logging overhead benchmark
+
+Runs the synchronous RAGPipeline.query path in demo mode (simulated
+embeddings and responses, no network) over a small index, so that logging
+is a visible share of the work, and reports the mean time per query with
+logging disabled and at several logging configurations. Log output goes to
+os.devnull, or to a "slow sink" that blocks on every write like a busy
+terminal or network log shipper; the overhead column is the difference to
+the disabled run.
+
+Usage:
+    python -m benchmarks.logging_overhead [--queries N]
+"""
+
+import argparse
+import logging
+import os
+import tempfile
+import time
+from rag_demo.config import Config
+from rag_demo import logger as logger_module
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from rag_demo.rag_pipeline import RAGPipeline
+
+QUERIES = [
+    "What does the company do?",
+    "How do I reset my password?",
+    "What are the system requirements?",
+    "Is there an affiliate program?",
+]
+
+class SlowSink:
+    """Stream that blocks for a fixed time on every write"""
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+    
+    def write(self, text: str):
+        time.sleep(self.delay)
+    
+    def flush(self):
+        pass
+
+def build_pipeline() -> RAGPipeline:
+    """Pipeline in demo mode over the sample documents, without response caching"""
+    Config.INDEX_LLM_API_KEY = Config.CHAT_LLM_API_KEY = "demo_placeholder"
+    Config.RESPONSE_CACHE_ENABLED = False
+    Config.EMBEDDING_CACHE_ENABLED = False
+    Config.STREAM_RESPONSES = False
+    
+    pipeline = RAGPipeline()
+    db = VectorDatabase(tempfile.mkdtemp(prefix="logging_bench_"))
+    sample_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_docs")
+    texts = []
+    for name in sorted(os.listdir(sample_dir)):
+        with open(os.path.join(sample_dir, name), encoding="utf-8") as f:
+            texts.extend(paragraph for paragraph in f.read().split("\n\n") if paragraph.strip())
+    db.add_documents(texts, [{} for _ in texts])
+    pipeline.vector_db = db
+    return pipeline
+
+def time_queries(pipeline: RAGPipeline, num_queries: int, repeats: int = 5) -> float:
+    """Mean seconds per query of the fastest of several rounds"""
+    for query in QUERIES:
+        pipeline.query(query)
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for i in range(num_queries):
+            pipeline.query(QUERIES[i % len(QUERIES)])
+        best = min(best, (time.perf_counter() - start) / num_queries)
+    return best
+
+def run(num_queries: int, sink_delay: float):
+    devnull = open(os.devnull, "w")
+    slow_sink = SlowSink(sink_delay)
+    stream_handlers = [handler for handler in logger.handlers if isinstance(handler, logging.StreamHandler)]
+    pipeline = build_pipeline()
+    
+    # (label, logger level, DEBUG_MODE, sink, queue handler)
+    configurations = [
+        ("INFO", logging.INFO, False, devnull, False),
+        ("INFO, queued", logging.INFO, False, devnull, True),
+        ("INFO, slow sink", logging.INFO, False, slow_sink, False),
+        ("INFO, slow, queued", logging.INFO, False, slow_sink, True),
+        ("DEBUG, debug mode", logging.DEBUG, True, devnull, False),
+    ]
+    
+    logging.disable(logging.CRITICAL)
+    baseline = time_queries(pipeline, num_queries)
+    logging.disable(logging.NOTSET)
+    
+    print(f"\n{'logging':<20} {'us/query':>10} {'overhead us':>12}")
+    print(f"{'disabled':<20} {baseline * 1e6:>10.1f} {0.0:>12.1f}")
+    for label, level, debug_mode, sink, queued in configurations:
+        start_queue = getattr(logger_module, "start_queue_logging", None)
+        if queued and start_queue is None:
+            continue
+        logger.setLevel(level)
+        for handler in stream_handlers:
+            handler.setLevel(level)
+            handler.setStream(sink)
+        Config.DEBUG_MODE = debug_mode
+        if queued:
+            start_queue()
+        try:
+            per_query = time_queries(pipeline, num_queries)
+        finally:
+            if queued:
+                logger_module.stop_queue_logging()
+        print(f"{label:<20} {per_query * 1e6:>10.1f} {(per_query - baseline) * 1e6:>12.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-query logging overhead benchmark")
+    parser.add_argument("--queries", type=int, default=1000, help="Queries per timed round")
+    parser.add_argument("--sink-delay", type=float, default=0.0002, help="Seconds the slow sink blocks per write")
+    args = parser.parse_args()
+    run(args.queries, args.sink_delay)
+
+if __name__ == "__main__":
+    main()
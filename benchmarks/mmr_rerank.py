@@ -0,0 +1,80 @@
+"""
+MMR re-ranking benchmark
+
+Indexes synthetic passages that each appear as several near-duplicate
+vectors, as overlapping chunks of one text do, then re-ranks the vector
+search candidates of a query about one topic with rag_demo.retrieval.rerank_diverse for
+growing candidate pools. Reports re-ranking latency (reading the candidate
+embeddings back from the index included) and the number of distinct
+passages in the top k with plain ranking and with MMR.
+
+Usage:
+    python -m benchmarks.mmr_rerank [--passages N] [--copies C] [--dim D] [--k K] [--pools 20,100,1000,5000]
+"""
+
+import argparse
+import logging
+import shutil
+import tempfile
+import time
+import numpy as np
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase
+from rag_demo.retrieval import rerank_diverse
+from rag_demo.vector_index import normalize_rows
+
+# Passages per topic
+TOPIC_SIZE = 50
+
+def distinct_passages(results, copies: int) -> int:
+    return len({metadata["document_index"] // copies for metadata, _ in results})
+
+def run(passages: int, copies: int, dim: int, k: int, pools, num_queries: int):
+    logger.setLevel(logging.WARNING)
+    rng = np.random.default_rng(42)
+    print(f"Indexing {passages} passages x {copies} near-duplicate chunks of dimension {dim}")
+    # Passages of a topic are similar, copies of a passage nearly identical
+    def around(centres: np.ndarray, spread: float) -> np.ndarray:
+        noise = rng.standard_normal(centres.shape).astype(np.float32) / np.sqrt(dim)
+        return normalize_rows(centres + spread * noise)
+    
+    topics = normalize_rows(rng.standard_normal((max(1, passages // TOPIC_SIZE), dim)).astype(np.float32))
+    base = around(topics[rng.integers(0, len(topics), passages)], 0.7)
+    # Copies of a passage are consecutive ids, so passage = id // copies
+    chunks = around(np.repeat(base, copies, axis=0), 0.25)
+    queries = around(topics[rng.integers(0, len(topics), num_queries)], 0.7)
+    
+    db_path = tempfile.mkdtemp(prefix="mmr_bench_")
+    try:
+        db = VectorDatabase(db_path, "flat")
+        db.add_vectors(chunks, [{"text": ""} for _ in range(len(chunks))])
+        del chunks
+        
+        print(f"\n{'pool':>6} {'p50 ms':>8} {'p99 ms':>8} {'distinct plain':>15} {'distinct MMR':>13}")
+        for pool in pools:
+            latencies, plain, diverse = [], [], []
+            for query in queries:
+                results = db.search_by_vector(query, pool)
+                start = time.perf_counter()
+                reranked = rerank_diverse(results, db, k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                plain.append(distinct_passages(results[:k], copies))
+                diverse.append(distinct_passages(reranked, copies))
+            print(f"{pool:>6} {np.percentile(latencies, 50):>8.2f} {np.percentile(latencies, 99):>8.2f} "
+                  f"{np.mean(plain):>15.2f} {np.mean(diverse):>13.2f}")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="MMR re-ranking benchmark")
+    parser.add_argument("--passages", type=int, default=20000, help="Number of distinct passages")
+    parser.add_argument("--copies", type=int, default=5, help="Near-duplicate chunks per passage")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--k", type=int, default=3, help="Results kept after re-ranking")
+    parser.add_argument("--pools", default="20,100,1000,5000", help="Comma-separated candidate pool sizes")
+    parser.add_argument("--queries", type=int, default=100, help="Number of queries")
+    args = parser.parse_args()
+    run(args.passages, args.copies, args.dim, args.k, [int(pool) for pool in args.pools.split(",")], args.queries)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compressed vector storage benchmark
+
+Builds the exact flat backend and the fp16, sq8 and pq backends over the
+same synthetic vectors and reports bytes per vector, recall@k against the
+exact results and single-query latency, with and without float32 re-ranking.
+
+Usage:
+    python -m benchmarks.quantization_report [--size N] [--dim D] [--queries Q] [--k K]
+"""
+
+import argparse
+import numpy as np
+from rag_demo.vector_index import FlatIndex, Float16Index, ProductQuantizedIndex, ScalarInt8Index
+from benchmarks.ann_recall import recall_at_k, synthetic_vectors, time_queries
+
+def build(index_class, vectors: np.ndarray, rerank_factor: int):
+    """Fill a compressed index and make sure its codec is trained"""
+    index = index_class(rerank_factor=rerank_factor)
+    index.add(vectors)
+    if not index.is_trained:
+        index.train()
+    return index
+
+def run(size: int, dim: int, num_queries: int, k: int, rerank_factor: int):
+    rng = np.random.default_rng(42)
+    print(f"Generating {size} vectors of dimension {dim}")
+    data = synthetic_vectors(size + num_queries, dim, max(16, size // 1000), rng)
+    vectors, queries = data[:size], data[size:]
+    
+    flat = FlatIndex()
+    flat.add(vectors)
+    truth, flat_latency = time_queries(flat, queries, k)
+    
+    print(f"\n{'backend':<16} {'bytes/vec':>10} {'memory MB':>10} {'recall@' + str(k):>10} "
+          f"{'p50 ms':>8} {'p99 ms':>8}")
+    
+    def report(label: str, bytes_per_vector: float, recall: float, latency: np.ndarray):
+        print(f"{label:<16} {bytes_per_vector:>10.0f} {bytes_per_vector * size / 2**20:>10.1f} {recall:>10.3f} "
+              f"{np.percentile(latency, 50):>8.2f} {np.percentile(latency, 99):>8.2f}")
+    
+    report("flat float32", dim * 4, 1.0, flat_latency)
+    for index_class in (Float16Index, ScalarInt8Index, ProductQuantizedIndex):
+        for factor in (0, rerank_factor):
+            # Memory is the compressed codes; re-ranking reads float32 rows from the memory-mapped file
+            index = build(index_class, vectors, factor)
+            found, latency = time_queries(index, queries, k)
+            label = index.name + (f" rerank x{factor}" if factor else "")
+            report(label, index.code_bytes / size, recall_at_k(found, truth), latency)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compressed index memory/recall/latency benchmark")
+    parser.add_argument("--size", type=int, default=200000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=100, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--rerank", type=int, default=4, help="Re-rank factor of the re-ranked runs")
+    args = parser.parse_args()
+    run(args.size, args.dim, args.queries, args.k, args.rerank)
+
+if __name__ == "__main__":
+    main()
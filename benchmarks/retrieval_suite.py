@@ -0,0 +1,389 @@
+"""
+Retrieval benchmark suite over synthetic corpora
+
+For each corpus size, writes a deterministic synthetic corpus of about that
+many chunks (Zipf-distributed pseudo-words, one paragraph per chunk), indexes
+it fully offline with the demo-mode embeddings (no API key or network) and
+measures:
+
+- indexing throughput: chunking alone, then chunking, embedding and insertion
+  through VectorDatabase.add_stream, plus save and load times
+- search latency percentiles of retrieve_documents in vector, lexical and
+  hybrid mode, with query embeddings computed beforehand
+- memory footprint: resident memory growth while indexing and while loading
+  and searching the saved index, and the size of the saved index
+- recall@k of the vector backend against exact search, and the hit rate of
+  known-item queries (a sentence copied from a random chunk) in every mode
+
+Results are written as JSON together with the settings and environment, so
+runs can be compared; pass an earlier results file to --compare to print the
+relative change of every metric.
+
+Usage:
+    python -m benchmarks.retrieval_suite [--sizes 1000,10000,100000] [--index-type flat]
+        [--queries Q] [--k K] [--output FILE] [--compare PREVIOUS_FILE]
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Iterator, List
+import numpy as np
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.document_preparation import CHARS_PER_TOKEN, iter_chunks, iter_document_paths
+from rag_demo.embedding import get_embedding_engine
+from rag_demo.indexing import VectorDatabase, load_index
+from rag_demo.retrieval import retrieve_documents
+from rag_demo.vector_index import FlatIndex, normalize_rows
+from benchmarks.ann_recall import recall_at_k
+
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+# Synthetic language: pseudo-words of 1-3 syllables with Zipfian frequencies
+SYLLABLES = [consonant + vowel for consonant in "bcdfghklmnprstvz" for vowel in "aeiou"]
+VOCABULARY_SIZE = 20000
+ZIPF_EXPONENT = 1.05
+
+# Paragraphs (about one chunk each) written per document file
+PARAGRAPHS_PER_DOCUMENT = 50
+
+# Paragraph length as a fraction of the chunk budget, so that a chunk ends at
+# every paragraph break and the corpus size in chunks is predictable
+PARAGRAPH_FILL = 0.55
+
+def synthetic_vocabulary(rng: np.random.Generator) -> np.ndarray:
+    """Distinct pseudo-words, most frequent first"""
+    words = {}
+    while len(words) < VOCABULARY_SIZE:
+        syllables = rng.integers(0, len(SYLLABLES), size=rng.integers(1, 4))
+        words.setdefault("".join(SYLLABLES[i] for i in syllables), None)
+    return np.array(list(words), dtype=object)
+
+def iter_sentences(rng: np.random.Generator, vocabulary: np.ndarray, block: int = 4096) -> Iterator[str]:
+    """Endless stream of sentences of 6-16 words, drawn in vectorized blocks"""
+    cdf = np.cumsum(1.0 / np.arange(1, len(vocabulary) + 1) ** ZIPF_EXPONENT)
+    cdf /= cdf[-1]
+    while True:
+        lengths = rng.integers(6, 17, size=block)
+        words = vocabulary[np.searchsorted(cdf, rng.random(int(lengths.sum())))].tolist()
+        position = 0
+        for length in lengths:
+            yield " ".join(words[position:position + length]).capitalize() + "."
+            position += length
+
+def write_corpus(directory: str, target_chunks: int, chunk_tokens: int, seed: int) -> int:
+    """
+    Write synthetic documents of about target_chunks chunks
+    
+    Args:
+        directory: Output directory
+        target_chunks: Number of paragraphs to write
+        chunk_tokens: Chunk budget the paragraphs are sized for
+        seed: Random seed; the same seed always produces the same corpus
+    
+    Returns:
+        Total size of the written files in bytes
+    """
+    rng = np.random.default_rng(seed)
+    sentences = iter_sentences(rng, synthetic_vocabulary(rng))
+    paragraph_chars = int(chunk_tokens * CHARS_PER_TOKEN * PARAGRAPH_FILL)
+    
+    total_bytes = 0
+    for number, start in enumerate(range(0, target_chunks, PARAGRAPHS_PER_DOCUMENT)):
+        paragraphs = []
+        for _ in range(min(PARAGRAPHS_PER_DOCUMENT, target_chunks - start)):
+            paragraph = []
+            length = 0
+            while length < paragraph_chars:
+                sentence = next(sentences)
+                paragraph.append(sentence)
+                length += len(sentence) + 1
+            paragraphs.append(" ".join(paragraph))
+        data = ("\n\n".join(paragraphs) + "\n").encode("utf-8")
+        with open(os.path.join(directory, f"doc_{number:06d}.txt"), "wb") as f:
+            f.write(data)
+        total_bytes += len(data)
+    return total_bytes
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of the process so far"""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def rss_bytes() -> int:
+    """Current resident set size (the peak on platforms without /proc)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return peak_rss_bytes()
+
+def directory_bytes(path: str) -> int:
+    """Total size of the files in a directory"""
+    return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+
+def latency_summary(latencies: np.ndarray) -> dict:
+    """Mean and percentiles of per-query latencies in milliseconds"""
+    return {
+        "mean": float(latencies.mean()),
+        "p50": float(np.percentile(latencies, 50)),
+        "p95": float(np.percentile(latencies, 95)),
+        "p99": float(np.percentile(latencies, 99)),
+        "qps": float(1000.0 / latencies.mean())
+    }
+
+def known_item_queries(db: VectorDatabase, num_queries: int, seed: int) -> List[str]:
+    """One sentence from each of num_queries random chunks"""
+    rng = np.random.default_rng(seed)
+    queries = []
+    for doc_id in rng.integers(0, len(db), size=num_queries):
+        sentences = [s for s in db.chunk_text(db.metadata[int(doc_id)]).split(". ") if s]
+        sentence = sentences[rng.integers(0, len(sentences))]
+        queries.append(sentence if sentence.endswith(".") else sentence + ".")
+    return queries
+
+def exact_index(corpus_dir: str, batch_size: int) -> FlatIndex:
+    """Exact index over the corpus, embedding every chunk again"""
+    exact = FlatIndex()
+    engine = get_embedding_engine()
+    chunks = iter_chunks(iter_document_paths(corpus_dir))
+    while True:
+        batch = [text for text, _ in itertools.islice(chunks, batch_size)]
+        if not batch:
+            return exact
+        exact.add(normalize_rows(engine.embed(batch)))
+
+def benchmark_size(size: int, index_type: str, chunk_tokens: int, num_queries: int, k: int,
+                   seed: int, work_dir: str) -> dict:
+    """Build, save, load and query the index of one corpus size"""
+    corpus_dir = os.path.join(work_dir, f"corpus_{size}")
+    db_path = os.path.join(work_dir, f"index_{size}")
+    os.makedirs(corpus_dir)
+    
+    start = time.perf_counter()
+    corpus_bytes = write_corpus(corpus_dir, size, chunk_tokens, seed)
+    print(f"\n[{size}] wrote {corpus_bytes / 1e6:.1f} MB of text in {time.perf_counter() - start:.1f}s")
+    
+    # Chunking alone, which also warms the page cache for the indexing pass
+    start = time.perf_counter()
+    chunk_count = sum(1 for _ in iter_chunks(iter_document_paths(corpus_dir)))
+    chunk_seconds = time.perf_counter() - start
+    
+    gc.collect()
+    rss_before = rss_bytes()
+    db = VectorDatabase(db_path, index_type)
+    start = time.perf_counter()
+    db.add_stream(iter_chunks(iter_document_paths(corpus_dir)))
+    index_seconds = time.perf_counter() - start
+    
+    # Backends that train on save or once large enough are trained here, so training is timed on its own
+    train_seconds = 0.0
+    if getattr(db.index, "is_trained", True) is False:
+        start = time.perf_counter()
+        db.index.train()
+        train_seconds = time.perf_counter() - start
+    indexing_rss = rss_bytes() - rss_before
+    
+    start = time.perf_counter()
+    db.save()
+    save_seconds = time.perf_counter() - start
+    del db
+    gc.collect()
+    
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    db = load_index(db_path)
+    load_seconds = time.perf_counter() - start
+    print(f"[{size}] indexed {len(db)} chunks in {index_seconds:.1f}s "
+          f"({len(db) / index_seconds:.0f} chunks/s), saved in {save_seconds:.1f}s")
+    
+    queries = known_item_queries(db, num_queries, seed + 1)
+    query_vectors = normalize_rows(get_embedding_engine().embed(queries))
+    
+    latency, hit_rate = {}, {}
+    for mode in RETRIEVAL_MODES:
+        # Warm-up, e.g. for IVF list construction and page faults
+        for query, vector in zip(queries[:10], query_vectors):
+            retrieve_documents(query, db, k, query_embedding=vector, mode=mode)
+        latencies = np.empty(len(queries))
+        hits = 0
+        for i, (query, vector) in enumerate(zip(queries, query_vectors)):
+            start = time.perf_counter()
+            results = retrieve_documents(query, db, k, query_embedding=vector, mode=mode)
+            latencies[i] = (time.perf_counter() - start) * 1000
+            hits += any(query in meta["text"] for meta, _ in results)
+        latency[mode] = latency_summary(latencies)
+        hit_rate[mode] = hits / len(queries)
+    search_rss = rss_bytes() - rss_before
+    
+    _, found = db.index.search(query_vectors, k)
+    if db.index.name == "flat":
+        recall = 1.0
+    else:
+        _, truth = exact_index(corpus_dir, Config.INDEX_BATCH_SIZE).search(query_vectors, k)
+        recall = recall_at_k(found, truth)
+    disk_bytes = directory_bytes(db_path)
+    
+    return {
+        "size": size,
+        "chunks": len(db),
+        "files": len(os.listdir(corpus_dir)),
+        "corpus_bytes": corpus_bytes,
+        "indexing": {
+            "chunk_seconds": chunk_seconds,
+            "chunking_chunks_per_second": chunk_count / chunk_seconds,
+            "index_seconds": index_seconds,
+            "chunks_per_second": len(db) / index_seconds,
+            "train_seconds": train_seconds,
+            "save_seconds": save_seconds,
+            "load_seconds": load_seconds
+        },
+        "memory": {
+            "indexing_rss_bytes": indexing_rss,
+            "search_rss_bytes": search_rss,
+            "peak_rss_bytes": peak_rss_bytes(),
+            "disk_bytes": disk_bytes,
+            "disk_bytes_per_chunk": disk_bytes / max(len(db), 1)
+        },
+        "latency_ms": latency,
+        "recall": {
+            "recall_at_k": recall,
+            "hit_rate_at_k": hit_rate
+        }
+    }
+
+def environment() -> dict:
+    """Interpreter, library, machine and code version the results were measured with"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "commit": commit
+    }
+
+def flatten(record: dict, prefix: str = "") -> dict:
+    """Numeric leaves of a nested result as {"a.b.c": value}"""
+    values = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            values.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[prefix + key] = value
+    return values
+
+def print_comparison(previous: dict, current: dict):
+    """Print every metric of the sizes measured in both runs with its relative change"""
+    earlier = {result["size"]: flatten(result) for result in previous["results"]}
+    for result in current["results"]:
+        before = earlier.get(result["size"])
+        if before is None:
+            continue
+        print(f"\nsize {result['size']}: {'metric':<40} {'previous':>12} {'current':>12} {'change':>8}")
+        for name, value in flatten(result).items():
+            old = before.get(name)
+            if old is None or name == "size":
+                continue
+            change = f"{(value - old) / old * 100:+.1f}%" if old else "n/a"
+            print(f"{'':<{len(str(result['size'])) + 6}} {name:<40} {old:>12.4g} {value:>12.4g} {change:>8}")
+
+def print_summary(results: List[dict], k: int):
+    print(f"\n{'chunks':>9} {'index/s':>9} {'disk MB':>8} {'recall@' + str(k):>9}  "
+          + "  ".join(f"{mode + ' p50/p99 ms':>21} {'hit':>5}" for mode in RETRIEVAL_MODES))
+    for result in results:
+        row = (f"{result['chunks']:>9} {result['indexing']['chunks_per_second']:>9.0f} "
+               f"{result['memory']['disk_bytes'] / 1e6:>8.1f} {result['recall']['recall_at_k']:>9.3f}  ")
+        row += "  ".join(
+            f"{result['latency_ms'][mode]['p50']:>10.2f}/{result['latency_ms'][mode]['p99']:<10.2f} "
+            f"{result['recall']['hit_rate_at_k'][mode]:>5.2f}"
+            for mode in RETRIEVAL_MODES
+        )
+        print(row)
+
+def run(sizes: List[int], index_type: str, chunk_tokens: int, overlap_tokens: int, num_queries: int,
+        k: int, seed: int, output: str, compare: str = None, keep: bool = False):
+    # Demo mode: deterministic simulated embeddings, no network
+    Config.INDEX_LLM_API_KEY = Config.CHAT_LLM_API_KEY = "demo_placeholder"
+    Config.EMBEDDING_CACHE_ENABLED = False
+    Config.RESPONSE_CACHE_ENABLED = False
+    Config.CHUNK_TOKENS, Config.CHUNK_OVERLAP_TOKENS = chunk_tokens, overlap_tokens
+    # Chunking workers read their settings from the environment
+    os.environ["CHUNK_TOKENS"], os.environ["CHUNK_OVERLAP_TOKENS"] = str(chunk_tokens), str(overlap_tokens)
+    logger.setLevel(logging.WARNING)
+    
+    work_dir = tempfile.mkdtemp(prefix="retrieval_suite_")
+    results = []
+    try:
+        for size in sizes:
+            results.append(benchmark_size(size, index_type, chunk_tokens, num_queries, k, seed, work_dir))
+    finally:
+        if keep:
+            print(f"\nCorpora and indexes kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    
+    report = {
+        "benchmark": "retrieval_suite",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "settings": {
+            "index_type": index_type or Config.VECTOR_DB_TYPE,
+            "chunk_tokens": chunk_tokens,
+            "overlap_tokens": overlap_tokens,
+            "queries": num_queries,
+            "k": k,
+            "seed": seed,
+            "rrf_candidates": Config.RRF_CANDIDATES
+        },
+        "environment": environment(),
+        "results": results
+    }
+    print_summary(results, k)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nResults written to {output}")
+    
+    if compare:
+        with open(compare, "r", encoding="utf-8") as f:
+            print_comparison(json.load(f), report)
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval benchmark suite over synthetic corpora")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="Comma-separated corpus sizes in chunks, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--index-type", default=None, help="Vector index backend (default: VECTOR_DB_TYPE)")
+    parser.add_argument("--chunk-tokens", type=int, default=128, help="Chunk budget in estimated tokens")
+    parser.add_argument("--overlap-tokens", type=int, default=16, help="Estimated tokens repeated between chunks")
+    parser.add_argument("--queries", type=int, default=200, help="Timed queries per size and mode")
+    parser.add_argument("--k", type=int, default=10, help="Results per query")
+    parser.add_argument("--seed", type=int, default=42, help="Corpus and query seed")
+    parser.add_argument("--output", default="retrieval_benchmark.json", help="JSON results file")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated corpora and indexes")
+    args = parser.parse_args()
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    run(sizes, args.index_type, args.chunk_tokens, args.overlap_tokens, args.queries, args.k,
+        args.seed, args.output, args.compare, args.keep)
+
+if __name__ == "__main__":
+    main()
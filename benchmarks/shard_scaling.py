@@ -0,0 +1,78 @@
+"""
+Sharded search scaling benchmark
+
+Saves a flat index of synthetic normalized vectors, then measures
+single-query latency of VectorDatabase.search_by_vector in process and with
+the saved index split across an increasing number of shard processes. On a
+large index, latency should fall with the number of shards up to the number
+of cores (or memory bandwidth).
+
+Usage:
+    python -m benchmarks.shard_scaling [--size N] [--dim D] [--queries Q] [--shards 1,2,4,8]
+"""
+
+import argparse
+import logging
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from rag_demo.config import Config
+from rag_demo.logger import logger
+from rag_demo.indexing import VectorDatabase, load_index
+from benchmarks.ann_recall import synthetic_vectors
+
+def time_search(db: VectorDatabase, queries: np.ndarray, k: int) -> np.ndarray:
+    """Per-query latencies in ms, after a warm-up pass"""
+    for query in queries[:10]:
+        db.search_by_vector(query, k)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        db.search_by_vector(query, k)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return np.array(latencies)
+
+def run(size: int, dim: int, num_queries: int, k: int, shard_counts):
+    logger.setLevel(logging.WARNING)
+    rng = np.random.default_rng(42)
+    print(f"Generating {size} vectors of dimension {dim} on {os.cpu_count()} CPUs")
+    data = synthetic_vectors(size + num_queries, dim, max(16, size // 1000), rng)
+    vectors, queries = data[:size], data[size:]
+    
+    db_path = tempfile.mkdtemp(prefix="shard_bench_")
+    try:
+        db = VectorDatabase(db_path, "flat")
+        db.add_vectors(vectors, [{"text": ""} for _ in range(size)])
+        db.save()
+        del db, vectors, data
+        
+        Config.SHARD_MIN_VECTORS = 0
+        print(f"\n{'shards':<10} {'p50 ms':>8} {'p99 ms':>8}")
+        for shards in shard_counts:
+            Config.SEARCH_SHARDS = shards
+            db = load_index(db_path)
+            latency = time_search(db, queries, k)
+            db.close()
+            label = "in process" if shards <= 1 else str(shards)
+            print(f"{label:<10} {np.percentile(latency, 50):>8.2f} {np.percentile(latency, 99):>8.2f}")
+    finally:
+        shutil.rmtree(db_path, ignore_errors=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded search scaling benchmark")
+    parser.add_argument("--size", type=int, default=1000000, help="Number of indexed vectors")
+    parser.add_argument("--dim", type=int, default=384, help="Vector dimension")
+    parser.add_argument("--queries", type=int, default=200, help="Number of timed queries")
+    parser.add_argument("--k", type=int, default=10, help="Neighbours per query")
+    parser.add_argument("--shards", default=None, help="Comma-separated shard counts (default: 1, 2, 4, ... up to the CPU count)")
+    args = parser.parse_args()
+    if args.shards:
+        shard_counts = [int(count) for count in args.shards.split(",")]
+    else:
+        shard_counts = [1] + [2 ** i for i in range(1, 8) if 2 ** i <= (os.cpu_count() or 1)]
+    run(args.size, args.dim, args.queries, args.k, shard_counts)
+
+if __name__ == "__main__":
+    main()
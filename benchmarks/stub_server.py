@@ -0,0 +1,180 @@
+"""
+Local OpenAI-compatible stub server for offline benchmarks
+
+Serves POST /v1/embeddings with deterministic vectors and POST
+/v1/chat/completions with a canned answer (optionally streamed), each after
+a configurable simulated latency, and can reject a fraction of requests with HTTP 429 to
+exercise client retry logic.
+"""
+
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+
+# Answer returned by the stub chat completions endpoint
+STUB_ANSWER = "This is a stub answer based on the provided context, streamed one word at a time"
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Request handler implementing the subset of the OpenAI API used by rag_demo"""
+    
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+    
+    def _send_json(self, status: int, payload: dict, headers: dict = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+    
+    def do_POST(self):
+        request = self._read_json()
+        server = self.server
+        server.count_request()
+        
+        if server.rate_limit_fraction and random.random() < server.rate_limit_fraction:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded", "type": "rate_limit"}},
+                            {"Retry-After": "0.01"})
+            return
+        
+        if self.path.endswith("/embeddings"):
+            self._handle_embeddings(request)
+        elif self.path.endswith("/chat/completions"):
+            self._handle_chat(request)
+        else:
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+    
+    def _handle_embeddings(self, request: dict):
+        inputs = request.get("input", [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        
+        server = self.server
+        time.sleep(server.latency + server.per_item_latency * len(inputs))
+        
+        data = []
+        for i, text in enumerate(inputs):
+            rng = np.random.default_rng(zlib.crc32(text.encode("utf-8")))
+            data.append({"object": "embedding", "index": i,
+                         "embedding": rng.random(server.dim).round(6).tolist()})
+        self._send_json(200, {
+            "object": "list",
+            "data": data,
+            "model": request.get("model", "stub"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+    
+    def _handle_chat(self, request: dict):
+        server = self.server
+        words = [word + " " for word in STUB_ANSWER.split()]
+        # Prefill latency before the first token, then a fixed delay per token
+        time.sleep(server.chat_latency)
+        if request.get("stream"):
+            self._stream_chat(request, words)
+            return
+        time.sleep(server.token_latency * len(words))
+        self._send_json(200, {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": STUB_ANSWER},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        })
+
+    def _stream_chat(self, request: dict, words: list):
+        """Send the answer as server-sent chat completion chunks over chunked encoding"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        
+        def send_chunk(data: str):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+        
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.server.token_latency)
+            send_chunk(json.dumps({
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "delta": {"content": word}, "finish_reason": None}]
+            }))
+        send_chunk("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+class StubServer(ThreadingHTTPServer):
+    """Threaded stub server that runs in a background thread"""
+    
+    daemon_threads = True
+    # Listen backlog large enough for load tests opening many connections at once
+    request_queue_size = 256
+    
+    def __init__(self, port: int = 0, latency: float = 0.02, per_item_latency: float = 0.0002,
+                 dim: int = 384, rate_limit_fraction: float = 0.0, chat_latency: float = 0.2,
+                 token_latency: float = 0.01):
+        """
+        Initialize stub server
+        
+        Args:
+            port: Port to bind on localhost (0 picks a free port)
+            latency: Simulated fixed latency per request in seconds
+            per_item_latency: Simulated extra latency per input in seconds
+            dim: Dimension of returned embeddings
+            rate_limit_fraction: Fraction of requests answered with HTTP 429
+            chat_latency: Simulated latency before the first chat token in seconds
+            token_latency: Simulated delay between chat tokens in seconds
+        """
+        super().__init__(("127.0.0.1", port), StubHandler)
+        self.latency = latency
+        self.per_item_latency = per_item_latency
+        self.dim = dim
+        self.rate_limit_fraction = rate_limit_fraction
+        self.chat_latency = chat_latency
+        self.token_latency = token_latency
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+    
+    @property
+    def base_url(self) -> str:
+        """OpenAI-compatible base URL of this server"""
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+    
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+    
+    def start(self) -> "StubServer":
+        """Start serving in a daemon thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        """Stop serving and close the socket"""
+        self.shutdown()
+        self.server_close()
@@ -7,7 +7,8 @@ It allows users to index documents and then query them using a language model
 augmented with retrieved context.
 
 Usage:
-    python main.py [--docs PATH] [--interactive]
+    python main.py [--docs PATH] [--interactive] [--filter FIELD=VALUE ...] [--serve [--host HOST] [--port PORT]]
+                   [--batch QUERIES.jsonl [--output RESULTS.jsonl] [--retrieve-only]] [--profile-startup]
     
 Examples:
     # Run interactive chat without indexing documents
@@ -18,8 +19,24 @@ Examples:
     
     # Index documents from a single file
     python main.py --docs ./knowledge.txt
+    
+    # Chat using only documents in the "manuals" subdirectory
+    python main.py --filter collection=manuals
+    
+    # Serve concurrent queries over HTTP against the saved index
+    python main.py --serve --port 8000
+    
+    # Answer a file of queries (one JSON object per line), resuming if interrupted
+    python main.py --batch questions.jsonl --output answers.jsonl
+    
+    # Show where startup time goes before the chat prompt appears
+    python main.py --profile-startup
 """
 
+import time
+
+STARTED = time.perf_counter()
+
 import argparse
 import os
 import sys
@@ -28,8 +45,34 @@ from pathlib import Path
 # Add parent directory to path to import rag_demo modules
 # sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from rag_demo.rag_pipeline import run_rag_demo
-from rag_demo.logger import logger
+# rag_demo modules are imported once the arguments are parsed, so that only
+# the ones the chosen mode needs are loaded and --profile-startup can time them
+
+def profile_startup(profiler, doc_path: str = None):
+    """
+    Start the interactive pipeline as run_rag_demo does, up to the first prompt, and print where the time went
+    
+    Args:
+        profiler: StartupProfiler installed before the rag_demo imports
+        doc_path: Path to document file or directory to index first (optional)
+    """
+    from rag_demo.config import Config
+    from rag_demo.rag_pipeline import create_pipeline
+    profiler.mark("import rag_demo.rag_pipeline")
+    
+    pipeline = create_pipeline(doc_path, background=Config.BACKGROUND_INDEX_LOAD)
+    profiler.mark("create pipeline: first prompt" + (" (after indexing)" if doc_path else ""))
+    
+    pipeline.wait_for_index()
+    profiler.mark("index loaded" if pipeline.vector_db is not None else "no saved index")
+    profiler.uninstall()
+    
+    # Deferred until the first API call, and not part of the import breakdown
+    import openai
+    profiler.mark("import openai (at first API call)")
+    
+    print(f"Startup profile (milliseconds since main.py started; background index load: {Config.BACKGROUND_INDEX_LOAD})")
+    print(profiler.report())
 
 def main():
     """Main entry point for the RAG demo application"""
@@ -44,8 +87,64 @@ def main():
         action="store_true", 
         help="Run in interactive mode (default behavior)"
     )
+    parser.add_argument(
+        "--filter", 
+        action="append", 
+        default=[], 
+        metavar="FIELD=VALUE", 
+        help="Only retrieve chunks whose metadata field has this value in interactive chat, and in "
+             "--batch for lines without \"filters\" (repeat for several fields; the same field twice "
+             "accepts either value)"
+    )
+    parser.add_argument(
+        "--serve", 
+        action="store_true", 
+        help="Serve queries over HTTP (POST /query) instead of interactive chat"
+    )
+    parser.add_argument(
+        "--batch", 
+        type=str, 
+        metavar="QUERIES.jsonl", 
+        help="Answer the queries of a JSONL file instead of interactive chat"
+    )
+    parser.add_argument(
+        "--output", 
+        type=str, 
+        help="Results file of --batch, also used to resume it (default: QUERIES.results.jsonl)"
+    )
+    parser.add_argument(
+        "--retrieve-only", 
+        action="store_true", 
+        help="In --batch mode, only retrieve sources without generating responses"
+    )
+    parser.add_argument(
+        "--host", 
+        type=str, 
+        help="Interface to bind in --serve mode (default: SERVER_HOST)"
+    )
+    parser.add_argument(
+        "--port", 
+        type=int, 
+        help="Port to bind in --serve mode (default: SERVER_PORT)"
+    )
+    parser.add_argument(
+        "--profile-startup", 
+        action="store_true", 
+        help="Print an import-time and startup breakdown up to the first chat prompt, then exit"
+    )
     
     args = parser.parse_args()
+    if args.filter and args.serve:
+        parser.error("--filter does not apply to --serve; send filters with each request")
+    
+    profiler = None
+    if args.profile_startup:
+        from rag_demo.startup import StartupProfiler
+        profiler = StartupProfiler(STARTED)
+        profiler.install()
+        profiler.mark("parse arguments")
+    
+    from rag_demo.logger import logger
     
     logger.info("Starting RAG Demo Application")
     
@@ -59,9 +158,30 @@ def main():
             sys.exit(1)
         logger.info(f"Using document path: {doc_path}")
     
+    # Collect metadata filters; values of a repeated field are alternatives
+    filters = {}
+    for expression in args.filter:
+        field, separator, value = expression.partition("=")
+        if not separator or not field:
+            print(f"Error: Expected --filter FIELD=VALUE, got {expression!r}")
+            sys.exit(1)
+        filters.setdefault(field, []).append(value)
+    
     # Run the RAG demo
     try:
-        run_rag_demo(doc_path)
+        if profiler is not None:
+            profile_startup(profiler, doc_path)
+        elif args.batch:
+            from rag_demo.batch import run_batch
+            stats = run_batch(args.batch, args.output, doc_path, args.retrieve_only, filters or None)
+            print(f"Answered {stats['answered']} queries ({stats['failed']} failed, {stats['skipped']} already done) "
+                  f"in {stats['seconds']:.2f}s: {stats['queries_per_second']:.1f} queries/s")
+        elif args.serve:
+            from rag_demo.server import run_rag_server
+            run_rag_server(doc_path, args.host, args.port)
+        else:
+            from rag_demo.rag_pipeline import run_rag_demo
+            run_rag_demo(doc_path, filters or None)
     except Exception as e:
         logger.error(f"Application error: {str(e)}")
         print(f"Error: {str(e)}")
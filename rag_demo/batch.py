@@ -0,0 +1,247 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from typing import Iterator, List, Set, Tuple
+from .logger import logger, debug_log
+from .config import Config
+from .generation import ERROR_RESPONSE, agenerate_response, post_process_response
+from .metadata_index import normalize_filters
+from .metrics import metrics
+from .query_processing import process_query
+from .rag_pipeline import RAGPipeline, create_pipeline
+from .retrieval import format_retrieved_context, retrieve_documents_many
+
+# Chunk metadata copied into the "sources" of each output record
+SOURCE_FIELDS = ("document_index", "source", "filename", "collection", "byte_start", "byte_end")
+
+def read_completed(output_path: str) -> Set:
+    """
+    Ids already answered in an output file, which doubles as the checkpoint
+    
+    A record cut short by a crash is removed by truncating the file after the
+    last complete line, so a resumed run appends from a clean point. Records
+    with an "error" are not counted as answered and are retried.
+    
+    Args:
+        output_path: JSONL results file of an earlier (possibly interrupted) run
+    
+    Returns:
+        Set of query ids with a successful record
+    """
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    
+    valid_bytes = 0
+    with open(output_path, 'rb') as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            valid_bytes += len(line)
+            if "error" not in record:
+                completed.add(record["id"])
+    
+    if valid_bytes < os.path.getsize(output_path):
+        logger.warning(f"Discarding an incomplete record at the end of {output_path}")
+        with open(output_path, 'r+b') as f:
+            f.truncate(valid_bytes)
+    return completed
+
+def iter_queries(input_path: str, completed: Set = frozenset(), filters: dict = None) -> Iterator[Tuple[object, str, dict]]:
+    """
+    Stream the queries of a JSONL file, skipping those already answered
+    
+    Each line is an object {"query": "...", "id": ..., "filters": {...}} with
+    optional id (default: the line number) and filters, or a JSON string.
+    
+    Args:
+        input_path: JSONL file of queries
+        completed: Ids to skip
+        filters: Filter expression of lines without "filters" (optional)
+    
+    Returns:
+        Iterator of (id, query, filters or None) tuples
+    """
+    default_filters = filters
+    with open(input_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                item = json.loads(line)
+                if isinstance(item, str):
+                    item = {"query": item}
+                query = item["query"]
+                if not isinstance(query, str) or not query.strip():
+                    raise ValueError("'query' must be a non-empty string")
+                query_id = item.get("id", line_number)
+                hash(query_id)
+                filters = normalize_filters(item["filters"]) if item.get("filters") else default_filters
+            except (ValueError, KeyError, TypeError) as e:
+                logger.warning(f"Skipping line {line_number} of {input_path}: {str(e) or type(e).__name__}")
+                continue
+            if query_id not in completed:
+                yield query_id, query, filters
+
+def _retrieve_block(pipeline: RAGPipeline, block: List[Tuple[object, str, dict]]) -> Tuple[List[str], list]:
+    """
+    Process and retrieve a block of queries, searching queries with the same filters together
+    
+    Returns:
+        Tuple of (processed queries, retrieved documents of each query)
+    """
+    processed = [process_query(query) for _, query, _ in block]
+    retrieved = [None] * len(block)
+    groups = {}
+    for position, (_, _, filters) in enumerate(block):
+        groups.setdefault(json.dumps(filters, sort_keys=True), []).append(position)
+    with metrics.timer("retrieve"):
+        for positions in groups.values():
+            results = retrieve_documents_many(
+                [processed[position] for position in positions], pipeline.vector_db, filters=block[positions[0]][2]
+            )
+            for position, docs in zip(positions, results):
+                retrieved[position] = docs
+    return processed, retrieved
+
+async def _answer(query_id, query: str, processed_query: str, filters: dict, docs: list, retrieve_only: bool) -> dict:
+    """Output record of one query: its sources and, unless retrieve_only, the generated response"""
+    record = {"id": query_id, "query": query}
+    if filters:
+        record["filters"] = filters
+    record["sources"] = [
+        {**{field: meta[field] for field in SOURCE_FIELDS if field in meta}, "score": round(float(score), 6)}
+        for meta, score in docs
+    ]
+    if retrieve_only:
+        return record
+    
+    context = format_retrieved_context(docs)
+    start = time.perf_counter()
+    with metrics.timer("generate"):
+        response = await agenerate_response(processed_query, context)
+    record["response"] = post_process_response(response)
+    record["latency_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    if response == ERROR_RESPONSE:
+        record["error"] = "generation failed"
+    return record
+
+async def answer_batch(pipeline: RAGPipeline, input_path: str, output_path: str, concurrency: int = None,
+                       block_size: int = None, retrieve_only: bool = False, filters: dict = None) -> dict:
+    """
+    Answer every query of a JSONL file, appending one JSON record per query to the output
+    
+    Queries are read in blocks. Each block is embedded in batched requests
+    and searched with one matrix-matrix product in a worker thread, while the
+    responses to the previous block are generated, at most `concurrency` at a
+    time. Records are written as they complete, so they are not in input
+    order. Queries already answered in the output file are skipped, so an
+    interrupted run resumes where it stopped.
+    
+    Args:
+        pipeline: Pipeline with a loaded index
+        input_path: JSONL file of queries, see iter_queries
+        output_path: JSONL file receiving the results (appended to)
+        concurrency: Responses generated at once (uses config default if None)
+        block_size: Queries retrieved together (uses config default if None)
+        retrieve_only: Only retrieve sources, without generating responses
+        filters: Filter expression of queries without their own filters (optional)
+    
+    Returns:
+        Dictionary with the numbers of answered, failed and skipped queries,
+        the elapsed seconds and the throughput in queries per second
+    """
+    concurrency = concurrency or Config.BATCH_CONCURRENCY
+    block_size = block_size or Config.BATCH_QUERY_SIZE
+    
+    completed = read_completed(output_path)
+    if completed:
+        logger.info(f"Resuming batch: {len(completed)} queries already answered in {output_path}")
+    queries = iter_queries(input_path, completed, filters)
+    blocks = iter(lambda: list(itertools.islice(queries, block_size)), [])
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    tasks = set()
+    stats = {"answered": 0, "failed": 0, "skipped": len(completed)}
+    start = time.perf_counter()
+    
+    with open(output_path, 'a', encoding='utf-8') as output:
+        def write(record: dict):
+            output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output.flush()
+            stats["failed" if "error" in record else "answered"] += 1
+            done = stats["answered"] + stats["failed"]
+            if done % 1000 == 0:
+                logger.info(f"Batch progress: {done} queries ({done / (time.perf_counter() - start):.1f} queries/s)")
+        
+        async def answer_and_write(query_id, query, processed_query, filters, docs):
+            try:
+                record = await _answer(query_id, query, processed_query, filters, docs, retrieve_only)
+            except Exception as e:
+                logger.error(f"Error answering query {query_id}: {str(e)}")
+                record = {"id": query_id, "query": query, "error": str(e)}
+            finally:
+                semaphore.release()
+            write(record)
+        
+        block = next(blocks, None)
+        retrieval = asyncio.create_task(asyncio.to_thread(_retrieve_block, pipeline, block)) if block else None
+        while retrieval is not None:
+            current = block
+            processed, retrieved = await retrieval
+            debug_log(logger, "Retrieved sources for a block of %s queries", len(current))
+            
+            # Retrieve the next block while this one is being answered
+            block = next(blocks, None)
+            retrieval = asyncio.create_task(asyncio.to_thread(_retrieve_block, pipeline, block)) if block else None
+            
+            for (query_id, query, filters), processed_query, docs in zip(current, processed, retrieved):
+                await semaphore.acquire()
+                task = asyncio.create_task(answer_and_write(query_id, query, processed_query, filters, docs))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    
+    stats["seconds"] = round(time.perf_counter() - start, 3)
+    stats["queries_per_second"] = round((stats["answered"] + stats["failed"]) / max(stats["seconds"], 1e-9), 2)
+    return stats
+
+def run_batch(input_path: str, output_path: str = None, doc_path: str = None, retrieve_only: bool = False,
+              filters: dict = None) -> dict:
+    """
+    Index or load documents once, then answer a JSONL file of queries
+    
+    Args:
+        input_path: JSONL file of queries
+        output_path: JSONL results file (default: input path with .results.jsonl)
+        doc_path: Path to document file or directory to index first (optional)
+        retrieve_only: Only retrieve sources, without generating responses
+        filters: Filter expression of queries without their own filters (optional)
+    
+    Returns:
+        Batch statistics, see answer_batch
+    """
+    logger.info("Running batch queries")
+    if output_path is None:
+        output_path = os.path.splitext(input_path)[0] + ".results.jsonl"
+    
+    pipeline = create_pipeline(doc_path)
+    if pipeline.vector_db is None:
+        raise ValueError("No documents indexed. Pass --docs or build an index first.")
+    
+    with metrics.trace("batch", input=input_path):
+        stats = asyncio.run(answer_batch(pipeline, input_path, output_path, retrieve_only=retrieve_only, filters=filters))
+    
+    logger.info(
+        f"Batch complete: {stats['answered']} answered, {stats['failed']} failed, {stats['skipped']} already done "
+        f"in {stats['seconds']:.2f}s ({stats['queries_per_second']:.1f} queries/s); results in {output_path}"
+    )
+    metrics.log_summary()
+    return stats
@@ -10,30 +10,117 @@ class Config:
     # Logging configuration
     LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
     ENABLE_LOGGING = os.getenv("ENABLE_LOGGING", "True").lower() == "true"
-    DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "false"
+    DEBUG_MODE = os.getenv("DEBUG_MODE", "False").lower() == "true"
+    LOG_QUEUE = os.getenv("LOG_QUEUE", "False").lower() == "true"  # write log records from a background thread
     
     # LLM configuration for indexing
-    INDEX_LLM_PROVIDER = os.getenv("INDEX_LLM_PROVIDER", "openai")
+    INDEX_LLM_PROVIDER = os.getenv("INDEX_LLM_PROVIDER", "openai")  # openai, or local (hashed n-gram features, no API)
     INDEX_LLM_MODEL = os.getenv("INDEX_LLM_MODEL", "text-embedding-ada-002")
     INDEX_LLM_API_KEY = os.getenv("INDEX_LLM_API_KEY", "")
     INDEX_LLM_API_BASE = os.getenv("INDEX_LLM_API_BASE", "https://api.openai.com/v1")
+    LOCAL_EMBEDDING_DIM = int(os.getenv("LOCAL_EMBEDDING_DIM", "384"))  # local, demo-mode and fallback embeddings
     
     # LLM configuration for chat
     CHAT_LLM_PROVIDER = os.getenv("CHAT_LLM_PROVIDER", "openai")
     CHAT_LLM_MODEL = os.getenv("CHAT_LLM_MODEL", "gpt-3.5-turbo")
     CHAT_LLM_API_KEY = os.getenv("CHAT_LLM_API_KEY", "")
     CHAT_LLM_API_BASE = os.getenv("CHAT_LLM_API_BASE", "https://api.openai.com/v1")
+    CHAT_MAX_TOKENS = int(os.getenv("CHAT_MAX_TOKENS", "1024"))  # longest generated answer
+    
+    # LLM provider connections: pooled clients shared by all requests to an endpoint
+    INDEX_LLM_MAX_CONCURRENCY = int(os.getenv("INDEX_LLM_MAX_CONCURRENCY", "16"))  # embedding requests in flight (and pooled connections)
+    CHAT_LLM_MAX_CONCURRENCY = int(os.getenv("CHAT_LLM_MAX_CONCURRENCY", "64"))  # chat requests in flight (and pooled connections)
+    LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "60"))  # idle time before a pooled connection is closed
+    LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "600"))
+    LLM_CONNECT_TIMEOUT_SECONDS = float(os.getenv("LLM_CONNECT_TIMEOUT_SECONDS", "5"))
+    LLM_COALESCE_REQUESTS = os.getenv("LLM_COALESCE_REQUESTS", "True").lower() == "true"  # identical in-flight embedding requests share one call
+    
+    # Embedding request batching and concurrency
+    EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+    EMBEDDING_BATCH_TOKENS = int(os.getenv("EMBEDDING_BATCH_TOKENS", "100000"))
+    EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "5"))
+    EMBEDDING_RETRY_BASE_DELAY = float(os.getenv("EMBEDDING_RETRY_BASE_DELAY", "0.5"))
     
     # Vector database configuration
-    VECTOR_DB_TYPE = os.getenv("VECTOR_DB_TYPE", "faiss")  # faiss, chroma, pinecone, etc.
+    VECTOR_DB_TYPE = os.getenv("VECTOR_DB_TYPE", "flat")  # flat (exact), ivf (approximate), fp16/sq8/pq (compressed); faiss = flat
     VECTOR_DB_PATH = os.getenv("VECTOR_DB_PATH", "./vector_db")
+    SEARCH_SHARDS = int(os.getenv("SEARCH_SHARDS", "0"))  # worker processes searching the saved index; 0/1 = in process
+    SHARD_MIN_VECTORS = int(os.getenv("SHARD_MIN_VECTORS", "100000"))  # smaller indexes are always searched in process
+    
+    # IVF approximate index configuration
+    IVF_NLIST = int(os.getenv("IVF_NLIST", "0"))  # 0 = sqrt(number of vectors)
+    IVF_NPROBE = int(os.getenv("IVF_NPROBE", "8"))
+    IVF_TRAIN_ITERATIONS = int(os.getenv("IVF_TRAIN_ITERATIONS", "10"))
+    IVF_MIN_TRAIN_SIZE = int(os.getenv("IVF_MIN_TRAIN_SIZE", "10000"))
+    
+    # Compressed index configuration (fp16, sq8, pq)
+    PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "48"))
+    QUANT_RERANK_FACTOR = int(os.getenv("QUANT_RERANK_FACTOR", "4"))  # 0 = no float32 re-ranking
+    QUANT_MIN_TRAIN_SIZE = int(os.getenv("QUANT_MIN_TRAIN_SIZE", "10000"))
+    
+    # Metadata filtering: chunk metadata fields indexed for search filters (comma-separated)
+    FILTER_FIELDS = [field.strip() for field in os.getenv("FILTER_FIELDS", "collection,filename,source").split(",") if field.strip()]
+    
+    # Incremental indexing: compact once this fraction of vectors is deleted
+    COMPACT_DELETED_FRACTION = float(os.getenv("COMPACT_DELETED_FRACTION", "0.3"))
+    
+    # Live updates: writes to a saved index go to an in-memory segment backed by a write-ahead log
+    WAL_ENABLED = os.getenv("WAL_ENABLED", "True").lower() == "true"
+    WAL_FSYNC = os.getenv("WAL_FSYNC", "True").lower() == "true"  # fsync every logged write; False leaves flushing to the OS
+    LIVE_SEGMENT_MAX_VECTORS = int(os.getenv("LIVE_SEGMENT_MAX_VECTORS", "10000"))  # a full segment is frozen and merged into the saved index
+    BACKGROUND_MERGE = os.getenv("BACKGROUND_MERGE", "True").lower() == "true"  # merge frozen segments in a background thread
+    
+    # Persistent embedding cache
+    EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True").lower() == "true"
+    EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", os.path.join(VECTOR_DB_PATH, "embedding_cache.sqlite"))
+    EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
     
     # Document processing configuration
-    CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1000"))
-    CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+    CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "256"))  # estimated tokens per chunk
+    CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "48"))  # repeated between chunks, whole sentences
+    CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0"))  # 0 = one per CPU
+    
+    # Streaming indexing: chunks embedded per batch and batches queued ahead
+    INDEX_BATCH_SIZE = int(os.getenv("INDEX_BATCH_SIZE", "1024"))
+    INDEX_QUEUE_BATCHES = int(os.getenv("INDEX_QUEUE_BATCHES", "2"))
     
     # Retrieval configuration
     TOP_K_RESULTS = int(os.getenv("TOP_K_RESULTS", "3"))
+    CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "2048"))  # estimated tokens of retrieved context per prompt
+    RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()  # vector, lexical (BM25 only) or hybrid
+    RRF_K = int(os.getenv("RRF_K", "60"))  # rank offset of reciprocal-rank fusion
+    RRF_CANDIDATES = int(os.getenv("RRF_CANDIDATES", "20"))  # results fused from each retriever
+    BM25_K1 = float(os.getenv("BM25_K1", "1.2"))
+    BM25_B = float(os.getenv("BM25_B", "0.75"))
+    MMR_ENABLED = os.getenv("MMR_ENABLED", "True").lower() == "true"  # re-rank for diversity by maximal marginal relevance
+    MMR_CANDIDATES = int(os.getenv("MMR_CANDIDATES", "20"))  # results over-fetched and re-ranked down to the top k
+    MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))  # weight of relevance against novelty; 1 = plain ranking
+    
+    # Response cache for repeated and near-duplicate queries
+    RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "True").lower() == "true"
+    RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+    RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))  # seconds, 0 = no expiry
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    
+    # Print chat responses token by token as they are generated
+    STREAM_RESPONSES = os.getenv("STREAM_RESPONSES", "True").lower() == "true"
+    
+    # Show the chat prompt while a saved index loads in the background
+    BACKGROUND_INDEX_LOAD = os.getenv("BACKGROUND_INDEX_LOAD", "True").lower() == "true"
+    
+    # Per-stage latency metrics (exported on GET /metrics and to a JSONL file)
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "False").lower() == "true"
+    METRICS_JSONL_PATH = os.getenv("METRICS_JSONL_PATH", "")  # one record per query/indexing run; empty = off
+    
+    # Batch query mode (python main.py --batch QUERIES.jsonl)
+    BATCH_QUERY_SIZE = int(os.getenv("BATCH_QUERY_SIZE", "256"))  # queries embedded and searched together
+    BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))  # responses generated at once
+    
+    # HTTP serving mode (python main.py --serve)
+    SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+    SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+    SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "64"))
     
     @classmethod
     def validate_config(cls):
@@ -51,5 +138,23 @@ class Config:
         is_demo_chat_key = cls.CHAT_LLM_API_KEY.startswith("demo_placeholder")
         if cls.CHAT_LLM_PROVIDER == "openai" and not cls.CHAT_LLM_API_KEY and not is_demo_chat_key:
             errors.append("CHAT_LLM_API_KEY is required when using OpenAI for chat")
+        
+        if cls.INDEX_LLM_PROVIDER == "local" and cls.LOCAL_EMBEDDING_DIM <= 0:
+            errors.append("LOCAL_EMBEDDING_DIM must be positive")
+        
+        if cls.RETRIEVAL_MODE not in ("vector", "lexical", "hybrid"):
+            errors.append("RETRIEVAL_MODE must be one of: vector, lexical, hybrid")
             
         return errors
+    
+    @classmethod
+    def config_warnings(cls):
+        """Warn about settings that are still set but no longer have any effect"""
+        warnings = []
+        
+        # Character-based chunking settings replaced by token budgets
+        for old, new in (("CHUNK_SIZE", "CHUNK_TOKENS"), ("CHUNK_OVERLAP", "CHUNK_OVERLAP_TOKENS")):
+            if os.getenv(old) is not None:
+                warnings.append(f"{old} is no longer used and is ignored; set {new} instead")
+        
+        return warnings
@@ -1,98 +1,433 @@
-from typing import List, Union
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+import itertools
+import json
+import multiprocessing
 import os
+import re
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from .logger import logger, debug_log
 from .config import Config
+from .embedding import estimate_tokens
 
-def load_documents(doc_path: str) -> List[str]:
+# File extensions picked up when indexing a directory
+DOCUMENT_EXTENSIONS = ('.txt',)
+
+# Optional JSON object of extra metadata for a document, e.g. guide.txt.meta.json
+METADATA_SIDECAR_SUFFIX = ".meta.json"
+
+# Chunk metadata keys that sidecar files cannot set
+RESERVED_METADATA_KEYS = ("text", "byte_start", "byte_end", "source_size", "source_mtime_ns", "document_index")
+
+class SourceChangedError(OSError):
+    """Raised when a chunk's source file changed since the chunk was indexed"""
+
+# Files read and chunked per worker task in iter_chunks
+FILES_PER_TASK = 16
+
+# Characters per token assumed by estimate_tokens
+CHARS_PER_TOKEN = 4
+
+# Whitespace after a sentence end (optionally closed by quotes or brackets), or a blank line
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n[^\S\n]*\n\s*")
+
+def iter_document_paths(doc_path: str) -> Iterator[str]:
     """
-    Load documents from a file or directory
+    Yield the document files under a path, walking directories recursively
     
     Args:
         doc_path: Path to a file or directory containing documents
         
     Returns:
-        List of document texts
+        Iterator of absolute file paths, in a stable order
     """
-    documents = []
-    
+    doc_path = os.path.abspath(doc_path)
     if os.path.isfile(doc_path):
-        # Load single file
-        debug_log(logger, f"Loading document from file: {doc_path}")
-        with open(doc_path, 'r', encoding='utf-8') as f:
-            documents.append(f.read())
-    elif os.path.isdir(doc_path):
-        # Load all text files from directory
-        debug_log(logger, f"Loading documents from directory: {doc_path}")
-        for filename in os.listdir(doc_path):
-            file_path = os.path.join(doc_path, filename)
-            if os.path.isfile(file_path) and filename.endswith('.txt'):
-                debug_log(logger, f"Loading document: {filename}")
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    documents.append(f.read())
-    else:
+        yield doc_path
+        return
+    if not os.path.isdir(doc_path):
         raise FileNotFoundError(f"Document path not found: {doc_path}")
     
+    stack = [doc_path]
+    while stack:
+        directory = stack.pop()
+        with os.scandir(directory) as entries:
+            entries = sorted(entries, key=lambda entry: entry.name)
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and entry.name.endswith(DOCUMENT_EXTENSIONS):
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+def scan_documents(doc_path: str) -> Dict[str, os.stat_result]:
+    """
+    Stat every document file under a path without reading it
+    
+    Args:
+        doc_path: Path to a file or directory containing documents
+        
+    Returns:
+        Mapping of absolute file path to its stat result
+    """
+    files = {path: os.stat(path) for path in iter_document_paths(doc_path)}
+    debug_log(logger, "Scanned %s document files under %s", len(files), doc_path)
+    return files
+
+def read_document(path: str) -> str:
+    """
+    Read one document file
+    
+    Args:
+        path: Document file path
+        
+    Returns:
+        Document text
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def document_metadata(path: str, root: str = None) -> dict:
+    """
+    Metadata shared by every chunk of a document file
+    
+    Args:
+        path: Absolute document file path
+        root: File or directory being indexed that contains the path (optional)
+        
+    Returns:
+        Dictionary with "source" (the path), "filename", "collection" (the
+        first directory below root, "" for files directly in it) and the
+        fields of the document's sidecar file path + METADATA_SIDECAR_SUFFIX
+    """
+    meta = {}
+    sidecar = path + METADATA_SIDECAR_SUFFIX
+    if os.path.isfile(sidecar):
+        try:
+            with open(sidecar, 'r', encoding='utf-8') as f:
+                extra = json.load(f)
+            if not isinstance(extra, dict):
+                raise ValueError("expected a JSON object")
+            meta.update((key, value) for key, value in extra.items() if key not in RESERVED_METADATA_KEYS)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring metadata file {sidecar}: {str(e)}")
+    
+    collection = ""
+    if root:
+        root = os.path.abspath(root)
+        if os.path.isfile(root):
+            root = os.path.dirname(root)
+        parts = os.path.relpath(path, root).split(os.sep)
+        if len(parts) > 1 and parts[0] != os.pardir:
+            collection = parts[0]
+    meta.update({"source": path, "filename": os.path.basename(path), "collection": collection})
+    return meta
+
+def iter_documents(doc_path: str) -> Iterator[Tuple[str, str]]:
+    """
+    Lazily load documents from a file or directory, one at a time
+    
+    Args:
+        doc_path: Path to a file or directory containing documents
+        
+    Returns:
+        Iterator of (file_path, document_text) tuples
+    """
+    for path in iter_document_paths(doc_path):
+        debug_log(logger, "Loading document: %s", path)
+        yield path, read_document(path)
+
+def load_documents(doc_path: str, with_metadata: bool = False) -> Union[List[str], List[Tuple[str, dict]]]:
+    """
+    Load documents from a file or directory
+    
+    Args:
+        doc_path: Path to a file or directory containing documents
+        with_metadata: Also return each document's metadata, see document_metadata
+        
+    Returns:
+        List of document texts, or of (text, metadata) tuples with with_metadata
+    """
+    if with_metadata:
+        documents = [(text, document_metadata(path, doc_path)) for path, text in iter_documents(doc_path)]
+    else:
+        documents = [text for _, text in iter_documents(doc_path)]
+    
     logger.info(f"Loaded {len(documents)} documents")
     return documents
 
-def split_text_into_chunks(text: str, chunk_size: int = None, overlap: int = None) -> List[str]:
+def _split_units(text: str, max_tokens: int) -> List[Tuple[int, int, int, bool]]:
     """
-    Split text into chunks of specified size with overlap
+    Split text into sentences, cutting sentences longer than max_tokens at spaces
     
     Args:
         text: Text to split
-        chunk_size: Size of each chunk (uses config default if None)
-        overlap: Overlap between chunks (uses config default if None)
+        max_tokens: Largest estimated token count of a unit
         
     Returns:
-        List of text chunks
+        List of (start, end, tokens, ends_paragraph) tuples covering the text;
+        each unit includes the whitespace that follows it
     """
-    if chunk_size is None:
-        chunk_size = Config.CHUNK_SIZE
-    if overlap is None:
-        overlap = Config.CHUNK_OVERLAP
-    
-    chunks = []
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    units = []
     start = 0
+    for match in itertools.chain(SENTENCE_BOUNDARY.finditer(text), [None]):
+        end = match.end() if match else len(text)
+        if end <= start:
+            continue
+        ends_paragraph = match is None or "\n\n" in match.group().replace("\r", "")
+        
+        # Cut oversized sentences at the last space before the limit (or hard, if there is none)
+        while end - start > max_chars:
+            cut = text.rfind(" ", start + 1, start + max_chars)
+            cut = cut + 1 if cut > start else start + max_chars
+            units.append((start, cut, estimate_tokens(text[start:cut]), False))
+            start = cut
+        units.append((start, end, estimate_tokens(text[start:end]), ends_paragraph))
+        start = end
+    return units
+
+def chunk_spans(text: str, chunk_tokens: int = None, overlap_tokens: int = None) -> List[Tuple[int, int]]:
+    """
+    Find chunk boundaries that respect sentences and paragraphs
+    
+    Whole sentences are packed greedily up to the token budget. A chunk ends
+    early at a paragraph break once it is at least half full, and the next
+    chunk repeats trailing sentences of the previous one up to the overlap
+    budget. Every chunk advances by at least one sentence, so the number of
+    chunks and the total work stay linear in the text length.
     
-    while start < len(text):
-        end = min(start + chunk_size, len(text))
-        chunk = text[start:end]
-        chunks.append(chunk)
+    Args:
+        text: Text to split
+        chunk_tokens: Target estimated tokens per chunk (uses config default if None)
+        overlap_tokens: Estimated tokens repeated between chunks (uses config default if None)
         
-        # Move start position for next chunk
-        start = end - overlap
-        if start >= len(text):
-            break
-            
-        # If we're at the end of the text, stop
-        if end == len(text):
+    Returns:
+        List of (start, end) character offsets, surrounding whitespace excluded
+    """
+    if chunk_tokens is None:
+        chunk_tokens = Config.CHUNK_TOKENS
+    if overlap_tokens is None:
+        overlap_tokens = Config.CHUNK_OVERLAP_TOKENS
+    chunk_tokens = max(chunk_tokens, 1)
+    overlap_tokens = min(overlap_tokens, chunk_tokens // 2)
+    
+    units = _split_units(text, chunk_tokens)
+    spans = []
+    first, new = 0, 0
+    while first < len(units):
+        # Units before `new` repeat the end of the previous chunk; at least one new unit is taken
+        last, tokens = first, 0
+        while last < len(units) and (last <= new or tokens + units[last][2] <= chunk_tokens):
+            tokens += units[last][2]
+            last += 1
+            if units[last - 1][3] and last > new and tokens >= chunk_tokens // 2:
+                break
+        
+        start, end = units[first][0], units[last - 1][1]
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        while start < end and text[start].isspace():
+            start += 1
+        if end > start:
+            spans.append((start, end))
+        if last == len(units):
             break
+        
+        # Step back over trailing sentences for the overlap, leaving room for the next new unit
+        next_first, overlap = last, 0
+        budget = min(overlap_tokens, chunk_tokens - units[last][2])
+        while next_first - 1 > first and overlap + units[next_first - 1][2] <= budget:
+            next_first -= 1
+            overlap += units[next_first][2]
+        first, new = next_first, last
+    return spans
+
+def split_text_into_chunks(text: str, chunk_tokens: int = None, overlap_tokens: int = None) -> List[str]:
+    """
+    Split text into overlapping chunks of whole sentences
     
-    debug_log(logger, f"Split text into {len(chunks)} chunks")
+    Args:
+        text: Text to split
+        chunk_tokens: Target estimated tokens per chunk (uses config default if None)
+        overlap_tokens: Estimated tokens repeated between chunks (uses config default if None)
+        
+    Returns:
+        List of text chunks
+    """
+    chunks = [text[start:end] for start, end in chunk_spans(text, chunk_tokens, overlap_tokens)]
+    
+    debug_log(logger, "Split text into %s chunks", len(chunks))
     return chunks
 
-def prepare_documents(doc_path: str) -> List[str]:
+def _byte_offsets(text: str, positions: List[int]) -> Dict[int, int]:
+    """Map ascending character offsets of a text to UTF-8 byte offsets in one pass"""
+    offsets = {}
+    previous, byte_offset = 0, 0
+    for position in positions:
+        byte_offset += len(text[previous:position].encode("utf-8"))
+        offsets[position] = byte_offset
+        previous = position
+    return offsets
+
+def chunk_file(path: str) -> Tuple[str, List[Tuple[str, int, int]], Tuple[int, int]]:
+    """
+    Read and chunk one document file (runs in worker processes)
+    
+    The file is decoded without newline translation so that the byte
+    offsets of each chunk address it exactly in the file on disk.
+    
+    Args:
+        path: Document file path
+        
+    Returns:
+        Tuple of (file_path, list of (chunk_text, byte_start, byte_end)
+        tuples, (size, mtime_ns) of the file that was read)
+    """
+    with open(path, 'rb') as f:
+        # Taken before reading: a write during the read changes the mtime
+        mtime_ns = os.fstat(f.fileno()).st_mtime_ns
+        data = f.read()
+    text = data.decode('utf-8')
+    spans = chunk_spans(text)
+    version = (len(data), mtime_ns)
+    
+    if len(data) == len(text):
+        # ASCII: character and byte offsets coincide
+        return path, [(text[start:end], start, end) for start, end in spans], version
+    offsets = _byte_offsets(text, sorted({position for span in spans for position in span}))
+    return path, [(text[start:end], offsets[start], offsets[end]) for start, end in spans], version
+
+def read_chunk_text(meta: dict) -> str:
+    """
+    Fetch the text of a chunk from its source file
+    
+    Args:
+        meta: Chunk metadata with "source", "byte_start" and "byte_end", and
+            the "source_size" and "source_mtime_ns" the file had when indexed
+        
+    Returns:
+        Chunk text as currently stored on disk
+    
+    Raises:
+        SourceChangedError: If the file's size or mtime differ from those
+            recorded, so the byte offsets no longer address the chunk
+    """
+    with open(meta["source"], 'rb') as f:
+        if "source_mtime_ns" in meta:
+            stat = os.fstat(f.fileno())
+            if stat.st_size != meta["source_size"] or stat.st_mtime_ns != meta["source_mtime_ns"]:
+                raise SourceChangedError(f"{meta['source']} changed since it was indexed")
+        f.seek(meta["byte_start"])
+        data = f.read(meta["byte_end"] - meta["byte_start"])
+    return data.decode('utf-8', errors='replace')
+
+def chunk_files(paths: List[str]) -> List[Tuple[str, List[Tuple[str, int, int]], Tuple[int, int]]]:
+    """
+    Read and chunk a group of document files in one worker task
+    
+    Args:
+        paths: Document file paths
+        
+    Returns:
+        List of chunk_file results
+    """
+    return [chunk_file(path) for path in paths]
+
+def _chunk_worker_context():
+    """Multiprocessing context for chunking workers"""
+    # Forking a process that already runs embedding threads can deadlock on
+    # locks held at fork time; forkserver children start from a clean process
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+
+def _with_metadata(path: str, chunks: List[Tuple[str, int, int]], version: Tuple[int, int],
+                   root: str) -> Iterator[Tuple[str, dict]]:
+    """Attach the document metadata, file version and byte offsets to the chunks of one file"""
+    if not chunks:
+        return
+    shared = document_metadata(path, root)
+    shared["source_size"], shared["source_mtime_ns"] = version
+    for chunk, byte_start, byte_end in chunks:
+        meta = shared.copy()
+        meta["byte_start"], meta["byte_end"] = byte_start, byte_end
+        yield chunk, meta
+
+def iter_chunks(paths: Iterable[str], workers: int = None, max_pending: int = None,
+                root: str = None) -> Iterator[Tuple[str, dict]]:
+    """
+    Stream chunks of many files, reading and chunking them in a process pool
+    
+    Files are sent to workers in tasks of FILES_PER_TASK. At most
+    `max_pending` tasks are in flight at once, so memory stays bounded however
+    many files there are, and chunks are yielded in file order.
+    
+    Args:
+        paths: Document file paths (may be a lazy iterator)
+        workers: Chunking processes, 1 to chunk inline (uses config default if None)
+        max_pending: Tasks submitted ahead of the consumer (default 4 per worker)
+        root: Indexed file or directory, used to name each file's collection (optional)
+        
+    Returns:
+        Iterator of (chunk_text, metadata) tuples; metadata holds the
+        document_metadata fields plus "byte_start", "byte_end" and the
+        "source_size" and "source_mtime_ns" of the file that was chunked
+    """
+    if workers is None:
+        workers = Config.CHUNK_WORKERS or os.cpu_count() or 1
+    if max_pending is None:
+        max_pending = 4 * workers
+    
+    # Peek ahead so a pool is only started when there are several files
+    paths = iter(paths)
+    head = list(itertools.islice(paths, 2))
+    paths = itertools.chain(head, paths)
+    
+    if workers <= 1 or len(head) < 2:
+        for path in paths:
+            _, chunks, version = chunk_file(path)
+            yield from _with_metadata(path, chunks, version, root)
+        return
+    
+    # Small files are sent to workers in groups to amortize IPC overhead
+    groups = iter(lambda: list(itertools.islice(paths, FILES_PER_TASK)), [])
+    
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_chunk_worker_context()) as pool:
+        pending = deque()
+        exhausted = False
+        while pending or not exhausted:
+            # Keep the pool busy without reading ahead more than max_pending tasks
+            while not exhausted and len(pending) < max_pending:
+                group = next(groups, None)
+                if group is None:
+                    exhausted = True
+                else:
+                    pending.append(pool.submit(chunk_files, group))
+            if pending:
+                for path, chunks, version in pending.popleft().result():
+                    yield from _with_metadata(path, chunks, version, root)
+
+def prepare_documents(doc_path: str, with_metadata: bool = False) -> Union[List[str], List[Tuple[str, dict]]]:
     """
     Prepare documents for indexing by loading and splitting into chunks
     
     Args:
         doc_path: Path to document file or directory
+        with_metadata: Also return each chunk's metadata (source file,
+            filename, collection, sidecar fields and byte offsets)
         
     Returns:
-        List of document chunks
+        List of document chunks, or of (chunk, metadata) tuples with with_metadata
     """
     logger.info("Starting document preparation")
     
-    # Load documents
-    documents = load_documents(doc_path)
-    
-    # Split documents into chunks
-    all_chunks = []
-    for i, doc in enumerate(documents):
-        debug_log(logger, f"Processing document {i+1}/{len(documents)}")
-        chunks = split_text_into_chunks(doc)
-        all_chunks.extend(chunks)
+    # Read and split documents into chunks
+    chunks = iter_chunks(iter_document_paths(doc_path), root=doc_path)
+    if with_metadata:
+        all_chunks = list(chunks)
+    else:
+        all_chunks = [chunk for chunk, _ in chunks]
     
     logger.info(f"Document preparation complete. Created {len(all_chunks)} chunks")
     return all_chunks
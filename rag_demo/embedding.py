@@ -0,0 +1,508 @@
+import asyncio
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+from .embedding_cache import EmbeddingCache, text_hash
+from .metrics import metrics
+from .providers import LLMProvider, get_provider, retryable_errors
+
+if TYPE_CHECKING:
+    import openai
+
+# Character n-gram sizes hashed by the local embedder
+LOCAL_NGRAM_SIZES = (3, 4, 5)
+
+# Model name recorded in saved indexes built with the local embedder
+LOCAL_EMBEDDING_MODEL = "local-hashed-ngrams"
+
+# Byte translation table: ASCII letters and digits lowercased, other ASCII bytes
+# to a space, non-ASCII (UTF-8 sequence) bytes and the text separator 0 kept
+_BYTE_CLASSES = np.array([
+    byte if chr(byte).isalnum() or byte >= 128 or byte == 0 else ord(" ")
+    for byte in bytes(range(256)).lower()
+], dtype=np.uint8)
+
+def estimate_tokens(text: str) -> int:
+    """
+    Cheaply estimate the number of tokens in a text
+    
+    Args:
+        text: Text to measure
+    
+    Returns:
+        Approximate token count (roughly 4 characters per token)
+    """
+    return len(text) // 4 + 1
+
+def hashed_ngram_embeddings(texts: List[str], dim: int = None) -> np.ndarray:
+    """
+    Embed texts locally as hashed character n-gram features
+    
+    Texts are lowercased with punctuation folded into spaces, and the
+    character 3-, 4- and 5-grams of their UTF-8 bytes are hashed into `dim`
+    signed buckets (the hashing trick). Counts are damped with log1p and the
+    vectors L2-normalized, so texts sharing words and word fragments get a
+    high cosine similarity. The whole batch is processed with vectorized NumPy
+    operations on one byte buffer, using a fixed integer hash instead of
+    Python's per-process salted hash(): results are identical in every process
+    and the function keeps no state, so it is safe to call from many threads.
+    
+    Args:
+        texts: Texts to embed
+        dim: Embedding dimension (uses config default if None)
+    
+    Returns:
+        Float32 array of shape (len(texts), dim) with unit-length rows
+        (all-zero rows for texts without letters or digits)
+    """
+    if dim is None:
+        dim = Config.LOCAL_EMBEDDING_DIM
+    if not texts:
+        return np.zeros((0, dim), dtype=np.float32)
+    
+    # One byte buffer for the batch: texts separated by 0 and padded with spaces,
+    # punctuation folded into spaces and runs of spaces collapsed
+    joined = " \0 ".join(text.lower().replace("\0", " ") for text in texts)
+    data = _BYTE_CLASSES[np.frombuffer(f" {joined} ".encode("utf-8"), dtype=np.uint8)]
+    data = data[np.concatenate(([True], (data[1:] != 32) | (data[:-1] != 32)))]
+    owners = np.cumsum(data == 0)
+    
+    keys = []
+    h = np.zeros(len(data), dtype=np.uint64)
+    symbols = data.astype(np.uint64)
+    for n in range(1, max(LOCAL_NGRAM_SIZES) + 1):
+        # Rolling polynomial hash: h[i] covers the n bytes starting at i
+        count = len(data) - n + 1
+        if count <= 0:
+            break
+        h = h[:count] * np.uint64(1099511628211) + symbols[n - 1:]
+        if n not in LOCAL_NGRAM_SIZES:
+            continue
+        
+        # N-grams must lie within one text: no separator inside, same owner at both ends
+        valid = (owners[:count] == owners[n - 1:]) & (data[:count] != 0)
+        mixed = h[valid] ^ np.uint64(n)
+        mixed ^= mixed >> np.uint64(33)
+        mixed *= np.uint64(0xFF51AFD7ED558CCD)
+        mixed ^= mixed >> np.uint64(33)
+        
+        # Key = (text, bucket, sign); the bucket is taken from the high bits without a division
+        buckets = (((mixed >> np.uint64(32)) * np.uint64(dim)) >> np.uint64(32)).view(np.int64)
+        keys.append((owners[:count][valid] * dim + buckets) * 2 + (mixed & np.uint64(1)).view(np.int64))
+    
+    size = len(texts) * dim * 2
+    counts = np.bincount(np.concatenate(keys), minlength=size) if keys else np.zeros(size, dtype=np.int64)
+    counts = counts.reshape(len(texts), dim, 2)
+    signed = (counts[:, :, 0] - counts[:, :, 1]).astype(np.float32)
+    vectors = np.sign(signed) * np.log1p(np.abs(signed))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class EmbeddingEngine:
+    """Batched, concurrent embedding generation over the shared embedding provider"""
+    
+    def __init__(self, model: str = None, batch_size: int = None, batch_tokens: int = None,
+                 concurrency: int = None, max_retries: int = None, use_cache: bool = None):
+        """
+        Initialize embedding engine
+        
+        Args:
+            model: Embedding model (uses config default if None)
+            batch_size: Maximum inputs per request (uses config default if None)
+            batch_tokens: Maximum estimated tokens per request (uses config default if None)
+            concurrency: Maximum requests in flight (uses config default if None)
+            max_retries: Retries for rate-limited or failed requests (uses config default if None)
+            use_cache: Whether to use the persistent embedding cache (uses config default if None)
+        """
+        if model is None:
+            # Demo mode embeds with the local embedder, so its vectors are named after it
+            model = f"{LOCAL_EMBEDDING_MODEL}-{Config.LOCAL_EMBEDDING_DIM}" if self.is_demo_mode or self.is_local else Config.INDEX_LLM_MODEL
+        self.model = model
+        self.batch_size = batch_size or Config.EMBEDDING_BATCH_SIZE
+        self.batch_tokens = batch_tokens or Config.EMBEDDING_BATCH_TOKENS
+        self.concurrency = concurrency or Config.EMBEDDING_CONCURRENCY
+        self.max_retries = Config.EMBEDDING_MAX_RETRIES if max_retries is None else max_retries
+        self.use_cache = Config.EMBEDDING_CACHE_ENABLED if use_cache is None else use_cache
+        
+        self._cache = None
+        self._lock = threading.Lock()
+        self._executor = None
+    
+    @property
+    def is_demo_mode(self) -> bool:
+        """Whether placeholder API keys are configured (demo mode)"""
+        return Config.INDEX_LLM_API_KEY.startswith("demo_placeholder")
+    
+    @property
+    def is_local(self) -> bool:
+        """Whether embeddings are computed locally (INDEX_LLM_PROVIDER=local) instead of by the API"""
+        return Config.INDEX_LLM_PROVIDER == "local"
+    
+    @property
+    def dim(self) -> Optional[int]:
+        """Width of the embeddings, or None for API models, whose width is only known from a response"""
+        return Config.LOCAL_EMBEDDING_DIM if self.is_demo_mode or self.is_local else None
+    
+    @property
+    def provider(self) -> LLMProvider:
+        """Provider of the configured embedding endpoint, whose pooled clients all engines share"""
+        return get_provider("index")
+    
+    @property
+    def client(self) -> "openai.OpenAI":
+        """Pooled OpenAI client of the embedding endpoint"""
+        return self.provider.client
+    
+    @property
+    def async_client(self) -> "openai.AsyncOpenAI":
+        """Pooled async OpenAI client of the embedding endpoint, for the running event loop"""
+        return self.provider.async_client
+    
+    @property
+    def cache(self) -> EmbeddingCache:
+        """Lazily opened persistent embedding cache, or None when disabled"""
+        # Local embeddings are cheaper to compute than to look up, and simulated
+        # ones are never cached so they cannot shadow real ones
+        if not self.use_cache or self.is_demo_mode or self.is_local:
+            return None
+        if self._cache is None:
+            with self._lock:
+                if self._cache is None:
+                    self._cache = EmbeddingCache()
+        return self._cache
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Lazily created bounded thread pool for in-flight batches"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.concurrency,
+                        thread_name_prefix="embedding"
+                    )
+        return self._executor
+    
+    def make_batches(self, texts: List[str]) -> List[Tuple[int, List[str]]]:
+        """
+        Pack texts into request batches bounded by item and token limits
+        
+        Args:
+            texts: Texts to embed, in order
+        
+        Returns:
+            List of (start_index, batch_texts) tuples covering all texts in order
+        """
+        batches = []
+        start = 0
+        batch = []
+        batch_tokens = 0
+        
+        for i, text in enumerate(texts):
+            tokens = estimate_tokens(text)
+            if batch and (len(batch) >= self.batch_size or batch_tokens + tokens > self.batch_tokens):
+                batches.append((start, batch))
+                start, batch, batch_tokens = i, [], 0
+            batch.append(text)
+            batch_tokens += tokens
+        
+        if batch:
+            batches.append((start, batch))
+        return batches
+    
+    def _request_batch(self, batch: List[str]) -> List[List[float]]:
+        """
+        Embed one batch with a single API request, retrying with backoff
+        
+        A request for the same texts already in flight (e.g. the same query
+        from concurrent users) is waited for instead of being sent again.
+        
+        Args:
+            batch: Texts to embed in one request
+        
+        Returns:
+            Embedding vectors in input order
+        """
+        if Config.LLM_COALESCE_REQUESTS:
+            return self.provider.coalesce((self.model, tuple(batch)), lambda: self._send_batch(batch))
+        return self._send_batch(batch)
+    
+    async def _arequest_batch(self, batch: List[str]) -> List[List[float]]:
+        """Async version of _request_batch"""
+        if Config.LLM_COALESCE_REQUESTS:
+            return await self.provider.acoalesce((self.model, tuple(batch)), lambda: self._asend_batch(batch))
+        return await self._asend_batch(batch)
+    
+    def _send_batch(self, batch: List[str]) -> List[List[float]]:
+        """Send one embedding request within the provider's concurrency limit, retrying with backoff"""
+        provider = self.provider
+        attempt = 0
+        while True:
+            try:
+                with provider.limit():
+                    response = provider.client.embeddings.create(input=batch, model=self.model)
+                data = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in data]
+            except retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                debug_log(logger, "Embedding request failed (%s), retrying in %.2fs", type(e).__name__, delay)
+                time.sleep(delay)
+                attempt += 1
+    
+    async def _asend_batch(self, batch: List[str]) -> List[List[float]]:
+        """Async version of _send_batch; backoff sleeps without blocking the event loop"""
+        provider = self.provider
+        attempt = 0
+        while True:
+            try:
+                async with provider.alimit():
+                    response = await provider.async_client.embeddings.create(input=batch, model=self.model)
+                data = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in data]
+            except retryable_errors() as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self._backoff_delay(attempt, e)
+                debug_log(logger, "Embedding request failed (%s), retrying in %.2fs", type(e).__name__, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+    
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """
+        Compute retry delay, honouring a server-provided Retry-After header
+        
+        Args:
+            attempt: Zero-based retry attempt
+            error: Error raised by the failed request
+        
+        Returns:
+            Delay in seconds
+        """
+        response = getattr(error, "response", None)
+        if response is not None:
+            retry_after = response.headers.get("retry-after")
+            try:
+                return float(retry_after)
+            except (TypeError, ValueError):
+                pass
+        base = Config.EMBEDDING_RETRY_BASE_DELAY * (2 ** attempt)
+        return base * (0.5 + random.random() / 2)
+    
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        """
+        Embed one batch, with local embeddings for the local provider and in demo mode
+        
+        A failed API request is not replaced by local embeddings: those have
+        another dimension and meaning than the model's, so they cannot be
+        stored or searched alongside them.
+        
+        Args:
+            batch: Texts to embed
+            
+        Returns:
+            Float32 array of shape (len(batch), dim)
+        
+        Raises:
+            Exception: The API error, once retries are exhausted
+        """
+        metrics.observe("rag_embedding_batch_size", len(batch))
+        if self.is_demo_mode or self.is_local:
+            return hashed_ngram_embeddings(batch)
+        try:
+            with metrics.timer("embedding_request"):
+                return np.asarray(self._request_batch(batch), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            raise
+    
+    async def _aembed_batch(self, batch: List[str]) -> np.ndarray:
+        """Async version of _embed_batch"""
+        metrics.observe("rag_embedding_batch_size", len(batch))
+        if self.is_demo_mode or self.is_local:
+            return hashed_ngram_embeddings(batch)
+        try:
+            with metrics.timer("embedding_request"):
+                return np.asarray(await self._arequest_batch(batch), dtype=np.float32)
+        except Exception as e:
+            logger.error(f"Error generating embeddings: {str(e)}")
+            raise
+    
+    def _embed_uncached(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts using batched requests with several batches in flight
+        
+        Args:
+            texts: Texts to embed
+            
+        Returns:
+            Float32 array of shape (len(texts), dim)
+        """
+        batches = self.make_batches(texts)
+        debug_log(logger, "Embedding %s texts in %s batches with model %s", len(texts), len(batches), self.model)
+        
+        if len(batches) == 1 or self.concurrency <= 1:
+            outputs = [self._embed_batch(batch) for _, batch in batches]
+        else:
+            # map() keeps at most `concurrency` requests running and preserves order
+            outputs = list(self._get_executor().map(self._embed_batch, [batch for _, batch in batches]))
+        
+        return np.concatenate(outputs, axis=0)
+    
+    async def _aembed_uncached(self, texts: List[str]) -> np.ndarray:
+        """Async version of _embed_uncached; batches run concurrently on the event loop"""
+        batches = self.make_batches(texts)
+        semaphore = asyncio.Semaphore(self.concurrency)
+        
+        async def run(batch):
+            async with semaphore:
+                return await self._aembed_batch(batch)
+        
+        outputs = await asyncio.gather(*(run(batch) for _, batch in batches))
+        return np.concatenate(outputs, axis=0)
+    
+    def _lookup_cached(self, cache: EmbeddingCache, texts: List[str]) -> Tuple[list, list, dict]:
+        """
+        Look up texts in the embedding cache
+        
+        Args:
+            cache: Embedding cache
+            texts: Texts to embed
+        
+        Returns:
+            Tuple of (text hashes, cached vector or None per text, mapping of
+            hash to text for each distinct missing text)
+        """
+        hashes = [text_hash(text) for text in texts]
+        rows = cache.get_many(self.model, hashes)
+        
+        # Embed each distinct missing text once
+        pending = {}
+        for text, digest, vector in zip(texts, hashes, rows):
+            if vector is None and digest not in pending:
+                pending[digest] = text
+        metrics.increment("rag_embedding_cache_lookups_total", len(texts) - len(pending), result="hit")
+        metrics.increment("rag_embedding_cache_lookups_total", len(pending), result="miss")
+        return hashes, rows, pending
+    
+    def _merge_embedded(self, cache: EmbeddingCache, hashes: list, rows: list, pending: dict,
+                        vectors: np.ndarray) -> np.ndarray:
+        """
+        Fill cache misses with freshly embedded vectors and cache them
+        
+        Args:
+            cache: Embedding cache
+            hashes, rows, pending: Result of _lookup_cached
+            vectors: Embeddings of pending texts from the API, in pending order
+        
+        Returns:
+            Float32 array of shape (len(hashes), dim), rows in input order
+        """
+        if pending:
+            digests = list(pending)
+            fresh = dict(zip(digests, vectors))
+            cache.put_many(self.model, digests, vectors)
+            rows = [fresh[digest] if vector is None else vector for digest, vector in zip(hashes, rows)]
+        
+        debug_log(logger, "Embedding cache served %s/%s texts", len(hashes) - len(pending), len(hashes))
+        return np.stack(rows).astype(np.float32, copy=False)
+    
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embed texts, serving repeated content from the embedding cache
+        
+        Args:
+            texts: Texts to embed
+        
+        Returns:
+            Float32 array of shape (len(texts), dim), rows in input order
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        cache = self.cache
+        if cache is None:
+            return self._embed_uncached(texts)
+        
+        hashes, rows, pending = self._lookup_cached(cache, texts)
+        vectors = self._embed_uncached(list(pending.values())) if pending else None
+        return self._merge_embedded(cache, hashes, rows, pending, vectors)
+    
+    async def aembed(self, texts: List[str]) -> np.ndarray:
+        """
+        Async version of embed, for use from an asyncio event loop
+        
+        Cache lookups are local SQLite reads and run inline; API requests are
+        awaited, so many concurrent callers can share one event loop.
+        
+        Args:
+            texts: Texts to embed
+        
+        Returns:
+            Float32 array of shape (len(texts), dim), rows in input order
+        """
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        
+        cache = self.cache
+        if cache is None:
+            return await self._aembed_uncached(texts)
+        
+        hashes, rows, pending = self._lookup_cached(cache, texts)
+        vectors = (await self._aembed_uncached(list(pending.values()))) if pending else None
+        return self._merge_embedded(cache, hashes, rows, pending, vectors)
+    
+    def cache_stats(self) -> dict:
+        """
+        Embedding cache hit/miss counters
+        
+        Returns:
+            Counter dictionary, empty when the cache is disabled
+        """
+        cache = self.cache
+        return cache.stats() if cache is not None else {}
+    
+    def close(self):
+        """Release the thread pool and cache; pooled connections stay open for other engines (see close_providers)"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+_default_engine = None
+# Engines of models other than the configured one, each with its own cache connection
+_model_engines: Dict[str, EmbeddingEngine] = {}
+_default_engine_lock = threading.Lock()
+
+def get_embedding_engine(model: str = None) -> EmbeddingEngine:
+    """
+    Get the process-wide embedding engine of a model
+    
+    Args:
+        model: Embedding model (uses config default if None)
+    
+    Returns:
+        Shared EmbeddingEngine configured from Config, created once per model
+    """
+    global _default_engine
+    if _default_engine is None:
+        with _default_engine_lock:
+            if _default_engine is None:
+                _default_engine = EmbeddingEngine()
+    if model is None or model == _default_engine.model:
+        return _default_engine
+    engine = _model_engines.get(model)
+    if engine is None:
+        with _default_engine_lock:
+            engine = _model_engines.get(model)
+            if engine is None:
+                engine = _model_engines[model] = EmbeddingEngine(model=model)
+    return engine
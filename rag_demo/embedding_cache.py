@@ -0,0 +1,160 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+
+def text_hash(text: str) -> bytes:
+    """
+    Content hash used to address cached embeddings
+    
+    Args:
+        text: Embedded text
+    
+    Returns:
+        SHA-256 digest of the UTF-8 encoded text
+    """
+    return hashlib.sha256(text.encode("utf-8")).digest()
+
+class EmbeddingCache:
+    """Disk-backed embedding cache keyed by (model, text hash) with an in-memory LRU"""
+    
+    def __init__(self, path: str = None, max_memory_entries: int = None):
+        """
+        Initialize embedding cache
+        
+        Args:
+            path: SQLite database file (uses config default if None)
+            max_memory_entries: Size bound of the in-memory LRU (uses config default if None)
+        """
+        if path is None:
+            path = Config.EMBEDDING_CACHE_PATH
+        if max_memory_entries is None:
+            max_memory_entries = Config.EMBEDDING_CACHE_MEMORY_ENTRIES
+        
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, text_hash BLOB NOT NULL, vector BLOB NOT NULL, "
+            "PRIMARY KEY (model, text_hash)) WITHOUT ROWID"
+        )
+        self._conn.commit()
+        
+        debug_log(logger, "Opened embedding cache at %s", path)
+    
+    def _remember(self, key: tuple, vector: np.ndarray):
+        """Insert into the in-memory LRU, evicting the least recently used entry"""
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+    
+    def get_many(self, model: str, hashes: List[bytes]) -> List[Optional[np.ndarray]]:
+        """
+        Look up cached embeddings
+        
+        Args:
+            model: Embedding model name
+            hashes: Text hashes to look up
+        
+        Returns:
+            Cached float32 vector for each hash, or None where missing
+        """
+        results = [None] * len(hashes)
+        missing = []
+        
+        with self._lock:
+            for i, digest in enumerate(hashes):
+                key = (model, digest)
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    results[i] = vector
+                else:
+                    missing.append(i)
+            
+            if missing:
+                found = {}
+                unique = list({hashes[i] for i in missing})
+                # Stay well below SQLite's bound-parameter limit
+                for start in range(0, len(unique), 500):
+                    block = unique[start:start + 500]
+                    placeholders = ",".join("?" * len(block))
+                    rows = self._conn.execute(
+                        f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                        [model, *block]
+                    ).fetchall()
+                    for digest, blob in rows:
+                        found[digest] = np.frombuffer(blob, dtype=np.float32)
+                
+                for i in missing:
+                    vector = found.get(hashes[i])
+                    if vector is not None:
+                        results[i] = vector
+                        self._remember((model, hashes[i]), vector)
+                        self.disk_hits += 1
+            
+            hit_count = sum(1 for vector in results if vector is not None)
+            self.hits += hit_count
+            self.misses += len(hashes) - hit_count
+        
+        return results
+    
+    def put_many(self, model: str, hashes: List[bytes], vectors: np.ndarray):
+        """
+        Store embeddings in the cache
+        
+        Args:
+            model: Embedding model name
+            hashes: Text hashes, one per vector
+            vectors: Float32 array of shape (len(hashes), dim)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [(model, digest, vector.tobytes()) for digest, vector in zip(hashes, vectors)]
+            )
+            self._conn.commit()
+            for digest, vector in zip(hashes, vectors):
+                self._remember((model, digest), vector.copy())
+    
+    def stats(self) -> dict:
+        """
+        Cache hit/miss counters
+        
+        Returns:
+            Dictionary with hits, disk_hits, misses, hit_rate and memory_entries
+        """
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "memory_entries": len(self._memory)
+            }
+    
+    def close(self):
+        """Close the underlying SQLite connection"""
+        with self._lock:
+            self._conn.close()
@@ -1,43 +1,62 @@
-import openai
+import re
+import time
+from typing import TYPE_CHECKING, AsyncIterator, Iterable, Iterator
 from .logger import logger, debug_log
 from .config import Config
+from .metrics import metrics
+from .providers import get_provider
 
-def generate_response(query: str, context: str, model: str = None) -> str:
+if TYPE_CHECKING:
+    import openai
+
+# Message shown when the LLM request fails
+ERROR_RESPONSE = "Sorry, I encountered an error while generating a response."
+
+class StreamStatus:
     """
-    Generate response using LLM with provided context
+    Outcome of a streamed response, known once the stream is exhausted
+    
+    A stream that fails after some text was sent ends quietly rather than
+    with an error, so callers check `completed` before treating the text
+    they received as a whole answer (e.g. before caching it).
+    """
+    
+    def __init__(self):
+        # True once the response was generated to its end without an error
+        self.completed = False
+        self.error = None
+
+def is_demo_mode() -> bool:
+    """Whether placeholder chat API keys are configured (demo mode)"""
+    return Config.CHAT_LLM_API_KEY.startswith("demo_placeholder")
+
+def simulated_response(query: str, context: str) -> str:
+    """
+    Simulated response used in demo mode that references the context
     
     Args:
         query: User query
         context: Retrieved context from documents
-        model: LLM model to use (uses config default if None)
         
     Returns:
-        Generated response
+        Response text
     """
-    if model is None:
-        model = Config.CHAT_LLM_MODEL
-    
-    # Check if we're using placeholder API keys (demo mode)
-    is_demo_mode = Config.CHAT_LLM_API_KEY.startswith("demo_placeholder")
-    
-    logger.info(f"Generating response with {Config.CHAT_LLM_PROVIDER} model: {model}")
-    debug_log(logger, f"Query: {query}")
-    debug_log(logger, f"Context length: {len(context)} characters")
-    debug_log(logger, f"Demo mode: {is_demo_mode}")
+    context_preview = context[:200] + "..." if len(context) > 200 else context
+    return f"This is a simulated response to your query: '{query}'. In a real implementation, this would be generated by an LLM using the provided context. Here's a preview of the context I would use: '{context_preview}'"
+
+def build_messages(query: str, context: str) -> list:
+    """
+    Build the chat messages for a query and its retrieved context
     
-    if is_demo_mode:
-        # In demo mode, provide a simulated response that references the context
-        context_preview = context[:200] + "..." if len(context) > 200 else context
-        response_text = f"This is a simulated response to your query: '{query}'. In a real implementation, this would be generated by an LLM using the provided context. Here's a preview of the context I would use: '{context_preview}'"
-    else:
-        # Configure OpenAI client for real API usage
-        client = openai.OpenAI(
-            api_key=Config.CHAT_LLM_API_KEY,
-            base_url=Config.CHAT_LLM_API_BASE
-        )
-        
-        # Create prompt with context
-        prompt = f"""
+    Args:
+        query: User query
+        context: Retrieved context from documents
+        
+    Returns:
+        List of chat message dictionaries
+    """
+    # Create prompt with context
+    prompt = f"""
         Use the following context to answer the question according to the best of your ability.
         If the context doesn't contain the information needed to answer the question,
         please say so and only answer based on the given context.
@@ -50,28 +69,258 @@ def generate_response(query: str, context: str, model: str = None) -> str:
         
         Answer:
         """
+    return [
+        {"role": "system", "content": "You are a helpful assistant."},
+        {"role": "user", "content": prompt}
+    ]
+
+def generate_response(query: str, context: str, model: str = None) -> str:
+    """
+    Generate response using LLM with provided context
+    
+    Args:
+        query: User query
+        context: Retrieved context from documents
+        model: LLM model to use (uses config default if None)
+        
+    Returns:
+        Generated response
+    """
+    if model is None:
+        model = Config.CHAT_LLM_MODEL
+    
+    # Check if we're using placeholder API keys (demo mode)
+    demo_mode = is_demo_mode()
+    
+    debug_log(logger, "Generating response with %s model: %s", Config.CHAT_LLM_PROVIDER, model)
+    debug_log(logger, "Query: %s", query)
+    debug_log(logger, "Context length: %s characters", len(context))
+    debug_log(logger, "Demo mode: %s", demo_mode)
+    
+    if demo_mode:
+        # In demo mode, provide a simulated response that references the context
+        response_text = simulated_response(query, context)
+    else:
+        # Pooled chat client, shared by all requests
+        provider = get_provider("chat")
         
         try:
-            response = client.chat.completions.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a helpful assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=0.7,
-                max_tokens=32768
-            )
+            with provider.limit():
+                response = provider.client.chat.completions.create(
+                    model=model,
+                    messages=build_messages(query, context),
+                    temperature=0.7,
+                    max_tokens=Config.CHAT_MAX_TOKENS
+                )
+            response_text = response.choices[0].message.content.strip()
+            _record_usage(response)
+            
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            response_text = ERROR_RESPONSE
+    
+    debug_log(logger, "Generated response length: %s characters", len(response_text))
+    debug_log(logger, "Response generation complete")
+    
+    return response_text
+
+def get_async_client() -> "openai.AsyncOpenAI":
+    """
+    Get the shared async chat client of the running event loop
+    
+    Returns:
+        Pooled AsyncOpenAI client configured from Config
+    """
+    return get_provider("chat").async_client
+
+async def agenerate_response(query: str, context: str, model: str = None) -> str:
+    """
+    Async version of generate_response using the shared async client
+    
+    Args:
+        query: User query
+        context: Retrieved context from documents
+        model: LLM model to use (uses config default if None)
+        
+    Returns:
+        Generated response
+    """
+    if model is None:
+        model = Config.CHAT_LLM_MODEL
+    
+    debug_log(logger, "Generating response with %s model: %s", Config.CHAT_LLM_PROVIDER, model)
+    debug_log(logger, "Context length: %s characters", len(context))
+    
+    if is_demo_mode():
+        response_text = simulated_response(query, context)
+    else:
+        provider = get_provider("chat")
+        try:
+            async with provider.alimit():
+                response = await provider.async_client.chat.completions.create(
+                    model=model,
+                    messages=build_messages(query, context),
+                    temperature=0.7,
+                    max_tokens=Config.CHAT_MAX_TOKENS
+                )
             response_text = response.choices[0].message.content.strip()
+            _record_usage(response)
             
         except Exception as e:
             logger.error(f"Error generating response: {str(e)}")
-            response_text = "Sorry, I encountered an error while generating a response."
+            response_text = ERROR_RESPONSE
     
-    debug_log(logger, f"Generated response length: {len(response_text)} characters")
-    logger.info("Response generation complete")
+    debug_log(logger, "Generated response length: %s characters", len(response_text))
+    debug_log(logger, "Response generation complete")
     
     return response_text
 
+def _record_usage(response):
+    """Record prompt and completion token counts reported by the API"""
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        metrics.observe("rag_prompt_tokens", usage.prompt_tokens or 0)
+        metrics.observe("rag_completion_tokens", usage.completion_tokens or 0)
+
+def _simulated_tokens(query: str, context: str) -> list:
+    """Demo-mode response split into word tokens, as a model would stream it"""
+    return re.findall(r"\S+\s*", simulated_response(query, context))
+
+def _log_stream_timing(start: float, first_token_at: float, chunks: int):
+    """Record time-to-first-token separately from total generation time, logged in debug mode"""
+    total_ms = (time.perf_counter() - start) * 1000
+    if first_token_at is None:
+        debug_log(logger, "Response stream ended without tokens after %.0f ms", total_ms)
+        return
+    ttft_ms = (first_token_at - start) * 1000
+    # Not logged at INFO: in interactive chat the log shares the console with the streamed answer
+    debug_log(logger, "Time to first token: %.0f ms (total generation %.0f ms, %s chunks)", ttft_ms, total_ms, chunks)
+    metrics.record_duration("time_to_first_token", ttft_ms / 1000)
+    metrics.record_duration("generate", total_ms / 1000)
+    metrics.observe("rag_completion_chunks", chunks)
+
+def stream_response(query: str, context: str, model: str = None, status: StreamStatus = None) -> Iterator[str]:
+    """
+    Generate a response as a stream of text chunks, as they arrive from the LLM
+    
+    Args:
+        query: User query
+        context: Retrieved context from documents
+        model: LLM model to use (uses config default if None)
+        status: Filled in with the outcome when the stream ends (optional)
+        
+    Returns:
+        Iterator of response text chunks
+    """
+    if model is None:
+        model = Config.CHAT_LLM_MODEL
+    if status is None:
+        status = StreamStatus()
+    
+    debug_log(logger, "Streaming response with %s model: %s", Config.CHAT_LLM_PROVIDER, model)
+    debug_log(logger, "Context length: %s characters", len(context))
+    
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    
+    if is_demo_mode():
+        tokens = iter(_simulated_tokens(query, context))
+    else:
+        tokens = _stream_api_tokens(query, context, model, status)
+    
+    for token in tokens:
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+        chunks += 1
+        yield token
+    
+    status.completed = status.error is None
+    _log_stream_timing(start, first_token_at, chunks)
+
+def _stream_api_tokens(query: str, context: str, model: str, status: StreamStatus) -> Iterator[str]:
+    """Text deltas of a streamed chat completion; errors end the stream with a message and are recorded in status"""
+    provider = get_provider("chat")
+    produced = False
+    try:
+        # The request slot is held until the stream is consumed, since its connection is busy
+        with provider.limit():
+            stream = provider.client.chat.completions.create(
+                model=model,
+                messages=build_messages(query, context),
+                temperature=0.7,
+                max_tokens=Config.CHAT_MAX_TOKENS,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    produced = True
+                    yield chunk.choices[0].delta.content
+    except Exception as e:
+        logger.error(f"Error generating response: {str(e)}")
+        status.error = e
+        if not produced:
+            yield ERROR_RESPONSE
+
+async def astream_response(query: str, context: str, model: str = None,
+                           status: StreamStatus = None) -> AsyncIterator[str]:
+    """
+    Async version of stream_response using the shared async client
+    
+    Args:
+        query: User query
+        context: Retrieved context from documents
+        model: LLM model to use (uses config default if None)
+        status: Filled in with the outcome when the stream ends (optional)
+        
+    Returns:
+        Async iterator of response text chunks
+    """
+    if model is None:
+        model = Config.CHAT_LLM_MODEL
+    if status is None:
+        status = StreamStatus()
+    
+    debug_log(logger, "Streaming response with %s model: %s", Config.CHAT_LLM_PROVIDER, model)
+    
+    start = time.perf_counter()
+    first_token_at = None
+    chunks = 0
+    
+    if is_demo_mode():
+        for token in _simulated_tokens(query, context):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            chunks += 1
+            yield token
+    else:
+        provider = get_provider("chat")
+        produced = False
+        try:
+            async with provider.alimit():
+                stream = await provider.async_client.chat.completions.create(
+                    model=model,
+                    messages=build_messages(query, context),
+                    temperature=0.7,
+                    max_tokens=Config.CHAT_MAX_TOKENS,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        produced = True
+                        chunks += 1
+                        yield chunk.choices[0].delta.content
+        except Exception as e:
+            logger.error(f"Error generating response: {str(e)}")
+            status.error = e
+            if not produced:
+                yield ERROR_RESPONSE
+    
+    status.completed = status.error is None
+    _log_stream_timing(start, first_token_at, chunks)
+
 def post_process_response(response: str) -> str:
     """
     Post-process generated response
@@ -82,8 +331,8 @@ def post_process_response(response: str) -> str:
     Returns:
         Processed response
     """
-    logger.info("Post-processing response")
-    debug_log(logger, f"Raw response length: {len(response)} characters")
+    debug_log(logger, "Post-processing response")
+    debug_log(logger, "Raw response length: %s characters", len(response))
     
     # Strip whitespace
     processed_response = response.strip()
@@ -92,7 +341,93 @@ def post_process_response(response: str) -> str:
     if processed_response and processed_response[-1] not in '.!?':
         processed_response += '.'
     
-    debug_log(logger, f"Processed response length: {len(processed_response)} characters")
-    logger.info("Response post-processing complete")
+    debug_log(logger, "Processed response length: %s characters", len(processed_response))
+    debug_log(logger, "Response post-processing complete")
     
     return processed_response
+
+class StreamPostProcessor:
+    """
+    Incremental form of post_process_response for streamed responses
+    
+    Leading whitespace is dropped and trailing whitespace is held back until
+    more text follows it, so only the stream's tail is inspected to decide
+    whether closing punctuation must be appended.
+    """
+    
+    def __init__(self):
+        self._started = False
+        self._pending = ""
+        self._last_char = ""
+    
+    def feed(self, token: str) -> str:
+        """
+        Process one chunk
+        
+        Args:
+            token: Raw response chunk
+            
+        Returns:
+            Text that can be emitted now (may be empty)
+        """
+        if not self._started:
+            token = token.lstrip()
+            if not token:
+                return ""
+            self._started = True
+        
+        text = self._pending + token
+        emitted = text.rstrip()
+        self._pending = text[len(emitted):]
+        if emitted:
+            self._last_char = emitted[-1]
+        return emitted
+    
+    def finish(self) -> str:
+        """
+        Text to emit after the last chunk
+        
+        Returns:
+            Closing punctuation if the response lacks it, else an empty string
+        """
+        if self._last_char and self._last_char not in '.!?':
+            return '.'
+        return ""
+
+def post_process_stream(tokens: Iterable[str]) -> Iterator[str]:
+    """
+    Post-process a streamed response chunk by chunk
+    
+    Args:
+        tokens: Raw response chunks
+        
+    Returns:
+        Iterator of processed chunks
+    """
+    processor = StreamPostProcessor()
+    for token in tokens:
+        text = processor.feed(token)
+        if text:
+            yield text
+    tail = processor.finish()
+    if tail:
+        yield tail
+
+async def apost_process_stream(tokens: AsyncIterator[str]) -> AsyncIterator[str]:
+    """
+    Async version of post_process_stream
+    
+    Args:
+        tokens: Raw response chunks
+        
+    Returns:
+        Async iterator of processed chunks
+    """
+    processor = StreamPostProcessor()
+    async for token in tokens:
+        text = processor.feed(token)
+        if text:
+            yield text
+    tail = processor.finish()
+    if tail:
+        yield tail
@@ -0,0 +1,110 @@
+import time
+from collections import defaultdict
+from .logger import logger
+from .config import Config
+from .document_preparation import iter_chunks, scan_documents
+from .indexing import VectorDatabase, load_index
+from .manifest import IndexManifest
+from .metrics import metrics
+
+def sync_index(doc_path: str, db: VectorDatabase) -> dict:
+    """
+    Bring a vector database up to date with the documents under a path
+    
+    Only new or changed files are chunked and embedded. Vectors of changed
+    or deleted files are tombstoned, and the database is compacted once the
+    tombstoned fraction exceeds COMPACT_DELETED_FRACTION.
+    
+    Args:
+        doc_path: Path to document file or directory
+        db: Vector database to update in place
+    
+    Returns:
+        Dictionary with counts of added, changed, removed and unchanged files
+        and of added and deleted chunks
+    """
+    start_time = time.perf_counter()
+    manifest = db.manifest
+    
+    if len(db) > db.deleted_count and not manifest.files:
+        raise ValueError("Vector database has no manifest, so its vectors cannot be matched to files")
+    
+    current = scan_documents(doc_path)
+    added, changed, removed = manifest.diff(current)
+    logger.info(
+        f"Index sync: {len(added)} new, {len(changed)} changed, {len(removed)} deleted, "
+        f"{len(current) - len(added) - len(changed)} unchanged files"
+    )
+    
+    # Tombstone vectors of files that changed or disappeared, and chunks left
+    # behind by a sync that was interrupted before it updated the manifest
+    untracked = db.untracked_chunks()
+    if untracked:
+        logger.warning(f"Deleting {len(untracked)} chunks of an interrupted index sync; their files are indexed again")
+    stale_ids = list(untracked)
+    for path in removed + [path for path, _ in changed]:
+        stale_ids.extend(manifest.ids(path))
+    db.delete(stale_ids)
+    
+    # Stream chunks of new and changed files through embedding and insertion
+    chunks_by_source = defaultdict(list)
+    
+    def tracked_chunks():
+        for text, meta in iter_chunks((path for path, _ in added + changed), root=doc_path):
+            # The same dict receives its document_index when inserted
+            chunks_by_source[meta["source"]].append(meta)
+            yield text, meta
+    
+    added_chunks = db.add_stream(tracked_chunks())
+    
+    # The manifest is updated last, in one logged step, so a crash never records
+    # files whose chunks were not all written
+    changes = {path: None for path in removed}
+    for path, sha256 in added + changed:
+        ids = [meta["document_index"] for meta in chunks_by_source.get(path, [])]
+        changes[path] = IndexManifest.entry(current[path], sha256, ids)
+    db.update_manifest(changes)
+    
+    if len(db) and db.deleted_count / len(db) > Config.COMPACT_DELETED_FRACTION:
+        db.compact()
+    
+    stats = {
+        "added_files": len(added),
+        "changed_files": len(changed),
+        "removed_files": len(removed),
+        "unchanged_files": len(current) - len(added) - len(changed),
+        "added_chunks": added_chunks,
+        "deleted_chunks": len(stale_ids)
+    }
+    logger.info(f"Index sync complete in {time.perf_counter() - start_time:.2f}s: {stats}")
+    return stats
+
+def update_index(doc_path: str, db_path: str = None) -> VectorDatabase:
+    """
+    Incrementally index documents into the saved database, creating it if needed
+    
+    Args:
+        doc_path: Path to document file or directory
+        db_path: Path of the vector database (uses config default if None)
+    
+    Returns:
+        Up-to-date vector database, saved to disk
+    """
+    db = None
+    if VectorDatabase.exists(db_path):
+        try:
+            db = load_index(db_path)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not load saved index ({str(e)}); rebuilding it")
+    if db is not None and len(db) > db.deleted_count and not db.manifest.files:
+        # Vectors without a manifest cannot be attributed to files; start over
+        logger.warning("Saved index has no usable manifest; rebuilding it from scratch")
+        db = None
+    if db is None:
+        db = VectorDatabase(db_path)
+    
+    with metrics.trace("index", doc_path=doc_path):
+        sync_index(doc_path, db)
+        db.save()
+    metrics.log_summary()
+    return db
@@ -1,9 +1,26 @@
+import asyncio
 import os
+import queue
+import threading
+import time
 import numpy as np
-import openai
-from typing import List, Tuple
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 from .logger import logger, debug_log
 from .config import Config
+from .document_preparation import SourceChangedError, read_chunk_text
+from .embedding import get_embedding_engine
+from .lexical_index import LexicalIndex, tokenize
+from .manifest import IndexManifest
+from .metadata_index import MetadataIndex
+from .metrics import metrics
+from .segments import Segment, SegmentSnapshot, WriteAheadLog, list_wal_files, wal_path
+from .sharding import ShardedSearcher, merge_shard_results
+from .storage import (
+    DELETED_FILE, METADATA_FILE, OFFSETS_FILE, MetadataStore,
+    complete_pending_save, index_exists, read_header, read_tombstones, remove_file, save_transaction,
+    tombstone_range, write_array, write_header
+)
+from .vector_index import VectorIndex, create_vector_index, normalize_rows
 
 def get_embedding(text: str, model: str = None) -> List[float]:
     """
@@ -16,62 +33,376 @@ def get_embedding(text: str, model: str = None) -> List[float]:
     Returns:
         Embedding vector
     """
-    if model is None:
-        model = Config.INDEX_LLM_MODEL
-    
-    # Check if we're using placeholder API keys (demo mode)
-    is_demo_mode = Config.INDEX_LLM_API_KEY.startswith("demo_placeholder")
-    
-    if is_demo_mode:
-        # In demo mode, we still generate embeddings but log that it's simulated
-        debug_log(logger, f"Generating simulated embedding for text (length {len(text)}) with model {model}")
-    else:
-        # In a real implementation, this would call an actual LLM API
-        # For demo purposes, we'll generate random embeddings
-        # In practice, you would use something like:
-        try:
-            client = openai.OpenAI(
-                api_key=Config.INDEX_LLM_API_KEY,
-                base_url=Config.INDEX_LLM_API_BASE
-            )
-            response = client.embeddings.create(
-                input=text,
-                model=model
-            )
-            return response.data[0].embedding
-        except Exception as e:
-            logger.error(f"Error generating embedding: {str(e)}")
-            # Fall back to mock embedding in case of error
-            pass
-    
-    # Generate a mock embedding (384 dimensions for example)
-    np.random.seed(hash(text) % (2**32))  # For reproducible "random" embeddings
-    embedding = np.random.rand(384).tolist()
+    engine = get_embedding_engine(model)
+    embedding = engine.embed([text])[0].tolist()
     
-    debug_log(logger, f"Generated embedding for text (length {len(text)}) with model {model}")
+    debug_log(logger, "Generated embedding for text (length %s) with model %s", len(text), engine.model)
     return embedding
 
+class _IndexState(NamedTuple):
+    """Searchable contents of a database, replaced as a whole so readers see one consistent version"""
+    # Saved segment: vector index, metadata, BM25 index and metadata index over ids 0..len(index)
+    index: VectorIndex
+    metadata: MetadataStore
+    lexical: LexicalIndex
+    filter_index: MetadataIndex
+    # In-memory segments holding the ids after the saved segment; the last one takes new writes
+    segments: Tuple[Segment, ...]
+
+class _Snapshot:
+    """Read view of a database taken once per search: its state plus a snapshot of each in-memory segment"""
+    
+    def __init__(self, state: _IndexState):
+        self.index = state.index
+        self.metadata = state.metadata
+        self.lexical = state.lexical
+        self.filter_index = state.filter_index
+        self.segments: List[SegmentSnapshot] = [segment.snapshot() for segment in state.segments]
+    
+    def __len__(self) -> int:
+        return len(self.index) + sum(len(segment) for segment in self.segments)
+    
+    def _segment_of(self, doc_id: int) -> SegmentSnapshot:
+        for segment in self.segments:
+            if doc_id < segment.start + len(segment):
+                return segment
+        raise IndexError(f"Vector id {doc_id} out of range")
+    
+    def metadata_of(self, doc_id: int) -> dict:
+        if doc_id < len(self.index):
+            return self.metadata[doc_id]
+        return self._segment_of(doc_id).metadata(doc_id)
+    
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        ids = np.asarray(ids, dtype=np.int64)
+        in_index = ids < len(self.index)
+        if in_index.all():
+            return self.index.reconstruct(ids)
+        vectors = None
+        for segment in self.segments:
+            inside = (ids >= segment.start) & (ids < segment.start + len(segment))
+            if inside.any():
+                block = segment.reconstruct(ids[inside])
+                if vectors is None:
+                    vectors = np.empty((len(ids), block.shape[1]), dtype=np.float32)
+                vectors[inside] = block
+        if vectors is None or (~in_index & (ids >= len(self))).any():
+            raise IndexError("Vector id out of range")
+        if in_index.any():
+            vectors[in_index] = self.index.reconstruct(ids[in_index])
+        return vectors
+
 class VectorDatabase:
-    """Simple in-memory vector database for demonstration"""
+    """
+    Simple vector database: a pluggable vector index plus per-vector metadata
     
-    def __init__(self, db_path: str = None):
+    Once a database is on disk (loaded or saved), it accepts writes while it
+    is being searched. New vectors go to a small in-memory segment whose
+    writes are logged to a write-ahead log first; searches cover the saved
+    segment, which is never modified in memory, plus a snapshot of every
+    in-memory segment, and take no locks. A full segment is frozen and
+    merged into the saved segment in the background, by saving an updated
+    copy of it and swapping that in; vector ids never change in the process.
+    After a crash, load() replays the logs of the segments not yet merged.
+    """
+    
+    def __init__(self, db_path: str = None, index_type: str = None):
         """
         Initialize vector database
         
         Args:
             db_path: Path to persist database (optional)
+            index_type: Index backend, see VECTOR_DB_TYPE (uses config default if None)
         """
         if db_path is None:
             db_path = Config.VECTOR_DB_PATH
             
         self.db_path = db_path
-        self.vectors = []
-        self.metadata = []
+        # The BM25 index over chunk texts and the columnar index of the
+        # FILTER_FIELDS metadata use the same ids as the vectors
+        self._state = _IndexState(create_vector_index(index_type), MetadataStore(), LexicalIndex(), MetadataIndex(), ())
+        self.manifest = IndexManifest()
+        
+        # Tombstones: True marks a deleted vector id (None until the first delete)
+        self._deleted = None
+        # Incremented on every save; ties the manifest to the saved vectors
+        self.generation = 0
+        # Incremented whenever the searchable contents change; keys caches of search results
+        self.version = 0
+        # Incremented when the saved segment or the tombstones change, and its
+        # value when they match the files on disk, which is what search shards serve
+        self._base_version = 0
+        self._saved_version = None
+        self._shards = None
+        self._shards_failed = False
+        self._shards_lock = threading.Lock()
+        # Whether the files on disk include the metadata index, which shards need to filter
+        self._filters_saved = False
+        
+        # Writers are serialized by _write_lock; merges and saves of the saved
+        # segment by _merge_lock, which is always taken first
+        self._write_lock = threading.RLock()
+        self._merge_lock = threading.RLock()
+        self._wal_sequence = 0
+        self._merge_requested = threading.Event()
+        self._merger = None
         
         # Create directory if it doesn't exist
         os.makedirs(db_path, exist_ok=True)
         
-        logger.info(f"Initialized vector database at {db_path}")
+        debug_log(logger, "Initialized vector database at %s (%s index)", db_path, self.index.name)
+    
+    @property
+    def index(self) -> VectorIndex:
+        return self._state.index
+    
+    @index.setter
+    def index(self, index: VectorIndex):
+        self._state = self._state._replace(index=index)
+    
+    @property
+    def metadata(self) -> MetadataStore:
+        return self._state.metadata
+    
+    @metadata.setter
+    def metadata(self, metadata: MetadataStore):
+        self._state = self._state._replace(metadata=metadata)
+    
+    @property
+    def lexical(self) -> LexicalIndex:
+        return self._state.lexical
+    
+    @lexical.setter
+    def lexical(self, lexical: LexicalIndex):
+        self._state = self._state._replace(lexical=lexical)
+    
+    @property
+    def filter_index(self) -> MetadataIndex:
+        return self._state.filter_index
+    
+    @filter_index.setter
+    def filter_index(self, filter_index: MetadataIndex):
+        self._state = self._state._replace(filter_index=filter_index)
+    
+    @property
+    def segments(self) -> Tuple[Segment, ...]:
+        """In-memory segments not yet merged into the saved index (empty until live updates start)"""
+        return self._state.segments
+    
+    @property
+    def live_count(self) -> int:
+        """Number of vectors in the in-memory segments"""
+        return sum(len(segment) for segment in self.segments)
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """Stored (normalized) vectors of shape (n, dim)"""
+        return self.reconstruct(np.arange(len(self)))
+    
+    def reconstruct(self, ids) -> np.ndarray:
+        """
+        Stored (normalized) vectors of the given ids, in any segment
+        
+        Args:
+            ids: Integer array of vector ids
+        
+        Returns:
+            Float32 array of shape (len(ids), dim)
+        """
+        return _Snapshot(self._state).reconstruct(ids)
+    
+    def __len__(self) -> int:
+        state = self._state
+        return len(state.index) + sum(len(segment) for segment in state.segments)
+    
+    @property
+    def deleted_count(self) -> int:
+        """Number of tombstoned vectors"""
+        return 0 if self._deleted is None else int(self._deleted[:len(self)].sum())
+    
+    def _allowed_mask(self, filters: dict = None, snapshot: _Snapshot = None):
+        """
+        Boolean mask of the searchable ids of the saved segment
+        
+        Args:
+            filters: Metadata filter expression, see metadata_index.normalize_filters (optional)
+            snapshot: Read view to evaluate the filters in (default: the current state)
+        
+        Returns:
+            Mask of ids that are not deleted and match the filters, or None
+            when every id is searchable
+        """
+        state = snapshot or self._state
+        allowed = None
+        deleted = self._deleted
+        if deleted is not None:
+            allowed = ~tombstone_range(deleted, 0, len(state.index))
+        if filters:
+            matches = state.filter_index.mask(filters)
+            allowed = matches if allowed is None else allowed & matches
+        return allowed
+    
+    def _reserve_tombstones(self):
+        """Grow the tombstone mask to cover every vector id"""
+        if self._deleted is not None and len(self._deleted) >= len(self):
+            return
+        grown = np.zeros(max(2 * len(self), 1024), dtype=bool)
+        if self._deleted is not None:
+            grown[:len(self._deleted)] = self._deleted
+        self._deleted = grown
+    
+    def delete(self, ids: List[int]):
+        """
+        Tombstone vectors so they are no longer returned by searches
+        
+        Args:
+            ids: Vector ids (document_index values) to delete
+        """
+        if len(ids) == 0:
+            return
+        with self._write_lock:
+            if self.segments:
+                self.segments[-1].log.append({"op": "delete", "ids": [int(i) for i in ids]})
+            self._reserve_tombstones()
+            self._deleted[np.asarray(ids, dtype=np.int64)] = True
+            self.version += 1
+            self._base_version += 1
+        debug_log(logger, "Tombstoned %s vectors", len(ids))
+    
+    def update_manifest(self, changes: Dict[str, Optional[dict]]):
+        """
+        Record indexed files in the manifest, or forget them
+        
+        With live updates the change is logged like a write, so replaying the
+        logs after a crash restores the manifest together with the vectors.
+        
+        Args:
+            changes: Mapping of file path to its IndexManifest.entry, or None to forget the file
+        """
+        with self._write_lock:
+            if self.segments:
+                self.segments[-1].log.append({"op": "manifest", "files": changes})
+            self.manifest.apply(changes)
+    
+    def untracked_chunks(self) -> List[int]:
+        """
+        Ids of file chunks that are not deleted but belong to no manifest record
+        
+        A sync interrupted by a crash after some of its writes were logged
+        leaves such chunks behind, since the manifest is updated last. They
+        always follow the last id the manifest knows of, as syncs append.
+        
+        Returns:
+            Vector ids, ascending
+        """
+        snapshot = _Snapshot(self._state)
+        tracked = self.manifest.max_id()
+        untracked = []
+        for doc_id in range(tracked + 1, len(snapshot)):
+            deleted = self._deleted is not None and doc_id < len(self._deleted) and self._deleted[doc_id]
+            if not deleted and "byte_start" in snapshot.metadata_of(doc_id):
+                untracked.append(doc_id)
+        return untracked
+    
+    def compact(self) -> np.ndarray:
+        """
+        Rebuild the index without tombstoned vectors
+        
+        Vector ids are reassigned consecutively; the manifest is remapped.
+        With live updates, the in-memory segments are merged first and the
+        compacted index is saved and swapped in like a merge; writes wait
+        until it is done, searches do not.
+        
+        Returns:
+            Array mapping each old id to its new id (-1 for deleted vectors)
+        """
+        if self.segments:
+            with self._merge_lock, self._write_lock:
+                self.merge_segments()
+                saved, mapping = self._rebuild_saved(lambda db: db.compact())
+                self._publish_saved(saved, self.segments, self._base_version, compacted=True)
+            return mapping
+        
+        live = np.flatnonzero(self._allowed_mask()) if self._deleted is not None else np.arange(len(self))
+        mapping = np.full(len(self), -1, dtype=np.int64)
+        mapping[live] = np.arange(len(live))
+        
+        logger.info(f"Compacting vector database: keeping {len(live)} of {len(self)} vectors")
+        
+        index = create_vector_index(self.index.name)
+        metadata = MetadataStore()
+        for start in range(0, len(live), 65536):
+            block = live[start:start + 65536]
+            index.add(self.index.reconstruct(block))
+            for old_id in block:
+                meta = self.metadata[int(old_id)]
+                meta["document_index"] = int(mapping[old_id])
+                metadata.append(meta)
+        
+        self.index = index
+        self.metadata = metadata
+        self.lexical.remap(mapping)
+        self.filter_index.remap(mapping)
+        self._deleted = None
+        self.manifest.remap(mapping)
+        self.version += 1
+        self._base_version += 1
+        return mapping
+    
+    def add_vectors(self, vectors, metadatas: List[dict], texts: List[str] = None):
+        """
+        Append precomputed embeddings and their metadata
+        
+        Args:
+            vectors: Array-like of shape (n, dim)
+            metadatas: List of metadata dictionaries, one per vector
+            texts: Chunk texts for the lexical index (taken from metadata "text" if None)
+        """
+        block = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        if block.ndim != 2 or len(block) != len(metadatas):
+            raise ValueError("vectors must be 2-D with one row per metadata entry")
+        if len(block) == 0:
+            return
+        if texts is None:
+            texts = [meta.get("text", "") for meta in metadatas]
+        if self.segments:
+            self._append_live(block, metadatas, texts)
+            return
+        
+        start = len(self.index)
+        self.index.add(block)
+        
+        for offset, meta in enumerate(metadatas):
+            meta["document_index"] = start + offset
+            self.metadata.append(meta)
+        self.filter_index.add(metadatas)
+        self.lexical.add(texts)
+        self.version += 1
+        self._base_version += 1
+    
+    def _append_live(self, block: np.ndarray, metadatas: List[dict], texts: List[str]):
+        """Log a write, then append it to the live segment, freezing the segment once it is full"""
+        with self._write_lock:
+            segment = self.segments[-1]
+            start = segment.start + len(segment)
+            for offset, meta in enumerate(metadatas):
+                meta["document_index"] = start + offset
+            
+            with metrics.timer("wal_append"):
+                segment.log.append({
+                    "op": "add",
+                    "start": start,
+                    "dim": block.shape[1],
+                    "metadatas": metadatas,
+                    # Texts already in the metadata are not logged twice
+                    "texts": [None if text == meta.get("text") else text for meta, text in zip(metadatas, texts)]
+                }, block.tobytes())
+            segment.append(block, metadatas, texts)
+            self.version += 1
+            full = len(segment) >= Config.LIVE_SEGMENT_MAX_VECTORS and self._freeze_live()
+        metrics.increment("rag_wal_writes_total")
+        if full:
+            self._request_merge()
     
     def add_documents(self, documents: List[str], metadatas: List[dict] = None):
         """
@@ -86,81 +417,695 @@ class VectorDatabase:
             
         logger.info(f"Adding {len(documents)} documents to vector database")
         
-        for i, (doc, meta) in enumerate(zip(documents, metadatas)):
-            # Generate embedding for document
-            embedding = get_embedding(doc)
+        # Generate embeddings in batched, concurrent requests
+        with metrics.timer("index_embed"):
+            embeddings = get_embedding_engine().embed(documents)
+        
+        # Chunks with byte offsets are read back from their source file when
+        # retrieved, so only text without a source is stored in the metadata
+        for doc, meta in zip(documents, metadatas):
+            if "byte_start" not in meta:
+                meta["text"] = doc
+        
+        # Store embeddings and metadata
+        if len(documents):
+            with metrics.timer("index_insert"):
+                self.add_vectors(embeddings, metadatas, documents)
+            metrics.increment("rag_indexed_chunks_total", len(documents))
+        
+        logger.info(f"Successfully added {len(documents)} documents to vector database")
+    
+    def add_stream(self, chunks: Iterable[Tuple[str, dict]], batch_size: int = None) -> int:
+        """
+        Embed and insert a stream of chunks with bounded memory
+        
+        A reader thread groups the stream into batches and hands them over a
+        bounded queue, so producing chunks overlaps with embedding and
+        insertion, and a slow embedding API throttles the producer instead of
+        letting chunks pile up.
+        
+        Args:
+            chunks: Iterable of (text, metadata) tuples, e.g. from iter_chunks
+            batch_size: Chunks embedded per batch (uses config default if None)
             
-            # Store embedding and metadata
-            self.vectors.append(embedding)
-            meta["document_index"] = len(self.vectors) - 1
-            meta["text"] = doc
-            self.metadata.append(meta)
+        Returns:
+            Number of chunks added
+        """
+        if batch_size is None:
+            batch_size = Config.INDEX_BATCH_SIZE
+        
+        batches = queue.Queue(maxsize=Config.INDEX_QUEUE_BATCHES)
+        stop = threading.Event()
+        done = object()
+        errors = []
+        
+        def produce():
+            try:
+                for batch in _batched(chunks, batch_size):
+                    if stop.is_set():
+                        return
+                    batches.put(batch)
+            except BaseException as e:
+                errors.append(e)
+            finally:
+                batches.put(done)
+        
+        reader = threading.Thread(target=produce, name="chunk-reader", daemon=True)
+        reader.start()
+        
+        added = 0
+        try:
+            while True:
+                batch = batches.get()
+                if batch is done:
+                    break
+                texts = [text for text, _ in batch]
+                metadatas = [meta for _, meta in batch]
+                self.add_documents(texts, metadatas)
+                added += len(batch)
+        finally:
+            # Unblock the reader if we stopped early
+            stop.set()
+            while reader.is_alive():
+                try:
+                    batches.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            reader.join()
+        
+        if errors:
+            raise errors[0]
+        return added
+    
+    def chunk_text(self, meta: dict) -> str:
+        """
+        Text of a stored chunk, read lazily from its source file if not in the metadata
+        
+        Args:
+            meta: Chunk metadata
             
-            debug_log(logger, f"Added document {i+1}/{len(documents)} to database")
+        Returns:
+            Chunk text, or an empty string if the source file cannot be read
+            or changed since it was indexed
+        """
+        if "text" in meta or "byte_start" not in meta:
+            return meta.get("text", "")
+        try:
+            return read_chunk_text(meta)
+        except SourceChangedError as e:
+            logger.warning(f"Skipping chunk {meta.get('document_index')}: {str(e)}; re-index to refresh it")
+            return ""
+        except OSError as e:
+            logger.warning(f"Could not read chunk {meta.get('document_index')} from {meta['source']}: {str(e)}")
+            return ""
+    
+    def _results(self, snapshot: _Snapshot, scores: Iterable[float], ids: Iterable[int]) -> List[Tuple[dict, float]]:
+        """
+        Search results for vector ids: copies of their metadata including the chunk text
         
-        logger.info(f"Successfully added {len(documents)} documents to vector database")
+        Hits whose text is read from a source file that is gone or changed
+        since indexing are skipped rather than returned without their text.
+        """
+        results = []
+        for score, doc_id in zip(scores, ids):
+            if doc_id < 0:
+                continue
+            meta = snapshot.metadata_of(int(doc_id)).copy()
+            meta["text"] = self.chunk_text(meta)
+            if meta["text"] or "byte_start" not in meta:
+                results.append((meta, float(score)))
+        return results
     
-    def search(self, query: str, k: int = None) -> List[Tuple[dict, float]]:
+    def search_by_vector(self, query_embedding, k: int = None, filters: dict = None) -> List[Tuple[dict, float]]:
         """
-        Search for similar documents to the query
+        Search for documents similar to a precomputed query embedding
         
         Args:
-            query: Query text
+            query_embedding: Query embedding vector
             k: Number of results to return (uses config default if None)
+            filters: Metadata filter expression, e.g. {"collection": "manuals"} (optional)
             
         Returns:
             List of (metadata, similarity_score) tuples
         """
+        return self.search_many_by_vector(np.asarray(query_embedding, dtype=np.float32)[None, :], k, filters)[0]
+    
+    def search_many_by_vector(self, query_embeddings, k: int = None, filters: dict = None) -> List[List[Tuple[dict, float]]]:
+        """
+        Search for a block of precomputed query embeddings in one matrix product
+        
+        Args:
+            query_embeddings: Array-like of shape (num_queries, dim)
+            k: Number of results per query (uses config default if None)
+            filters: Metadata filter expression, e.g. {"collection": "manuals"}; only
+                matching chunks are scored (optional)
+            
+        Returns:
+            One list of (metadata, similarity_score) tuples per query
+        """
         if k is None:
             k = Config.TOP_K_RESULTS
+        
+        queries = normalize_rows(np.asarray(query_embeddings, dtype=np.float32))
+        snapshot = _Snapshot(self._state)
+        dim = snapshot.index.dim
+        if dim and queries.shape[1] != dim:
+            raise ValueError(f"Query embeddings have {queries.shape[1]} dimensions, but the index holds "
+                             f"{dim}-dimensional vectors; re-index the documents with the configured embedding model")
+        shards = self._shard_searcher() if not filters or self._filters_saved else None
+        if shards is not None:
+            try:
+                scores, ids = shards.search(queries, k, filters)
+            except RuntimeError as e:
+                logger.warning(f"Sharded search failed ({str(e)}); searching in process")
+                self._shards_failed = True
+                self.close()
+                shards = None
+        if shards is None:
+            scores, ids = snapshot.index.search(queries, k, self._allowed_mask(filters, snapshot))
+        if snapshot.segments:
+            deleted = self._deleted
+            parts = [(scores, ids)] + [
+                segment.search(queries, k, segment.allowed(deleted, filters)) for segment in snapshot.segments
+            ]
+            scores, ids = merge_shard_results(parts, k)
+        
+        return [self._results(snapshot, row_scores, row_ids) for row_scores, row_ids in zip(scores, ids)]
+    
+    def search_lexical(self, query: str, k: int = None, filters: dict = None) -> List[Tuple[dict, float]]:
+        """
+        Search chunk texts by BM25 keyword relevance, without embedding the query
+        
+        Args:
+            query: Query text
+            k: Number of results to return (uses config default if None)
+            filters: Metadata filter expression; only matching chunks are returned (optional)
+            
+        Returns:
+            List of (metadata, bm25_score) tuples; only chunks sharing a term
+            with the query are returned
+        """
+        if k is None:
+            k = Config.TOP_K_RESULTS
+        
+        snapshot = _Snapshot(self._state)
+        with metrics.timer("lexical_search"):
+            scores, ids = snapshot.lexical.search(query, k, self._allowed_mask(filters, snapshot))
+            if snapshot.segments:
+                scores, ids = self._search_segments_lexical(snapshot, query, k, filters, scores, ids)
+        results = self._results(snapshot, scores, ids)
+        
+        debug_log(logger, "Lexical search returned %s results", len(results))
+        return results
+    
+    def _search_segments_lexical(self, snapshot: _Snapshot, query: str, k: int, filters: dict,
+                                 scores: np.ndarray, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Add the BM25 matches of the in-memory segments to those of the saved segment"""
+        terms = sorted(set(tokenize(query)))
+        documents, total_length, frequencies = snapshot.lexical.term_statistics(terms)
+        for segment in snapshot.segments:
+            segment_documents, segment_length, segment_frequencies = segment.term_statistics(terms)
+            documents += segment_documents
+            total_length += segment_length
+            for term in terms:
+                frequencies[term] += segment_frequencies[term]
+        statistics = (documents, max(total_length / max(documents, 1), 1.0), frequencies)
+        
+        deleted = self._deleted
+        parts = [(scores[None, :], ids[None, :])] + [
+            segment.search_lexical(terms, k, statistics, snapshot.lexical.k1, snapshot.lexical.b,
+                                   segment.allowed(deleted, filters))
+            for segment in snapshot.segments
+        ]
+        scores, ids = merge_shard_results(parts, k)
+        found = ids[0] >= 0
+        return scores[0][found], ids[0][found]
+    
+    def search(self, query: str, k: int = None, query_embedding=None, filters: dict = None) -> List[Tuple[dict, float]]:
+        """
+        Search for similar documents to the query
+        
+        Args:
+            query: Query text
+            k: Number of results to return (uses config default if None)
+            query_embedding: Precomputed embedding of the query (optional)
+            filters: Metadata filter expression, e.g. {"collection": "manuals"} (optional)
             
-        logger.info(f"Searching for documents similar to: {query}")
+        Returns:
+            List of (metadata, similarity_score) tuples
+        """
+        debug_log(logger, "Searching for documents similar to: %s", query)
         
         # Generate embedding for query
-        query_embedding = get_embedding(query)
-        
-        # Calculate similarities (cosine similarity)
-        similarities = []
-        for i, vector in enumerate(self.vectors):
-            # Simplified cosine similarity calculation
-            # In practice, you would use a more robust implementation
-            dot_product = np.dot(query_embedding, vector)
-            norm_query = np.linalg.norm(query_embedding)
-            norm_vector = np.linalg.norm(vector)
-            
-            if norm_query == 0 or norm_vector == 0:
-                similarity = 0
-            else:
-                similarity = dot_product / (norm_query * norm_vector)
-                
-            similarities.append((i, similarity))
+        if query_embedding is None:
+            with metrics.timer("embed_query"):
+                query_embedding = get_embedding(query)
+        with metrics.timer("vector_search"):
+            results = self.search_by_vector(query_embedding, k, filters)
         
-        # Sort by similarity and get top k
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        top_k = similarities[:k]
+        debug_log(logger, "Search returned %s results", len(results))
+        return results
+    
+    async def asearch(self, query: str, k: int = None, query_embedding=None, filters: dict = None) -> List[Tuple[dict, float]]:
+        """
+        Async version of search for use from an asyncio event loop
         
-        # Return metadata and similarity scores
-        results = [(self.metadata[i].copy(), score) for i, score in top_k]
+        The query is embedded with the async client and the vector search,
+        which releases the GIL inside numpy, runs in a worker thread so the
+        event loop keeps serving other requests.
         
-        debug_log(logger, f"Search returned {len(results)} results")
+        Args:
+            query: Query text
+            k: Number of results to return (uses config default if None)
+            query_embedding: Precomputed embedding of the query (optional)
+            filters: Metadata filter expression (optional)
+            
+        Returns:
+            List of (metadata, similarity_score) tuples
+        """
+        debug_log(logger, "Searching for documents similar to: %s", query)
+        
+        if query_embedding is None:
+            with metrics.timer("embed_query"):
+                query_embedding = (await get_embedding_engine().aembed([query]))[0]
+        with metrics.timer("vector_search"):
+            results = await asyncio.to_thread(self.search_by_vector, query_embedding, k, filters)
+        
+        debug_log(logger, "Search returned %s results", len(results))
+        return results
+    
+    def search_many(self, queries: List[str], k: int = None, filters: dict = None) -> List[List[Tuple[dict, float]]]:
+        """
+        Search for several queries at once, scoring them in a single GEMM
+        
+        Args:
+            queries: List of query texts
+            k: Number of results per query (uses config default if None)
+            filters: Metadata filter expression applied to every query (optional)
+            
+        Returns:
+            One list of (metadata, similarity_score) tuples per query
+        """
+        debug_log(logger, "Searching for %s queries", len(queries))
+        
+        if not queries:
+            return []
+        # One batched (and cached) embedding call for all queries
+        query_embeddings = get_embedding_engine().embed(queries)
+        results = self.search_many_by_vector(query_embeddings, k, filters)
+        
+        debug_log(logger, "Batched search returned %s results", sum(len(r) for r in results))
         return results
     
     def save(self):
-        """Save vector database to disk (simplified implementation)"""
-        # In a real implementation, you would save to a file
-        logger.info("Vector database saved to disk")
+        """
+        Save vector database to disk under db_path
+        
+        Data files are appended to, or written under staged names, and the
+        header is written last, which commits the save: a reader or a crash
+        mid-save still sees the previous complete index, and a save
+        interrupted after its commit is completed by the next load.
+        With live updates, the in-memory segments are merged into the saved
+        index. Once saved, the database takes further writes as live updates
+        (unless WAL_ENABLED is off).
+        """
+        if self.segments:
+            self.merge_segments()
+        with self._merge_lock:
+            if not self.segments or self._base_version != self._saved_version or not self._filters_saved:
+                # A database that is not live yet, tombstones set since the last
+                # merge or a metadata index rebuilt on load
+                self._save_base()
+        if Config.WAL_ENABLED and not self.segments:
+            # Logs in the directory belong to the index this save replaced
+            self._open_segments(replay=False)
+    
+    def _save_base(self):
+        """Write the saved segment, tombstones and manifest"""
+        os.makedirs(self.db_path, exist_ok=True)
+        self.generation += 1
+        save_start = time.perf_counter()
+        base_version = self._base_version
+        count = len(self.index)
+        
+        # Files that are rewritten rather than appended to only replace the
+        # previous ones once the header commits the save
+        with save_transaction(self.db_path):
+            self.index.save(self.db_path)
+            self.lexical.save(self.db_path)
+            self.filter_index.save(self.db_path)
+            self.metadata.save(
+                os.path.join(self.db_path, METADATA_FILE),
+                os.path.join(self.db_path, OFFSETS_FILE)
+            )
+            deleted = 0
+            if self._deleted is not None:
+                flags = tombstone_range(self._deleted, 0, count)
+                deleted = int(flags.sum())
+                write_array(os.path.join(self.db_path, DELETED_FILE), np.packbits(flags))
+            else:
+                remove_file(os.path.join(self.db_path, DELETED_FILE))
+            
+            self.manifest.generation = self.generation
+            self.manifest.save(self.db_path)
+            
+            write_header(self.db_path, {
+                "index_type": self.index.name,
+                "count": count,
+                "dim": self.index.dim,
+                "dtype": "float32",
+                "deleted": deleted,
+                "generation": self.generation,
+                "embedding_model": get_embedding_engine().model
+            })
+        self._saved_version = base_version
+        self._filters_saved = True
+        metrics.record_duration("index_save", time.perf_counter() - save_start)
+        logger.info(f"Vector database saved to disk ({count} vectors, {deleted} deleted)")
     
     def load(self):
-        """Load vector database from disk (simplified implementation)"""
-        # In a real implementation, you would load from a file
-        logger.info("Vector database loaded from disk")
+        """
+        Load vector database from disk under db_path
+        
+        The vectors are memory-mapped read-only, so opening is independent of
+        index size, pages are read lazily and the OS page cache is shared by
+        every process that loads the same index. The saved index type takes
+        precedence over VECTOR_DB_TYPE. Writes logged since the last merge
+        are replayed into the live segment (unless WAL_ENABLED is off).
+        """
+        self._load_base()
+        if Config.WAL_ENABLED:
+            self._open_segments()
+        elif list_wal_files(self.db_path):
+            logger.warning("WAL_ENABLED is off; writes in the write-ahead logs of this index are not loaded")
+        
+        logger.info(f"Vector database loaded from disk ({len(self)} vectors, {self.index.name} index)")
+    
+    def _load_base(self):
+        """Open the saved segment, tombstones and manifest"""
+        if complete_pending_save(self.db_path):
+            logger.warning("Completed a save of the index that was interrupted after it was committed")
+        header = read_header(self.db_path)
+        count = header["count"]
+        
+        engine = get_embedding_engine()
+        if count and engine.dim is not None and header["dim"] != engine.dim:
+            raise ValueError(f"Index holds {header['dim']}-dimensional vectors, but {engine.model} "
+                             f"produces {engine.dim}-dimensional embeddings; re-index the documents")
+        model = header.get("embedding_model")
+        if model and model != engine.model:
+            logger.warning(f"Index was built with embedding model {model}, but {engine.model} is configured")
+        
+        self.index = create_vector_index(header.get("index_type", "flat"))
+        self.index.load(self.db_path, header)
+        self.metadata = MetadataStore.open(
+            os.path.join(self.db_path, METADATA_FILE),
+            os.path.join(self.db_path, OFFSETS_FILE),
+            count
+        )
+        
+        self._deleted = read_tombstones(self.db_path, header)
+        
+        self.lexical = LexicalIndex()
+        try:
+            if LexicalIndex.exists(self.db_path):
+                self.lexical.load(self.db_path, count)
+        except ValueError as e:
+            logger.warning(f"{e}; rebuilding lexical index")
+            self.lexical = LexicalIndex()
+        if len(self.lexical) != count:
+            # Indexes saved before the lexical index existed are upgraded on load
+            logger.info("Building lexical index from stored chunk texts")
+            self.lexical.add([self.chunk_text(self.metadata[i]) for i in range(count)])
+        
+        self.filter_index = MetadataIndex()
+        try:
+            if MetadataIndex.exists(self.db_path):
+                self.filter_index.load(self.db_path, count)
+        except ValueError as e:
+            logger.warning(f"{e}; rebuilding metadata index")
+            self.filter_index = MetadataIndex()
+        # Until the next save, search shards cannot filter on a rebuilt metadata index
+        self._filters_saved = len(self.filter_index) == count
+        if not self._filters_saved:
+            logger.info("Building metadata index from stored chunk metadata")
+            self.filter_index.add([self.metadata[i] for i in range(count)])
+        
+        self.generation = header.get("generation", 0)
+        self.version += 1
+        self._base_version += 1
+        self._saved_version = self._base_version
+        self.manifest = IndexManifest.load(self.db_path)
+        if self.manifest.generation != self.generation:
+            logger.warning("Index manifest does not match the saved vectors; it will be rebuilt")
+            self.manifest = IndexManifest()
+    
+    def _new_segment(self, start: int) -> Segment:
+        """Empty live segment with a new write-ahead log"""
+        self._wal_sequence += 1
+        return Segment(start, WriteAheadLog(wal_path(self.db_path, self._wal_sequence)))
+    
+    def _open_segments(self, replay: bool = True):
+        """
+        Start taking writes as live updates
+        
+        Write-ahead logs left by a previous process hold writes that were
+        never merged; they are replayed into the live segment, which keeps
+        them until its next merge.
+        
+        Args:
+            replay: Replay existing logs; if False they are removed instead
+        """
+        logs = list_wal_files(self.db_path)
+        if not replay:
+            for _, path in logs:
+                WriteAheadLog(path).remove()
+            logs = []
+        self._wal_sequence = logs[-1][0] if logs else 0
+        segment = self._new_segment(len(self.index))
+        segment.logs = [WriteAheadLog(path) for _, path in logs] + segment.logs
+        self._state = self._state._replace(segments=(segment,))
+        
+        replayed = 0
+        for log in segment.logs[:-1]:
+            for record, payload in log.replay():
+                if record["op"] == "delete":
+                    self._reserve_tombstones()
+                    self._deleted[np.asarray(record["ids"], dtype=np.int64)] = True
+                    continue
+                if record["op"] == "manifest":
+                    # A manifest discarded by _load_base stays empty, so the index is rebuilt
+                    if self.manifest.generation == self.generation:
+                        self.manifest.apply(record["files"])
+                    continue
+                # A crash between saving a merge and removing its logs leaves writes already saved
+                if record["start"] < segment.start + len(segment):
+                    continue
+                if record["start"] > segment.start + len(segment):
+                    logger.warning(f"Write-ahead log {log.path} skips ids {segment.start + len(segment)}..{record['start'] - 1}; ignoring the rest of it")
+                    break
+                vectors = np.frombuffer(payload, dtype=np.float32).reshape(-1, record["dim"])
+                metadatas = record["metadatas"]
+                texts = [meta.get("text", "") if text is None else text for meta, text in zip(metadatas, record["texts"])]
+                segment.append(vectors, metadatas, texts)
+                replayed += len(vectors)
+        
+        if replayed:
+            self.version += 1
+            logger.info(f"Replayed {replayed} vectors from {len(logs)} write-ahead logs")
+            if len(segment) >= Config.LIVE_SEGMENT_MAX_VECTORS and self._freeze_live():
+                self._request_merge()
+    
+    def _freeze_live(self) -> bool:
+        """
+        Stop writing to the live segment and start a new one (with _write_lock held)
+        
+        Returns:
+            True if a segment was frozen, False if the live segment was empty
+        """
+        segment = self.segments[-1]
+        if len(segment) == 0:
+            return False
+        segment.frozen = True
+        self._state = self._state._replace(segments=self.segments + (self._new_segment(segment.start + len(segment)),))
+        debug_log(logger, "Froze segment of %s vectors starting at id %s", len(segment), segment.start)
+        return True
+    
+    def _request_merge(self):
+        """Have the frozen segments merged, by the background merger unless BACKGROUND_MERGE is off"""
+        if not Config.BACKGROUND_MERGE:
+            self._merge_frozen()
+            return
+        if self._merger is None:
+            with self._write_lock:
+                if self._merger is None:
+                    self._merger = threading.Thread(target=self._merge_loop, name="segment-merger", daemon=True)
+                    self._merger.start()
+        self._merge_requested.set()
+    
+    def _merge_loop(self):
+        """Background merger: merge the frozen segments whenever a segment is frozen"""
+        while True:
+            self._merge_requested.wait()
+            self._merge_requested.clear()
+            try:
+                self._merge_frozen()
+            except Exception as e:
+                # The segments stay searchable and logged; the next freeze retries
+                logger.error(f"Error merging segments into the saved index: {str(e)}")
+    
+    def merge_segments(self):
+        """
+        Merge every in-memory segment into the saved index now
+        
+        The live segment is frozen first; writes go to a new live segment and
+        searches continue while the merge runs in the calling thread.
+        """
+        with self._write_lock:
+            if self.segments:
+                self._freeze_live()
+        self._merge_frozen()
+    
+    def _merge_frozen(self):
+        """Merge the frozen segments into the saved segment and swap the result in"""
+        with self._merge_lock:
+            frozen = tuple(segment for segment in self.segments if segment.frozen)
+            if not frozen:
+                return
+            base_version = self._base_version
+            count = sum(len(segment) for segment in frozen)
+            logger.info(f"Merging {count} vectors from {len(frozen)} segments into the saved index")
+            
+            def add_segments(db: "VectorDatabase"):
+                for segment in frozen:
+                    snapshot = segment.snapshot()
+                    db.add_vectors(snapshot.rows, snapshot.metadatas, snapshot.texts)
+            
+            with metrics.timer("segment_merge"):
+                saved, _ = self._rebuild_saved(add_segments)
+                with self._write_lock:
+                    self._publish_saved(saved, frozen, base_version)
+            metrics.increment("rag_segment_merges_total")
+    
+    def _rebuild_saved(self, change: Callable[["VectorDatabase"], object]) -> Tuple["VectorDatabase", object]:
+        """
+        Apply a change to a private copy of the saved segment, save it and reopen it
+        
+        The copy is loaded from disk, so the saved segment in use is never
+        modified; saving appends to the data files or atomically replaces
+        them, which readers of the previous files do not notice.
+        
+        Args:
+            change: Function applying the change to the copy
+        
+        Returns:
+            Tuple of (the saved result, memory-mapped like a loaded index, and
+            the return value of change)
+        """
+        working = VectorDatabase(self.db_path, self.index.name)
+        working._load_base()
+        working._deleted = self._deleted
+        # Files recorded after this point are logged to the live segment, which is not merged
+        with self._write_lock:
+            working.manifest = self.manifest.copy()
+        result = change(working)
+        working._save_base()
+        
+        saved = VectorDatabase(self.db_path, self.index.name)
+        saved._load_base()
+        saved.manifest = working.manifest
+        return saved, result
+    
+    def _publish_saved(self, saved: "VectorDatabase", merged: Tuple[Segment, ...], base_version: int,
+                       compacted: bool = False):
+        """
+        Swap in a rebuilt saved segment (with _write_lock held) and remove the logs it made redundant
+        
+        Args:
+            saved: Database returned by _rebuild_saved
+            merged: Segments whose vectors the saved segment now includes
+            base_version: _base_version when the rebuild started
+            compacted: Whether ids were reassigned, so the live segment restarts after the saved one
+        """
+        segments = self.segments[len(merged):]
+        if compacted:
+            self._deleted = saved._deleted
+            self.manifest = saved.manifest
+            segments = (self._new_segment(len(saved.index)),)
+        self._state = _IndexState(saved.index, saved.metadata, saved.lexical, saved.filter_index, segments)
+        self.generation = saved.generation
+        self._filters_saved = True
+        self.version += 1
+        # Tombstones set during the rebuild are logged but not saved yet
+        self._saved_version = self._base_version + 1 if self._base_version == base_version else self._saved_version
+        self._base_version += 1
+        for segment in merged:
+            for log in segment.logs:
+                log.remove()
+        logger.info(f"Saved index now holds {len(saved.index)} vectors; {self.live_count} in memory")
+    
+    def _shard_searcher(self):
+        """
+        Scatter-gather searcher over the saved index, started on first use
+        
+        Returns:
+            ShardedSearcher, or None to search in this process (sharding is
+            off, the index is small, or it has changes that are not saved yet)
+        """
+        if (Config.SEARCH_SHARDS <= 1 or self._shards_failed or len(self.index) < Config.SHARD_MIN_VECTORS
+                or self._base_version != self._saved_version):
+            return None
+        with self._shards_lock:
+            if self._shards is not None and self._shards.generation != self.generation:
+                # Saved again since the shards started
+                self._shards.close()
+                self._shards = None
+            if self._shards is None:
+                try:
+                    self._shards = ShardedSearcher(self.db_path)
+                except (OSError, RuntimeError) as e:
+                    logger.warning(f"Could not start search shards ({str(e)}); searching in process")
+                    self._shards_failed = True
+            return self._shards
+    
+    def close(self):
+        """Stop the search shard processes, if any were started"""
+        with self._shards_lock:
+            if self._shards is not None:
+                self._shards.close()
+                self._shards = None
+    
+    @staticmethod
+    def exists(db_path: str = None) -> bool:
+        """
+        Check whether a saved vector database exists
+        
+        Args:
+            db_path: Path of the database (uses config default if None)
+            
+        Returns:
+            True if a saved index can be loaded from db_path
+        """
+        return index_exists(db_path or Config.VECTOR_DB_PATH)
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    """Group an iterable into lists of at most `size` items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
-def create_index(documents: List[str]) -> VectorDatabase:
+def create_index(documents: List[str], metadatas: List[dict] = None) -> VectorDatabase:
     """
     Create vector index from documents
     
     Args:
         documents: List of document chunks
+        metadatas: Metadata dictionary of each chunk, e.g. from prepare_documents (optional)
         
     Returns:
         Vector database with indexed documents
@@ -171,10 +1116,28 @@ def create_index(documents: List[str]) -> VectorDatabase:
     db = VectorDatabase()
     
     # Add documents to database
-    db.add_documents(documents)
+    db.add_documents(documents, metadatas)
     
     # Save database
     db.save()
     
+    cache_stats = get_embedding_engine().cache_stats()
+    if cache_stats:
+        logger.info(f"Embedding cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses")
+    
     logger.info("Vector index creation complete")
     return db
+
+def load_index(db_path: str = None) -> VectorDatabase:
+    """
+    Load a previously saved vector index
+    
+    Args:
+        db_path: Path of the saved database (uses config default if None)
+        
+    Returns:
+        Vector database backed by the saved index
+    """
+    db = VectorDatabase(db_path)
+    db.load()
+    return db
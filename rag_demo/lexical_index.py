@@ -0,0 +1,397 @@
+import itertools
+import json
+import os
+import re
+from array import array
+from collections import Counter
+from typing import List, NamedTuple, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+from .storage import append_bytes, open_array, remove_file, write_array, write_bytes
+
+# Files written next to the vectors: the saved sizes and list of posting
+# runs, the terms (one per line, in term id order) and the document lengths
+BM25_INFO_FILE = "bm25.json"
+BM25_VOCAB_FILE = "bm25_vocab.txt"
+BM25_LENGTHS_FILE = "bm25_lengths.u32"
+# Posting runs, named by the document ids they cover
+BM25_RUN_FILE = "bm25_run-{start:010d}-{end:010d}.bin"
+BM25_RUN_PATTERN = re.compile(r"^bm25_run-\d+-\d+\.bin$")
+# Files of the single posting list format, replaced by the next save
+LEGACY_BM25_FILES = ("bm25_vocab.json", "bm25_offsets.i64", "bm25_docs.u32", "bm25_tfs.u8")
+
+# Pending postings become a posting run once they reach this many
+MERGE_MIN_POSTINGS = 1 << 20
+
+# The newest run is merged into the one before while that one holds at most
+# RUN_MERGE_RATIO times its postings, and the result stays within
+# MAX_RUN_POSTINGS; this keeps the number of runs logarithmic in the index
+# size while bounding the memory of a merge
+RUN_MERGE_RATIO = 2
+MAX_RUN_POSTINGS = 1 << 24
+
+# Words, keeping codes such as "err-404" or "v2.1" together
+TOKEN_PATTERN = re.compile(r"\w+(?:[-.]\w+)*")
+
+def tokenize(text: str) -> List[str]:
+    """
+    Split text into lowercase lexical terms
+    
+    Compound terms joined by "-" or "." are kept whole and also split into
+    their parts, so "ERR-404" matches queries for "err-404" and for "404".
+    
+    Args:
+        text: Text to tokenize
+    
+    Returns:
+        List of terms in order of appearance
+    """
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        terms.append(token)
+        if "-" in token or "." in token:
+            terms.extend(part for part in re.split(r"[-.]", token) if part)
+    return terms
+
+class _PostingRun(NamedTuple):
+    """
+    Posting lists of the documents start..end, immutable once built
+    
+    Stored in sparse CSR form: the postings of term term_ids[i] are
+    doc_ids[offsets[i]:offsets[i + 1]] (ascending) with their term
+    frequencies in tfs.
+    """
+    start: int
+    end: int
+    term_ids: np.ndarray
+    offsets: np.ndarray
+    doc_ids: np.ndarray
+    tfs: np.ndarray
+    # Name of the file in the database directory holding the run, None until saved
+    file: str = None
+    
+    def postings(self, term_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Document ids and term frequencies of a term in this run"""
+        i = int(np.searchsorted(self.term_ids, term_id))
+        if i == len(self.term_ids) or self.term_ids[i] != term_id:
+            return self.doc_ids[:0], self.tfs[:0]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.doc_ids[start:end], self.tfs[start:end]
+    
+    def expand(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(term id, doc id, tf) of every posting, ordered by term"""
+        return (np.repeat(np.asarray(self.term_ids), np.diff(self.offsets)),
+                np.asarray(self.doc_ids), np.asarray(self.tfs))
+    
+    @staticmethod
+    def build(start: int, end: int, terms: np.ndarray, doc_ids: np.ndarray, tfs: np.ndarray) -> "_PostingRun":
+        """
+        Run of postings given as (term id, doc id, tf) triples ordered by doc id
+        
+        A stable sort by term keeps every posting list ascending.
+        """
+        order = np.argsort(terms, kind="stable")
+        terms = terms[order]
+        boundaries = np.flatnonzero(np.diff(terms)) + 1
+        term_ids = terms[np.concatenate(([0], boundaries))] if len(terms) else terms
+        offsets = np.concatenate(([0], boundaries, [len(terms)])) if len(terms) else np.zeros(1)
+        return _PostingRun(start, end, term_ids.astype(np.uint32), offsets.astype(np.int64),
+                           doc_ids[order].astype(np.uint32), tfs[order].astype(np.uint8))
+    
+    @staticmethod
+    def merge(runs: List["_PostingRun"]) -> "_PostingRun":
+        """Single run holding the postings of consecutive runs"""
+        terms, doc_ids, tfs = zip(*(run.expand() for run in runs))
+        return _PostingRun.build(runs[0].start, runs[-1].end, np.concatenate(terms),
+                                 np.concatenate(doc_ids), np.concatenate(tfs))
+    
+    def to_bytes(self) -> bytes:
+        """File contents: offsets, term ids, doc ids and tfs, each 8-byte aligned at its start"""
+        return b"".join(np.ascontiguousarray(part).tobytes()
+                        for part in (self.offsets, self.term_ids, self.doc_ids, self.tfs))
+    
+    @staticmethod
+    def open(path: str, start: int, end: int, terms: int, postings: int) -> "_PostingRun":
+        """Memory-map a saved run read-only"""
+        offsets = open_array(path, np.int64, (terms + 1,))
+        position = (terms + 1) * 8
+        term_ids = open_array(path, np.uint32, (terms,), position)
+        position += terms * 4
+        doc_ids = open_array(path, np.uint32, (postings,), position)
+        position += postings * 4
+        tfs = open_array(path, np.uint8, (postings,), position)
+        return _PostingRun(start, end, term_ids, offsets, doc_ids, tfs, os.path.basename(path))
+
+class LexicalIndex:
+    """
+    Inverted index with BM25 scoring
+    
+    Postings are kept in runs over consecutive document ids, each in CSR
+    form with uint32 doc ids and uint8 term frequencies (saturated at 255),
+    i.e. 5 bytes per posting. Documents added since the last search are
+    kept in a small pending buffer and turned into a new run in one
+    vectorized pass; small runs are merged into larger ones as they
+    accumulate. Runs never change once built, so a save only writes new
+    runs and appends the new terms and document lengths, and saved runs are
+    memory-mapped read-only.
+    """
+    
+    def __init__(self, k1: float = None, b: float = None):
+        """
+        Initialize an empty lexical index
+        
+        Args:
+            k1: BM25 term frequency saturation (uses config default if None)
+            b: BM25 document length normalization (uses config default if None)
+        """
+        self.k1 = Config.BM25_K1 if k1 is None else k1
+        self.b = Config.BM25_B if b is None else b
+        
+        self.vocab = {}
+        self._runs: List[_PostingRun] = []
+        self._lengths = np.empty(0, dtype=np.uint32)
+        
+        # (term id, doc id, tf) triples and lengths of documents not yet merged
+        self._reset_pending()
+        
+        # Database directory this index was loaded from or saved to, and how
+        # many terms (and vocabulary bytes) and documents its files hold
+        self._saved_path = None
+        self._saved_terms = 0
+        self._saved_vocab_bytes = 0
+        self._saved_documents = 0
+    
+    def _reset_pending(self):
+        self._pending_terms = array("I")
+        self._pending_docs = array("I")
+        self._pending_tfs = array("B")
+        self._pending_lengths = array("I")
+    
+    def __len__(self) -> int:
+        return len(self._lengths) + len(self._pending_lengths)
+    
+    @property
+    def posting_count(self) -> int:
+        self._merge()
+        return sum(len(run.doc_ids) for run in self._runs)
+    
+    def add(self, texts: List[str]):
+        """
+        Index documents; they receive the next consecutive ids
+        
+        Args:
+            texts: Document texts
+        """
+        doc_id = len(self)
+        for text in texts:
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                term_id = self.vocab.setdefault(term, len(self.vocab))
+                self._pending_terms.append(term_id)
+                self._pending_docs.append(doc_id)
+                self._pending_tfs.append(min(tf, 255))
+            self._pending_lengths.append(len(tokens))
+            doc_id += 1
+        
+        if len(self._pending_terms) >= MERGE_MIN_POSTINGS:
+            self._merge()
+    
+    def _merge(self):
+        """Turn pending documents into a posting run, merging it with the smaller runs before it"""
+        if not self._pending_lengths:
+            return
+        
+        start = len(self._lengths)
+        lengths = np.frombuffer(self._pending_lengths, dtype=np.uint32)
+        runs = self._runs + [_PostingRun.build(
+            start, start + len(lengths),
+            np.frombuffer(self._pending_terms, dtype=np.uint32),
+            np.frombuffer(self._pending_docs, dtype=np.uint32),
+            np.frombuffer(self._pending_tfs, dtype=np.uint8)
+        )]
+        while len(runs) > 1:
+            previous, last = len(runs[-2].doc_ids), len(runs[-1].doc_ids)
+            if previous > RUN_MERGE_RATIO * last or previous + last > MAX_RUN_POSTINGS:
+                break
+            runs[-2:] = [_PostingRun.merge(runs[-2:])]
+        
+        self._runs = runs
+        self._lengths = np.concatenate((self._lengths, lengths))
+        self._reset_pending()
+        debug_log(logger, "Merged lexical index: %s terms, %s postings in %s runs",
+                  len(self.vocab), sum(len(run.doc_ids) for run in runs), len(runs))
+    
+    def _document_frequency(self, term_id: int) -> int:
+        return sum(len(run.postings(term_id)[0]) for run in self._runs)
+    
+    def search(self, query: str, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Rank documents by BM25 score for a query
+        
+        Args:
+            query: Query text
+            k: Number of results
+            allowed: Boolean mask over doc ids; False ids are never returned (optional)
+        
+        Returns:
+            Tuple of (scores, ids) arrays of the best matches, best first; only
+            documents containing at least one query term are returned
+        """
+        self._merge()
+        term_ids = sorted({self.vocab[term] for term in tokenize(query) if term in self.vocab})
+        if not term_ids or k <= 0:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        
+        n = len(self._lengths)
+        average_length = max(float(self._lengths.mean()), 1.0)
+        
+        doc_parts, score_parts = [], []
+        for term_id in term_ids:
+            postings = [run.postings(term_id) for run in self._runs]
+            doc_ids = np.concatenate([np.asarray(ids, dtype=np.int64) for ids, _ in postings])
+            tfs = np.concatenate([np.asarray(tfs, dtype=np.float32) for _, tfs in postings])
+            idf = np.log(1.0 + (n - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * self._lengths[doc_ids] / average_length)
+            doc_parts.append(doc_ids)
+            score_parts.append(idf * tfs * (self.k1 + 1.0) / (tfs + norm))
+        
+        # Sum per-term contributions of each matching document
+        candidates, inverse = np.unique(np.concatenate(doc_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        if allowed is not None:
+            keep = allowed[candidates]
+            candidates, scores = candidates[keep], scores[keep]
+        
+        k = min(k, len(candidates))
+        best = np.argpartition(-scores, k - 1)[:k] if k < len(candidates) else np.arange(len(candidates))
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return scores[best], candidates[best]
+    
+    def term_statistics(self, terms: List[str]) -> Tuple[int, int, dict]:
+        """
+        Corpus statistics of the index that BM25 needs to score documents kept elsewhere
+        
+        Args:
+            terms: Query terms
+        
+        Returns:
+            Tuple of (number of documents, total document length, mapping of
+            each term to the number of documents containing it)
+        """
+        self._merge()
+        frequencies = {}
+        for term in terms:
+            term_id = self.vocab.get(term)
+            frequencies[term] = 0 if term_id is None else self._document_frequency(term_id)
+        return len(self._lengths), int(self._lengths.sum(dtype=np.int64)), frequencies
+    
+    def remap(self, mapping: np.ndarray):
+        """
+        Renumber documents after compaction
+        
+        Args:
+            mapping: New id of each old doc id, -1 for removed documents
+        """
+        self._merge()
+        self._lengths = np.asarray(self._lengths[mapping >= 0])
+        runs = []
+        if self._runs:
+            terms, doc_ids, tfs = _PostingRun.merge(self._runs).expand()
+            new_ids = mapping[doc_ids]
+            keep = new_ids >= 0
+            runs = [_PostingRun.build(0, len(self._lengths), terms[keep], new_ids[keep], tfs[keep])]
+        self._runs = runs
+        # Every saved file describes the old ids
+        self._saved_path = None
+    
+    def save(self, db_path: str):
+        """
+        Write the vocabulary, document lengths and posting runs into a database directory
+        
+        When the files there already hold a prefix of this index (it was
+        loaded from or saved to them), only new runs are written and the new
+        terms and lengths appended; runs no longer used are removed.
+        
+        Args:
+            db_path: Vector database directory
+        """
+        self._merge()
+        vocab_path = os.path.join(db_path, BM25_VOCAB_FILE)
+        lengths_path = os.path.join(db_path, BM25_LENGTHS_FILE)
+        appending = (self._saved_path == db_path and os.path.exists(vocab_path)
+                     and os.path.exists(lengths_path))
+        
+        if appending:
+            new_terms = itertools.islice(self.vocab, self._saved_terms, None)
+            data = "".join(term + "\n" for term in new_terms).encode("utf-8")
+            append_bytes(vocab_path, data, self._saved_vocab_bytes)
+            vocab_bytes = self._saved_vocab_bytes + len(data)
+            append_bytes(lengths_path, self._lengths[self._saved_documents:].tobytes(), self._saved_documents * 4)
+        else:
+            # Terms were numbered in insertion order
+            data = "".join(term + "\n" for term in self.vocab).encode("utf-8")
+            write_bytes(vocab_path, data)
+            vocab_bytes = len(data)
+            write_array(lengths_path, self._lengths)
+        
+        runs = []
+        for run in self._runs:
+            if run.file is None or not appending:
+                run = run._replace(file=BM25_RUN_FILE.format(start=run.start, end=run.end))
+                write_bytes(os.path.join(db_path, run.file), run.to_bytes())
+            runs.append(run)
+        self._runs = runs
+        
+        used = {run.file for run in runs}
+        for name in os.listdir(db_path):
+            if (BM25_RUN_PATTERN.match(name) and name not in used) or name in LEGACY_BM25_FILES:
+                remove_file(os.path.join(db_path, name))
+        
+        info = {
+            "documents": len(self._lengths),
+            "terms": len(self.vocab),
+            "vocab_bytes": vocab_bytes,
+            "runs": [
+                {"file": run.file, "start": run.start, "end": run.end,
+                 "terms": len(run.term_ids), "postings": len(run.doc_ids)}
+                for run in runs
+            ]
+        }
+        write_bytes(os.path.join(db_path, BM25_INFO_FILE), json.dumps(info).encode("utf-8"))
+        self._saved_path, self._saved_terms = db_path, len(self.vocab)
+        self._saved_vocab_bytes, self._saved_documents = vocab_bytes, len(self._lengths)
+    
+    @staticmethod
+    def exists(db_path: str) -> bool:
+        return os.path.isfile(os.path.join(db_path, BM25_INFO_FILE))
+    
+    def load(self, db_path: str, count: int):
+        """
+        Open saved posting runs, memory-mapped read-only
+        
+        Args:
+            db_path: Vector database directory
+            count: Number of documents described by the header
+        """
+        with open(os.path.join(db_path, BM25_INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info["documents"] != count:
+            raise ValueError(f"Lexical index covers {info['documents']} documents, expected {count}")
+        
+        # The files may carry a tail from an interrupted save; the info sizes are authoritative
+        with open(os.path.join(db_path, BM25_VOCAB_FILE), "rb") as f:
+            terms = f.read(info["vocab_bytes"]).decode("utf-8").split("\n")[:-1]
+        if len(terms) != info["terms"]:
+            raise ValueError(f"Lexical vocabulary holds {len(terms)} terms, expected {info['terms']}")
+        self.vocab = {term: term_id for term_id, term in enumerate(terms)}
+        self._lengths = np.fromfile(os.path.join(db_path, BM25_LENGTHS_FILE), dtype=np.uint32, count=count)
+        if len(self._lengths) != count:
+            raise ValueError(f"Lexical index lengths cover {len(self._lengths)} documents, expected {count}")
+        self._runs = [
+            _PostingRun.open(os.path.join(db_path, run["file"]), run["start"], run["end"], run["terms"], run["postings"])
+            for run in info["runs"]
+        ]
+        self._reset_pending()
+        self._saved_path, self._saved_terms = db_path, len(terms)
+        self._saved_vocab_bytes, self._saved_documents = info["vocab_bytes"], count
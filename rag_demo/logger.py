@@ -1,7 +1,20 @@
+import atexit
 import logging
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 from .config import Config
 
+# Background thread writing queued log records (see start_queue_logging)
+_listener = None
+
+class _ThreadQueueHandler(QueueHandler):
+    """Queue handler that leaves formatting to the listener thread"""
+    
+    def prepare(self, record):
+        # Records stay in this process, so they need not be made picklable
+        return record
+
 def setup_logger():
     """Set up logger based on configuration"""
     if not Config.ENABLE_LOGGING:
@@ -33,10 +46,49 @@ def setup_logger():
     
     return logger
 
-def debug_log(logger, message):
-    """Log debug message if debug mode is enabled"""
-    if Config.DEBUG_MODE:
-        logger.debug(message)
+def start_queue_logging():
+    """
+    Move formatting and writing of log records to a background thread
+    
+    The logger's handlers are replaced by one that only enqueues records;
+    a listener thread passes them to the original handlers.
+    """
+    global _listener
+    if _listener is not None:
+        return
+    handlers = list(logger.handlers)
+    records = queue.SimpleQueue()
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(_ThreadQueueHandler(records))
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+
+def stop_queue_logging():
+    """Write out queued records and restore the original handlers"""
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    for handler in _listener.handlers:
+        logger.addHandler(handler)
+    _listener = None
+
+def debug_log(logger, message, *args):
+    """
+    Log debug message if debug mode is enabled
+    
+    The message is %-formatted with args only when it is actually emitted,
+    so callers should pass values as args rather than pre-formatting them.
+    """
+    if Config.DEBUG_MODE and logger.isEnabledFor(logging.DEBUG):
+        logger.debug(message, *args)
 
 # Initialize logger
 logger = setup_logger()
+
+if Config.LOG_QUEUE and Config.ENABLE_LOGGING:
+    start_queue_logging()
+    atexit.register(stop_queue_logging)
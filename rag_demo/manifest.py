@@ -0,0 +1,223 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .storage import write_bytes
+
+MANIFEST_FILE = "manifest.json"
+
+def id_ranges(ids) -> List[List[int]]:
+    """
+    Compress vector ids into ranges
+    
+    Args:
+        ids: Vector ids, ascending
+    
+    Returns:
+        List of [start, end) ranges; the chunks of a file get consecutive
+        ids, so this is usually a single range
+    """
+    ids = np.asarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return []
+    breaks = np.flatnonzero(np.diff(ids) != 1) + 1
+    starts = ids[np.concatenate(([0], breaks))]
+    ends = ids[np.concatenate((breaks - 1, [len(ids) - 1]))] + 1
+    return [[int(start), int(end)] for start, end in zip(starts, ends)]
+
+def range_ids(ranges: List[List[int]]) -> List[int]:
+    """Vector ids of ranges made by id_ranges"""
+    return [i for start, end in ranges for i in range(start, end)]
+
+def _upgrade_record(record: dict) -> dict:
+    """Record with its ids as ranges; manifests and logs of earlier versions list every id"""
+    if "ids" in record:
+        record = dict(record)
+        record["id_ranges"] = id_ranges(record.pop("ids"))
+    return record
+
+def file_sha256(path: str) -> str:
+    """
+    Hash a file's contents
+    
+    Args:
+        path: File to hash
+    
+    Returns:
+        Hex SHA-256 digest
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class IndexManifest:
+    """
+    Record of the source files behind a vector database
+    
+    For every indexed file the manifest keeps its mtime, size and content
+    hash plus the ids of the vectors created from it (as id ranges, see
+    id_ranges), so a later sync can re-embed only new or changed files and
+    tombstone vectors of changed or deleted ones.
+    """
+    
+    def __init__(self, files: Dict[str, dict] = None, generation: int = 0):
+        """
+        Initialize manifest
+        
+        Args:
+            files: Mapping of file path to its record (optional)
+            generation: Database save generation this manifest belongs to
+        """
+        self.files = files or {}
+        self.generation = generation
+    
+    @classmethod
+    def load(cls, db_path: str) -> "IndexManifest":
+        """
+        Load the manifest saved in a database directory
+        
+        Args:
+            db_path: Vector database directory
+        
+        Returns:
+            Saved manifest, or an empty one if none exists
+        """
+        path = os.path.join(db_path, MANIFEST_FILE)
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        files = {path: _upgrade_record(record) for path, record in data.get("files", {}).items()}
+        return cls(files, data.get("generation", 0))
+    
+    def save(self, db_path: str):
+        """
+        Atomically save the manifest into a database directory
+        
+        Args:
+            db_path: Vector database directory
+        """
+        data = {"generation": self.generation, "files": self.files}
+        write_bytes(os.path.join(db_path, MANIFEST_FILE),
+                    json.dumps(data, separators=(",", ":")).encode("utf-8"))
+        debug_log(logger, "Saved manifest of %s files", len(self.files))
+    
+    def diff(self, current: Dict[str, os.stat_result]) -> Tuple[List[Tuple[str, str]], List[Tuple[str, str]], List[str]]:
+        """
+        Compare the files on disk with the manifest
+        
+        Files whose mtime and size are unchanged are assumed unchanged without
+        reading them; otherwise the content hash decides, so touching a file
+        without editing it does not trigger a re-embed.
+        
+        Args:
+            current: Mapping of file path to its stat result
+        
+        Returns:
+            Tuple of (added, changed, removed) where added and changed are
+            lists of (path, sha256) and removed is a list of paths
+        """
+        added, changed = [], []
+        for path, stat in current.items():
+            record = self.files.get(path)
+            if record and record["mtime_ns"] == stat.st_mtime_ns and record["size"] == stat.st_size:
+                continue
+            
+            sha256 = file_sha256(path)
+            if record is None:
+                added.append((path, sha256))
+            elif record["sha256"] != sha256:
+                changed.append((path, sha256))
+            else:
+                # Touched but identical; remember the new stat to skip hashing next time
+                record["mtime_ns"], record["size"] = stat.st_mtime_ns, stat.st_size
+        
+        removed = [path for path in self.files if path not in current]
+        return added, changed, removed
+    
+    def record(self, path: str, stat: os.stat_result, sha256: str, ids: List[int]):
+        """
+        Record an indexed file
+        
+        Args:
+            path: File path
+            stat: File stat at indexing time
+            sha256: Content hash
+            ids: Ids of the vectors created from the file
+        """
+        self.files[path] = self.entry(stat, sha256, ids)
+    
+    @staticmethod
+    def entry(stat: os.stat_result, sha256: str, ids: List[int]) -> dict:
+        """
+        Manifest record of an indexed file, see record()
+        
+        Returns:
+            Dictionary with the file's mtime, size, content hash and vector id ranges
+        """
+        return {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "sha256": sha256,
+            "id_ranges": id_ranges(ids)
+        }
+    
+    def ids(self, path: str) -> List[int]:
+        """
+        Ids of the vectors created from a file
+        
+        Args:
+            path: Indexed file path
+        
+        Returns:
+            Vector ids, ascending
+        """
+        return range_ids(self.files[path]["id_ranges"])
+    
+    def max_id(self) -> int:
+        """Largest vector id of any indexed file, or -1 if there is none"""
+        return max((record["id_ranges"][-1][1] - 1 for record in self.files.values() if record["id_ranges"]), default=-1)
+    
+    def apply(self, changes: Dict[str, Optional[dict]]):
+        """
+        Record and forget files in one step
+        
+        Args:
+            changes: Mapping of file path to its new record, or None to forget the file
+        """
+        for path, entry in changes.items():
+            if entry is None:
+                self.files.pop(path, None)
+            else:
+                self.files[path] = _upgrade_record(entry)
+    
+    def copy(self) -> "IndexManifest":
+        """Copy whose records can be changed without affecting this manifest"""
+        return IndexManifest({path: dict(record) for path, record in self.files.items()}, self.generation)
+    
+    def remove(self, path: str) -> List[int]:
+        """
+        Forget a file
+        
+        Args:
+            path: File path
+        
+        Returns:
+            Ids of the vectors that were created from the file
+        """
+        return range_ids(self.files.pop(path)["id_ranges"])
+    
+    def remap(self, mapping):
+        """
+        Rewrite vector ids after compaction
+        
+        Args:
+            mapping: Array mapping old id to new id (-1 for removed vectors)
+        """
+        for record in self.files.values():
+            ids = mapping[np.asarray(range_ids(record["id_ranges"]), dtype=np.int64)]
+            record["id_ranges"] = id_ranges(ids[ids >= 0])
@@ -0,0 +1,298 @@
+import itertools
+import json
+import os
+from array import array
+from collections import OrderedDict
+from typing import Dict, List
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+from .storage import RowBuffer, append_bytes, remove_file, write_bytes
+
+# Files written next to the vectors: the saved fields and sizes, the distinct
+# values ([field position, value] per line, in code order) and one row of
+# int32 value codes per vector
+FILTER_INFO_FILE = "filter.json"
+FILTER_VALUES_FILE = "filter_values.jsonl"
+FILTER_CODES_FILE = "filter_codes.i32"
+# Value dictionary of the column-per-field format, replaced by the next save
+LEGACY_FILTER_VALUES_FILE = "filter_values.json"
+
+# Code of a vector whose metadata has no (scalar) value for a field
+MISSING = -1
+
+# Filter masks kept for repeated filters, until the next insert
+MASK_CACHE_SIZE = 32
+
+FILTER_VALUE_TYPES = (str, int, float, bool)
+
+def normalize_filters(filters: dict) -> Dict[str, list]:
+    """
+    Validate a filter expression and bring it into canonical form
+    
+    A filter maps metadata fields to a value, or to a list of accepted
+    values. A vector matches when every field matches (AND), and a field
+    matches when its value equals any of the listed values (OR).
+    
+    Args:
+        filters: Filter expression, e.g. {"collection": ["manuals", "faq"], "filename": "setup.txt"}
+    
+    Returns:
+        Mapping of field name to a list of accepted values
+    """
+    if not isinstance(filters, dict):
+        raise ValueError("filters must be an object mapping metadata fields to values")
+    normalized = {}
+    for field, values in filters.items():
+        if not isinstance(values, (list, tuple)):
+            values = [values]
+        for value in values:
+            if not isinstance(value, FILTER_VALUE_TYPES):
+                raise ValueError(f"Filter values of {field!r} must be strings, numbers or booleans")
+        normalized[str(field)] = list(values)
+    return normalized
+
+def _value_key(value) -> str:
+    """Dictionary key of a metadata value; values of different types ("1", 1, true) never match"""
+    return json.dumps(value, ensure_ascii=False)
+
+def metadata_mask(filters: dict, metadatas: List[dict]) -> np.ndarray:
+    """
+    Evaluate a filter expression directly over metadata dictionaries
+    
+    Used for the few vectors not yet in a MetadataIndex; matches exactly
+    what MetadataIndex.mask would.
+    
+    Args:
+        filters: Filter expression, see normalize_filters
+        metadatas: Metadata dictionaries, one per vector
+    
+    Returns:
+        Boolean array, True where the metadata matches
+    """
+    mask = np.ones(len(metadatas), dtype=bool)
+    for field, values in normalize_filters(filters).items():
+        wanted = {_value_key(value) for value in values}
+        mask &= np.fromiter(
+            (isinstance(meta.get(field), FILTER_VALUE_TYPES) and _value_key(meta.get(field)) in wanted
+             for meta in metadatas),
+            dtype=bool, count=len(metadatas)
+        )
+    return mask
+
+class MetadataIndex:
+    """
+    Columnar index of the metadata fields that searches can filter on
+    
+    Every field in FILTER_FIELDS is stored as a column of int32 value codes,
+    one per vector id, with a dictionary from each distinct value to its
+    code. Codes are assigned at insert time, so evaluating a filter is a
+    vectorized comparison per field over the columns, giving a boolean mask
+    over vector ids that the vector and lexical indexes apply before scoring.
+    Masks are cached per filter until the next insert.
+    
+    The codes of a vector are stored as one row, so new vectors and new
+    values are appended to the saved files and the saved codes stay
+    memory-mapped, like the vectors.
+    """
+    
+    def __init__(self, fields: List[str] = None):
+        """
+        Initialize an empty metadata index
+        
+        Args:
+            fields: Metadata fields to index (uses config default if None)
+        """
+        self.fields = list(Config.FILTER_FIELDS if fields is None else fields)
+        self.values = {field: {} for field in self.fields}
+        # One row of codes per vector, in the order of fields, and the rows not yet appended
+        self._codes = RowBuffer(np.int32, len(self.fields))
+        self._pending = array("i")
+        self._count = 0
+        self._masks = OrderedDict()
+        
+        # Database directory this index was loaded from or saved to, the
+        # number of values of each field its files hold and their size
+        self._saved_path = None
+        self._saved_values = [0] * len(self.fields)
+        self._saved_values_bytes = 0
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    def add(self, metadatas: List[dict]):
+        """
+        Index the filterable fields of new vectors; they receive the next consecutive ids
+        
+        Args:
+            metadatas: Metadata dictionaries, one per vector
+        """
+        for meta in metadatas:
+            for field in self.fields:
+                value = meta.get(field)
+                if isinstance(value, FILTER_VALUE_TYPES):
+                    codes = self.values[field]
+                    self._pending.append(codes.setdefault(_value_key(value), len(codes)))
+                else:
+                    self._pending.append(MISSING)
+        self._count += len(metadatas)
+        self._masks.clear()
+    
+    def _merge(self):
+        """Append pending code rows"""
+        if not self._pending:
+            return
+        self._codes.append(np.frombuffer(self._pending, dtype=np.int32).reshape(-1, len(self.fields)))
+        self._pending = array("i")
+    
+    def _column(self, field: str) -> np.ndarray:
+        """Codes of a field, one per vector id"""
+        return self._codes.data[:, self.fields.index(field)]
+    
+    def mask(self, filters: dict) -> np.ndarray:
+        """
+        Evaluate a filter expression over all indexed vectors
+        
+        Args:
+            filters: Filter expression, see normalize_filters
+        
+        Returns:
+            Boolean array over vector ids, True where the metadata matches
+        """
+        filters = normalize_filters(filters)
+        for field in filters:
+            if field not in self.values:
+                raise ValueError(f"Cannot filter on {field!r}; filterable fields (FILTER_FIELDS): {', '.join(self.fields)}")
+        
+        key = json.dumps(filters, sort_keys=True, ensure_ascii=False)
+        cached = self._masks.get(key)
+        if cached is not None:
+            self._masks.move_to_end(key)
+            return cached
+        
+        self._merge()
+        mask = np.ones(self._count, dtype=bool)
+        for field, values in filters.items():
+            column = self._column(field)
+            codes = self.values[field]
+            wanted = sorted({codes[_value_key(value)] for value in values if _value_key(value) in codes})
+            if not wanted:
+                mask[:] = False
+            elif len(wanted) == 1:
+                mask &= column == wanted[0]
+            else:
+                mask &= np.isin(column, wanted)
+        
+        self._masks[key] = mask
+        if len(self._masks) > MASK_CACHE_SIZE:
+            self._masks.popitem(last=False)
+        debug_log(logger, "Filter %s matches %s of %s vectors", key, int(mask.sum()), len(mask))
+        return mask
+    
+    def remap(self, mapping: np.ndarray):
+        """
+        Renumber vectors after compaction
+        
+        Args:
+            mapping: New id of each old vector id, -1 for removed vectors
+        """
+        self._merge()
+        codes = RowBuffer(np.int32, len(self.fields))
+        codes.append(self._codes.data[mapping[:len(self._codes)] >= 0])
+        self._codes = codes
+        self._count = int(np.count_nonzero(mapping >= 0))
+        self._masks.clear()
+        # The saved codes describe the old ids
+        self._saved_path = None
+    
+    def shard(self, start: int, end: int) -> "MetadataIndex":
+        """
+        Metadata index over the id range start..end, renumbered from 0
+        
+        The value dictionaries are shared and the columns are sliced without
+        copying, like VectorIndex.shard.
+        
+        Args:
+            start: First vector id
+            end: Vector id after the last one
+        
+        Returns:
+            MetadataIndex whose local id i is vector start + i
+        """
+        self._merge()
+        shard = MetadataIndex(self.fields)
+        shard.values = self.values
+        shard._codes = self._codes.view(start, end)
+        shard._count = max(0, min(end, self._count) - start)
+        return shard
+    
+    def save(self, db_path: str):
+        """
+        Write the value dictionaries and code rows into a database directory
+        
+        When the files there already hold a prefix of this index (it was
+        loaded from or saved to them), only the new values and rows are
+        appended.
+        
+        Args:
+            db_path: Vector database directory
+        """
+        self._merge()
+        values_path = os.path.join(db_path, FILTER_VALUES_FILE)
+        appending = self._saved_path == db_path and os.path.exists(values_path)
+        
+        # Value keys are JSON, and codes were assigned in insertion order
+        lines = []
+        for position, field in enumerate(self.fields):
+            start = self._saved_values[position] if appending else 0
+            lines.extend(f"[{position},{value_key}]\n" for value_key in itertools.islice(self.values[field], start, None))
+        data = "".join(lines).encode("utf-8")
+        if appending:
+            append_bytes(values_path, data, self._saved_values_bytes)
+            values_bytes = self._saved_values_bytes + len(data)
+        else:
+            write_bytes(values_path, data)
+            values_bytes = len(data)
+        self._codes.save(os.path.join(db_path, FILTER_CODES_FILE))
+        
+        if os.path.exists(os.path.join(db_path, LEGACY_FILTER_VALUES_FILE)):
+            remove_file(os.path.join(db_path, LEGACY_FILTER_VALUES_FILE))
+        info = {"fields": self.fields, "count": self._count, "values_bytes": values_bytes}
+        write_bytes(os.path.join(db_path, FILTER_INFO_FILE), json.dumps(info, ensure_ascii=False).encode("utf-8"))
+        self._saved_path, self._saved_values_bytes = db_path, values_bytes
+        self._saved_values = [len(self.values[field]) for field in self.fields]
+    
+    @staticmethod
+    def exists(db_path: str) -> bool:
+        return os.path.isfile(os.path.join(db_path, FILTER_INFO_FILE))
+    
+    def load(self, db_path: str, count: int):
+        """
+        Open saved code rows, memory-mapped read-only
+        
+        Args:
+            db_path: Vector database directory
+            count: Number of vectors described by the header
+        """
+        with open(os.path.join(db_path, FILTER_INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        if info["fields"] != self.fields:
+            raise ValueError(f"Metadata index covers fields {info['fields']}, FILTER_FIELDS is {self.fields}")
+        if info["count"] != count:
+            raise ValueError(f"Metadata index does not cover the expected {count} vectors")
+        
+        # The files may carry a tail from an interrupted save; the info sizes are authoritative
+        self.values = {field: {} for field in self.fields}
+        with open(os.path.join(db_path, FILTER_VALUES_FILE), "rb") as f:
+            lines = f.read(info["values_bytes"]).decode("utf-8").split("\n")[:-1]
+        for line in lines:
+            # Lines are "[position,value key]" as written by save()
+            position, _, value_key = line[1:-1].partition(",")
+            codes = self.values[self.fields[int(position)]]
+            codes[value_key] = len(codes)
+        self._codes = RowBuffer.open(os.path.join(db_path, FILTER_CODES_FILE), np.int32, count, len(self.fields))
+        self._pending = array("i")
+        self._count = count
+        self._masks.clear()
+        self._saved_path, self._saved_values_bytes = db_path, info["values_bytes"]
+        self._saved_values = [len(self.values[field]) for field in self.fields]
@@ -0,0 +1,272 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, Tuple
+from .logger import logger
+from .config import Config
+
+# Histogram bucket upper bounds for durations (seconds) and for sizes and token counts
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Shared no-op context manager returned while metrics are disabled
+_NULL_CONTEXT = contextlib.nullcontext()
+
+# Per-query record collecting stage durations and values for the JSONL sink
+_current_trace = contextvars.ContextVar("rag_trace", default=None)
+
+class Histogram:
+    """Cumulative histogram with fixed bucket bounds, in the Prometheus model"""
+    
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """
+    Process-wide counters and histograms of pipeline stages
+    
+    Stage durations are recorded with `timer`, sizes and token counts with
+    `observe` and events such as cache hits with `increment`. Metrics are
+    keyed by name plus labels and exported in the Prometheus text format.
+    Inside `trace`, the same calls are also collected into one record per
+    query or indexing run and appended to METRICS_JSONL_PATH.
+    
+    While disabled every call returns immediately (timer returns a shared
+    no-op context manager), so instrumentation can stay in hot paths.
+    """
+    
+    def __init__(self, enabled: bool = None, jsonl_path: str = None):
+        """
+        Initialize metrics registry
+        
+        Args:
+            enabled: Whether to record metrics (uses config default if None)
+            jsonl_path: File receiving one JSON record per trace, "" for none (uses config default if None)
+        """
+        self.enabled = Config.METRICS_ENABLED if enabled is None else enabled
+        self.jsonl_path = Config.METRICS_JSONL_PATH if jsonl_path is None else jsonl_path
+        
+        self._histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self._counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+        self._lock = threading.Lock()
+        self._sink_lock = threading.Lock()
+    
+    @staticmethod
+    def _key(name: str, labels: dict) -> Tuple[str, tuple]:
+        return name, tuple(sorted(labels.items()))
+    
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = SIZE_BUCKETS, **labels):
+        """
+        Record a value in a histogram
+        
+        Args:
+            name: Metric name
+            value: Observed value
+            buckets: Bucket bounds used when the histogram is created
+            **labels: Label values identifying the series
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+        
+        trace = _current_trace.get()
+        if trace is not None:
+            series = name if not labels else f"{name}:{','.join(str(v) for _, v in key[1])}"
+            trace["values"][series] = trace["values"].get(series, 0) + value
+    
+    def increment(self, name: str, value: float = 1, **labels):
+        """
+        Add to a counter
+        
+        Args:
+            name: Metric name
+            value: Amount to add
+            **labels: Label values identifying the series
+        """
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+        
+        trace = _current_trace.get()
+        if trace is not None:
+            series = name if not labels else f"{name}:{','.join(str(v) for _, v in key[1])}"
+            trace["counts"][series] = trace["counts"].get(series, 0) + value
+    
+    def timer(self, stage: str):
+        """
+        Context manager recording the duration of a pipeline stage
+        
+        Args:
+            stage: Stage name, exported as the "stage" label of rag_stage_duration_seconds
+        
+        Returns:
+            Context manager
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._time(stage)
+    
+    @contextlib.contextmanager
+    def _time(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_duration(stage, time.perf_counter() - start)
+    
+    def record_duration(self, stage: str, seconds: float):
+        """
+        Record a stage duration measured by the caller, e.g. across a stream
+        
+        Args:
+            stage: Stage name
+            seconds: Duration in seconds
+        """
+        if not self.enabled:
+            return
+        key = self._key("rag_stage_duration_seconds", {"stage": stage})
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(DURATION_BUCKETS)
+            histogram.observe(seconds)
+        trace = _current_trace.get()
+        if trace is not None:
+            trace["stages"][stage] = trace["stages"].get(stage, 0.0) + seconds
+    
+    def trace(self, kind: str, **fields):
+        """
+        Context manager collecting the metrics of one query or indexing run
+        
+        Args:
+            kind: Record type, e.g. "query" or "index"
+            **fields: Extra fields stored in the record
+        
+        Returns:
+            Context manager yielding the record dictionary (None while disabled)
+        """
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._trace(kind, fields)
+    
+    @contextlib.contextmanager
+    def _trace(self, kind: str, fields: dict) -> Iterator[dict]:
+        record = {"time": time.time(), "kind": kind, **fields, "stages": {}, "values": {}, "counts": {}}
+        token = _current_trace.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["duration"] = time.perf_counter() - start
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # Generators may be finished from another context
+                pass
+            self.observe("rag_request_duration_seconds", record["duration"], DURATION_BUCKETS, kind=kind)
+            self._write_record(record)
+    
+    def _write_record(self, record: dict):
+        """Append a trace record to the JSONL sink"""
+        if not self.jsonl_path:
+            return
+        line = json.dumps(record, default=str) + "\n"
+        try:
+            with self._sink_lock, open(self.jsonl_path, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError as e:
+            logger.warning(f"Could not write metrics record to {self.jsonl_path}: {str(e)}")
+    
+    def reset(self):
+        """Drop all recorded metrics"""
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+    
+    def snapshot(self) -> dict:
+        """
+        Current metric values
+        
+        Returns:
+            Dictionary with "counters" ({series: value}) and "histograms"
+            ({series: {"count", "sum", "mean"}}); series are "name{label=value,...}"
+        """
+        with self._lock:
+            counters = {_series(name, labels): value for (name, labels), value in self._counters.items()}
+            histograms = {
+                _series(name, labels): {
+                    "count": h.count, "sum": h.sum, "mean": h.sum / h.count if h.count else 0.0
+                }
+                for (name, labels), h in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+    
+    def log_summary(self):
+        """Log the call count and mean duration of every timed stage"""
+        if not self.enabled:
+            return
+        with self._lock:
+            stages = sorted(
+                (dict(labels)["stage"], histogram.count, histogram.sum)
+                for (name, labels), histogram in self._histograms.items()
+                if name == "rag_stage_duration_seconds"
+            )
+        for stage, count, total in stages:
+            logger.info(f"Stage {stage}: {count} calls, mean {total / count * 1000:.1f} ms")
+    
+    def render_prometheus(self) -> str:
+        """
+        Export all metrics in the Prometheus text exposition format
+        
+        Returns:
+            Exposition text
+        """
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (series_name, labels), value in sorted(self._counters.items()):
+                    if series_name == name:
+                        lines.append(f"{_series(name, labels)} {value:g}")
+            
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (series_name, labels), histogram in sorted(self._histograms.items(), key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f"{_series(name + '_bucket', labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{_series(name + '_sum', labels)} {histogram.sum:g}")
+                    lines.append(f"{_series(name + '_count', labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def _series(name: str, labels: tuple) -> str:
+    """Prometheus series name with its labels"""
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+# Registry shared by the whole process
+metrics = MetricsRegistry()
@@ -0,0 +1,260 @@
+import asyncio
+import contextlib
+import threading
+import weakref
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Hashable, Iterator, Tuple
+from .logger import logger, debug_log
+from .config import Config
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    import openai
+
+# Kinds of endpoint configured in Config: INDEX_LLM_* (embeddings) and CHAT_LLM_* (chat)
+PROVIDER_KINDS = ("index", "chat")
+
+# Retries done by the OpenAI client itself by default (openai.DEFAULT_MAX_RETRIES)
+DEFAULT_MAX_RETRIES = 2
+
+# The openai package (and its HTTP client) takes about half a second to import,
+# so it is imported when the first client is created rather than at startup
+
+def _httpx():
+    """The HTTP client package of the installed openai release"""
+    try:
+        import httpx
+    except ImportError:  # openai releases built on the httpx2 fork
+        import httpx2 as httpx
+    return httpx
+
+def retryable_errors() -> tuple:
+    """
+    OpenAI client errors worth retrying with backoff
+    
+    Only called from an except clause, which evaluates it once a request
+    has failed, so openai is already imported.
+    
+    Returns:
+        Tuple of exception classes (rate limits, connection and server errors)
+    """
+    import openai
+    return (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+def import_client_library():
+    """Import openai ahead of the first API call, e.g. from a background thread while the user types"""
+    import openai
+
+class LLMProvider:
+    """
+    Long-lived API clients of one LLM endpoint, shared by every request to it
+    
+    Clients are created once and keep their HTTP connections alive between
+    requests, so TCP and TLS setup is paid once per connection rather than
+    once per call. The async client is created per event loop, since its
+    connection pool belongs to the loop that opened it. The number of
+    requests in flight is limited by a semaphore for threads and one per
+    event loop, and the connection pool is sized to match the limit.
+    Identical concurrent requests can share one call with coalesce/acoalesce.
+    """
+    
+    def __init__(self, kind: str, api_key: str, api_base: str, max_concurrency: int,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        """
+        Initialize a provider; clients are created on first use
+        
+        Args:
+            kind: Endpoint kind, see PROVIDER_KINDS (used in metrics and logs)
+            api_key: API key
+            api_base: API base URL
+            max_concurrency: Maximum requests in flight
+            max_retries: Retries done by the OpenAI client itself
+        """
+        self.kind = kind
+        self.api_key = api_key
+        self.api_base = api_base
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_retries = max_retries
+        
+        self._client = None
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._inflight = {}
+        self._async_inflight = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+    
+    def _pool_options(self) -> dict:
+        """Connection pool and timeout settings of the HTTP clients"""
+        httpx = _httpx()
+        return {
+            "limits": httpx.Limits(
+                max_connections=self.max_concurrency,
+                max_keepalive_connections=self.max_concurrency,
+                keepalive_expiry=Config.LLM_KEEPALIVE_SECONDS
+            ),
+            "timeout": httpx.Timeout(Config.LLM_TIMEOUT_SECONDS, connect=Config.LLM_CONNECT_TIMEOUT_SECONDS)
+        }
+    
+    @property
+    def client(self) -> "openai.OpenAI":
+        """Pooled OpenAI client, safe to share between threads"""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    import openai
+                    debug_log(logger, "Opening %s client for %s", self.kind, self.api_base)
+                    self._client = openai.OpenAI(
+                        api_key=self.api_key,
+                        base_url=self.api_base,
+                        max_retries=self.max_retries,
+                        http_client=openai.DefaultHttpxClient(**self._pool_options())
+                    )
+        return self._client
+    
+    @property
+    def async_client(self) -> "openai.AsyncOpenAI":
+        """Pooled async OpenAI client of the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import openai
+            client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_base,
+                max_retries=self.max_retries,
+                http_client=openai.DefaultAsyncHttpxClient(**self._pool_options())
+            )
+            self._async_clients[loop] = client
+        return client
+    
+    @contextlib.contextmanager
+    def limit(self) -> Iterator[None]:
+        """Hold one of the provider's request slots, waiting for one if all are taken"""
+        with self._semaphore:
+            yield
+    
+    @contextlib.asynccontextmanager
+    async def alimit(self) -> AsyncIterator[None]:
+        """Async version of limit, for requests made from the running event loop"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        async with semaphore:
+            yield
+    
+    def coalesce(self, key: Hashable, call: Callable[[], object]):
+        """
+        Run a call, or wait for the identical call another thread is running
+        
+        Args:
+            key: Identity of the request (e.g. model and inputs)
+            call: Function performing the request
+        
+        Returns:
+            Result of the call; its exception is raised in every waiting caller
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            metrics.increment("rag_llm_coalesced_requests_total", provider=self.kind)
+            return future.result()
+        
+        try:
+            result = call()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+    
+    async def acoalesce(self, key: Hashable, call: Callable[[], Awaitable]):
+        """
+        Async version of coalesce, sharing identical requests within the running event loop
+        
+        The request runs as its own task, so a caller that is cancelled does
+        not cancel it for the others waiting on it.
+        
+        Args:
+            key: Identity of the request (e.g. model and inputs)
+            call: Coroutine function performing the request
+        
+        Returns:
+            Result of the call; its exception is raised in every waiting caller
+        """
+        loop = asyncio.get_running_loop()
+        inflight = self._async_inflight.setdefault(loop, {})
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = loop.create_task(call())
+            task.add_done_callback(lambda done: self._forget_task(inflight, key, done))
+        else:
+            metrics.increment("rag_llm_coalesced_requests_total", provider=self.kind)
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    def _forget_task(inflight: dict, key: Hashable, task: asyncio.Task):
+        """Remove a finished request; its error is retrieved so an unawaited one is not reported"""
+        if inflight.get(key) is task:
+            del inflight[key]
+        if not task.cancelled():
+            task.exception()
+    
+    def close(self):
+        """Close the pooled connections of the thread-safe client"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+                self._client = None
+        # Async clients belong to their event loops and are released with them
+        self._async_clients = weakref.WeakKeyDictionary()
+
+_providers: Dict[Tuple[str, str, str], LLMProvider] = {}
+_providers_lock = threading.Lock()
+
+def _provider_settings(kind: str) -> Tuple[str, str, int, int]:
+    """API key, base URL, concurrency limit and client retries of an endpoint kind"""
+    if kind == "index":
+        # Embedding requests are retried by EmbeddingEngine, so backoff covers whole batches
+        return Config.INDEX_LLM_API_KEY, Config.INDEX_LLM_API_BASE, Config.INDEX_LLM_MAX_CONCURRENCY, 0
+    if kind == "chat":
+        return Config.CHAT_LLM_API_KEY, Config.CHAT_LLM_API_BASE, Config.CHAT_LLM_MAX_CONCURRENCY, DEFAULT_MAX_RETRIES
+    raise ValueError(f"Unknown LLM provider kind: {kind!r} (expected one of {', '.join(PROVIDER_KINDS)})")
+
+def get_provider(kind: str) -> LLMProvider:
+    """
+    Get the shared provider of an endpoint kind, as currently configured
+    
+    Providers are kept per API key and base URL, so changing those settings
+    at runtime switches to a new provider instead of reusing stale clients.
+    
+    Args:
+        kind: "index" for INDEX_LLM_* (embeddings) or "chat" for CHAT_LLM_* (chat completions)
+    
+    Returns:
+        LLMProvider configured from Config
+    """
+    api_key, api_base, max_concurrency, max_retries = _provider_settings(kind)
+    key = (kind, api_key, api_base)
+    provider = _providers.get(key)
+    if provider is None:
+        with _providers_lock:
+            provider = _providers.get(key)
+            if provider is None:
+                provider = _providers[key] = LLMProvider(kind, api_key, api_base, max_concurrency, max_retries)
+    return provider
+
+def close_providers():
+    """Close the connections of every provider; later requests open new clients"""
+    with _providers_lock:
+        providers = list(_providers.values())
+        _providers.clear()
+    for provider in providers:
+        provider.close()
@@ -0,0 +1,258 @@
+import numpy as np
+from .logger import logger, debug_log
+
+class VectorCodec:
+    """
+    Interface of vector compression codecs used by CompressedIndex
+    
+    A codec turns float32 vectors into fixed-width rows of `code_dtype` and
+    scores queries directly against codes (asymmetric distance computation:
+    queries are never quantized).
+    """
+    
+    # Name recorded in the saved header and used by VECTOR_DB_TYPE
+    name = None
+    code_dtype = None
+    
+    def __init__(self, dim: int):
+        self.dim = dim
+    
+    @property
+    def code_width(self) -> int:
+        """Elements of `code_dtype` per encoded vector"""
+        return self.dim
+    
+    @property
+    def is_trained(self) -> bool:
+        return True
+    
+    def train(self, sample: np.ndarray, rng: np.random.Generator):
+        """
+        Learn codec parameters
+        
+        Args:
+            sample: Normalized float32 training vectors of shape (n, dim)
+            rng: Random generator
+        """
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """Encode float32 vectors of shape (n, dim) into codes of shape (n, code_width)"""
+        raise NotImplementedError
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """Approximate float32 vectors of shape (n, dim) from codes"""
+        raise NotImplementedError
+    
+    def prepare(self, queries: np.ndarray):
+        """Per-query state reused across all blocks of codes scored by score()"""
+        return queries
+    
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        """
+        Approximate inner products of the queries with encoded vectors
+        
+        Args:
+            prepared: Result of prepare() for the queries
+            codes: Codes of shape (n, code_width)
+        
+        Returns:
+            Float32 array of shape (num_queries, n)
+        """
+        raise NotImplementedError
+    
+    def state(self) -> np.ndarray:
+        """Trained parameters as a flat float32 array"""
+        return np.empty(0, dtype=np.float32)
+    
+    def load_state(self, state: np.ndarray):
+        """Restore parameters saved by state()"""
+
+class Float16Codec(VectorCodec):
+    """Half-precision storage; halves memory with negligible loss in ranking"""
+    
+    name = "fp16"
+    code_dtype = np.float16
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        return np.asarray(vectors, dtype=np.float16)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.asarray(codes, dtype=np.float32)
+    
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        return prepared @ codes.astype(np.float32).T
+
+class ScalarInt8Codec(VectorCodec):
+    """
+    Per-dimension 8-bit scalar quantization (4x smaller than float32)
+    
+    Each dimension is mapped linearly from its trained [min, max] range onto
+    0..255. Inner products are computed asymmetrically: the query stays in
+    float32 and q . x ~= (q * scale) . codes + q . min.
+    """
+    
+    name = "sq8"
+    code_dtype = np.uint8
+    
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self.vmin = None
+        self.scale = None
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.vmin is not None
+    
+    def train(self, sample: np.ndarray, rng: np.random.Generator):
+        self.vmin = sample.min(axis=0).astype(np.float32)
+        vmax = sample.max(axis=0).astype(np.float32)
+        self.scale = np.maximum(vmax - self.vmin, 1e-12) / 255
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.vmin) / self.scale)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return codes.astype(np.float32) * self.scale + self.vmin
+    
+    def prepare(self, queries: np.ndarray):
+        return queries * self.scale, queries @ self.vmin
+    
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        scaled, bias = prepared
+        return scaled @ codes.astype(np.float32).T + bias[:, None]
+    
+    def state(self) -> np.ndarray:
+        return np.concatenate((self.vmin, self.scale))
+    
+    def load_state(self, state: np.ndarray):
+        self.vmin, self.scale = state[:self.dim].copy(), state[self.dim:].copy()
+
+class ProductQuantizer(VectorCodec):
+    """
+    Product quantization: one byte per subvector
+    
+    Vectors are split into `m` subvectors, each replaced by the id of its
+    nearest of 256 centroids learned for that subspace. A query is scored by
+    asymmetric distance computation: a (m, 256) table of inner products
+    between the query's subvectors and every centroid is built once, and a
+    code's score is the sum of its m table entries.
+    """
+    
+    name = "pq"
+    code_dtype = np.uint8
+    
+    # Centroids per subspace, so codes fit one byte
+    KSUB = 256
+    
+    def __init__(self, dim: int, m: int):
+        """
+        Initialize an untrained product quantizer
+        
+        Args:
+            dim: Vector dimension
+            m: Number of subvectors; lowered to the largest divisor of dim
+        """
+        super().__init__(dim)
+        m = max(1, min(m, dim))
+        while dim % m:
+            m -= 1
+        self.m = m
+        self.dsub = dim // m
+        self.codebooks = None
+        self._offsets = np.arange(m, dtype=np.intp) * self.KSUB
+    
+    @property
+    def code_width(self) -> int:
+        return self.m
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.codebooks is not None
+    
+    def train(self, sample: np.ndarray, rng: np.random.Generator, iterations: int = 15):
+        ksub = min(self.KSUB, len(sample))
+        codebooks = np.zeros((self.m, self.KSUB, self.dsub), dtype=np.float32)
+        for j in range(self.m):
+            subvectors = np.ascontiguousarray(sample[:, j * self.dsub:(j + 1) * self.dsub], dtype=np.float32)
+            centroids = kmeans_l2(subvectors, ksub, iterations, rng)
+            # With fewer than 256 training vectors the spare slots repeat centroids
+            codebooks[j] = centroids[np.arange(self.KSUB) % ksub]
+        self.codebooks = codebooks
+        debug_log(logger, "Trained product quantizer: %s subvectors of %s dims", self.m, self.dsub)
+    
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        for j in range(self.m):
+            subvectors = vectors[:, j * self.dsub:(j + 1) * self.dsub]
+            codes[:, j] = nearest_centroid(subvectors, self.codebooks[j])
+        return codes
+    
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        parts = self.codebooks[np.arange(self.m), codes.astype(np.intp)]
+        return parts.reshape(len(codes), self.dim)
+    
+    def prepare(self, queries: np.ndarray):
+        # Per-query lookup tables of shape (m, 256), flattened for one gather per code
+        subqueries = queries.reshape(len(queries), self.m, self.dsub)
+        tables = np.einsum("qjd,jkd->qjk", subqueries, self.codebooks)
+        return tables.reshape(len(queries), -1).astype(np.float32)
+    
+    def score(self, prepared, codes: np.ndarray) -> np.ndarray:
+        flat_codes = codes.astype(np.intp) + self._offsets
+        scores = np.empty((len(prepared), len(codes)), dtype=np.float32)
+        for row, table in enumerate(prepared):
+            scores[row] = table[flat_codes].sum(axis=1)
+        return scores
+    
+    def state(self) -> np.ndarray:
+        return self.codebooks.ravel()
+    
+    def load_state(self, state: np.ndarray):
+        self.codebooks = state.reshape(self.m, self.KSUB, self.dsub).copy()
+
+def nearest_centroid(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Index of the nearest centroid (Euclidean) of each row
+    
+    Args:
+        data: Float32 array of shape (n, d)
+        centroids: Float32 array of shape (k, d)
+    
+    Returns:
+        Integer array of shape (n,)
+    """
+    # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2; ||x||^2 does not change the argmin
+    distances = (centroids ** 2).sum(axis=1) - 2 * (data @ centroids.T)
+    return np.argmin(distances, axis=1)
+
+def kmeans_l2(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Euclidean k-means used to learn product quantizer codebooks
+    
+    Args:
+        data: Float32 array of shape (n, d), n >= k
+        k: Number of centroids
+        iterations: Number of Lloyd iterations
+        rng: Random generator used for initialization
+    
+    Returns:
+        Float32 centroids of shape (k, d)
+    """
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = nearest_centroid(data, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        nonempty = counts > 0
+        sums = np.add.reduceat(data[order], starts[nonempty], axis=0)
+        centroids[nonempty] = sums / counts[nonempty, None]
+        
+        # Re-seed empty clusters with random points
+        empty = ~nonempty
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+    return centroids
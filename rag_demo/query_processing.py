@@ -11,8 +11,8 @@ def preprocess_query(query: str) -> str:
     Returns:
         Preprocessed query
     """
-    logger.info("Preprocessing user query")
-    debug_log(logger, f"Original query: {query}")
+    debug_log(logger, "Preprocessing user query")
+    debug_log(logger, "Original query: %s", query)
     
     # Convert to lowercase
     processed_query = query.lower()
@@ -23,8 +23,8 @@ def preprocess_query(query: str) -> str:
     # Remove special characters (keep alphanumeric, spaces, and basic punctuation)
     processed_query = re.sub(r'[^\w\s\.\,\?\!\-\']', '', processed_query)
     
-    debug_log(logger, f"Preprocessed query: {processed_query}")
-    logger.info("Query preprocessing complete")
+    debug_log(logger, "Preprocessed query: %s", processed_query)
+    debug_log(logger, "Query preprocessing complete")
     
     return processed_query
 
@@ -38,10 +38,10 @@ def process_query(query: str) -> str:
     Returns:
         Processed query ready for retrieval
     """
-    logger.info("Processing query for RAG pipeline")
+    debug_log(logger, "Processing query for RAG pipeline")
     
     # Preprocess the query
     processed_query = preprocess_query(query)
     
-    logger.info("Query processing complete")
+    debug_log(logger, "Query processing complete")
     return processed_query
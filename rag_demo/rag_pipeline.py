@@ -1,10 +1,23 @@
-from .logger import logger
+import asyncio
+import threading
+import time
+from concurrent.futures import Future
+from typing import AsyncIterator, Iterator, Optional, Tuple
+import numpy as np
+from .logger import logger, debug_log
 from .config import Config
-from .document_preparation import prepare_documents
-from .indexing import create_index
+from .embedding import get_embedding_engine
+from .indexing import VectorDatabase, get_embedding, load_index
+from .incremental import update_index
 from .query_processing import process_query
-from .retrieval import retrieve_documents, format_retrieved_context
-from .generation import generate_response, post_process_response
+from .retrieval import retrieve_documents, aretrieve_documents, format_retrieved_context
+from .generation import (
+    ERROR_RESPONSE, StreamStatus, is_demo_mode, generate_response, agenerate_response, stream_response,
+    astream_response, post_process_response, post_process_stream, apost_process_stream
+)
+from .providers import import_client_library
+from .response_cache import ResponseCache
+from .metrics import metrics
 
 class RAGPipeline:
     """Main RAG pipeline that orchestrates all components"""
@@ -13,6 +26,8 @@ class RAGPipeline:
         """Initialize RAG pipeline"""
         logger.info("Initializing RAG pipeline")
         self.vector_db = None
+        self._index_loading = None
+        self.response_cache = ResponseCache() if Config.RESPONSE_CACHE_ENABLED else None
         
         # Validate configuration
         errors = Config.validate_config()
@@ -20,6 +35,8 @@ class RAGPipeline:
             for error in errors:
                 logger.error(error)
             raise ValueError("Configuration validation failed. Please check your .env file.")
+        for warning in Config.config_warnings():
+            logger.warning(warning)
     
     def index_documents(self, doc_path: str):
         """
@@ -30,56 +47,336 @@ class RAGPipeline:
         """
         logger.info(f"Indexing documents from: {doc_path}")
         
-        # Prepare documents
-        documents = prepare_documents(doc_path)
-        
-        # Create index
-        self.vector_db = create_index(documents)
+        # Re-embed only new or changed files and save the updated index
+        self.vector_db = update_index(doc_path)
         
         logger.info("Document indexing complete")
     
-    def query(self, user_query: str) -> str:
+    def load_index(self, db_path: str = None):
+        """
+        Load a previously saved index instead of re-indexing
+        
+        Args:
+            db_path: Path of the saved vector database (uses config default if None)
+        """
+        logger.info("Loading saved document index")
+        
+        self.vector_db = load_index(db_path)
+        
+        logger.info("Document index loaded")
+    
+    def load_index_in_background(self, db_path: str = None) -> Future:
+        """
+        Start loading a saved index in a background thread
+        
+        The pipeline accepts queries right away; the first query waits until
+        the index is loaded (see wait_for_index). The API client library is
+        imported next, so the first question does not pay for it either.
+        
+        Args:
+            db_path: Path of the saved vector database (uses config default if None)
+        
+        Returns:
+            Future resolved with the load time in seconds once the index is loaded
+        """
+        loading = Future()
+        
+        def load():
+            start = time.perf_counter()
+            try:
+                self.load_index(db_path)
+            except BaseException as e:
+                loading.set_exception(e)
+            else:
+                loading.set_result(time.perf_counter() - start)
+                if not is_demo_mode():
+                    import_client_library()
+        
+        self._index_loading = loading
+        threading.Thread(target=load, name="index-loader", daemon=True).start()
+        return loading
+    
+    def wait_for_index(self):
+        """Block until a background index load has finished; if it failed, the pipeline has no index"""
+        loading = self._index_loading
+        if loading is None:
+            return
+        if not loading.done():
+            logger.info("Waiting for the document index to finish loading")
+        try:
+            loading.result()
+        except Exception as e:
+            logger.error(f"Error loading document index: {str(e)}")
+        self._index_loading = None
+    
+    async def await_index(self):
+        """Async version of wait_for_index"""
+        if self._index_loading is not None:
+            await asyncio.to_thread(self.wait_for_index)
+    
+    def _index_version(self) -> tuple:
+        """Identifies the index contents that cached responses were retrieved from"""
+        return id(self.vector_db), self.vector_db.version
+    
+    def _cached_response(self, processed_query: str, filters: dict = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Look up the response cache, embedding the query only if there is no exact hit
+        
+        Responses are cached by query and index version only, so filtered
+        queries bypass the cache.
+        
+        Args:
+            processed_query: Processed user query
+            filters: Metadata filter expression of the query (optional)
+            
+        Returns:
+            Tuple of (cached response or None, query embedding or None), the
+            embedding being reused for retrieval on a miss
+        """
+        if self.response_cache is None or filters:
+            return None, None
+        cached = self.response_cache.get(processed_query, self._index_version())
+        if cached is not None:
+            debug_log(logger, "Response cache hit (exact)")
+            metrics.increment("rag_response_cache_lookups_total", result="exact")
+            return cached, None
+        if Config.RETRIEVAL_MODE == "lexical":
+            # Lexical retrieval never embeds the query, so only exact hits are possible
+            metrics.increment("rag_response_cache_lookups_total", result="miss")
+            return None, None
+        with metrics.timer("embed_query"):
+            query_embedding = np.asarray(get_embedding(processed_query), dtype=np.float32)
+        return self._similar_response(query_embedding), query_embedding
+    
+    async def _acached_response(self, processed_query: str, filters: dict = None) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """Async version of _cached_response"""
+        if self.response_cache is None or filters:
+            return None, None
+        cached = self.response_cache.get(processed_query, self._index_version())
+        if cached is not None:
+            debug_log(logger, "Response cache hit (exact)")
+            metrics.increment("rag_response_cache_lookups_total", result="exact")
+            return cached, None
+        if Config.RETRIEVAL_MODE == "lexical":
+            metrics.increment("rag_response_cache_lookups_total", result="miss")
+            return None, None
+        with metrics.timer("embed_query"):
+            query_embedding = (await get_embedding_engine().aembed([processed_query]))[0]
+        return self._similar_response(query_embedding), query_embedding
+    
+    def _similar_response(self, query_embedding: np.ndarray) -> Optional[str]:
+        """Cached response of a near-duplicate query, or None"""
+        hit = self.response_cache.get_similar(query_embedding, self._index_version())
+        if hit is None:
+            metrics.increment("rag_response_cache_lookups_total", result="miss")
+            return None
+        response, similarity = hit
+        debug_log(logger, "Response cache hit (semantic, similarity %.3f)", similarity)
+        metrics.increment("rag_response_cache_lookups_total", result="semantic")
+        return response
+    
+    def _cache_response(self, processed_query: str, query_embedding: Optional[np.ndarray], response: str,
+                        filters: dict = None):
+        """Store a generated response; error messages and answers to filtered queries are never cached"""
+        if self.response_cache is not None and response != ERROR_RESPONSE and not filters:
+            self.response_cache.put(processed_query, query_embedding, response, self._index_version())
+    
+    def query(self, user_query: str, filters: dict = None) -> str:
         """
         Process user query and generate response
         
         Args:
             user_query: User's natural language query
+            filters: Metadata filter expression limiting retrieval, e.g. {"collection": "manuals"} (optional)
             
         Returns:
             Generated response
         """
+        self.wait_for_index()
         if self.vector_db is None:
             raise ValueError("No documents indexed. Please call index_documents() first.")
         
-        logger.info(f"Processing query: {user_query}")
+        logger.info("Processing query: %s", user_query)
         
-        # Process query
-        processed_query = process_query(user_query)
+        with metrics.trace("query", query=user_query):
+            # Process query
+            with metrics.timer("process_query"):
+                processed_query = process_query(user_query)
+            
+            # Answer repeated and near-duplicate questions from the response cache
+            with metrics.timer("response_cache"):
+                cached, query_embedding = self._cached_response(processed_query, filters)
+            if cached is not None:
+                return cached
+            
+            # Retrieve relevant documents
+            with metrics.timer("retrieve"):
+                retrieved_docs = retrieve_documents(
+                    processed_query, self.vector_db, query_embedding=query_embedding, filters=filters
+                )
+            
+            # Format context
+            with metrics.timer("format_context"):
+                context = format_retrieved_context(retrieved_docs)
+            
+            # Generate response
+            with metrics.timer("generate"):
+                response = generate_response(processed_query, context)
+            
+            # Post-process response
+            with metrics.timer("post_process"):
+                final_response = post_process_response(response)
+            self._cache_response(processed_query, query_embedding, final_response, filters)
         
-        # Retrieve relevant documents
-        retrieved_docs = retrieve_documents(processed_query, self.vector_db)
+        debug_log(logger, "Query processing complete")
+        return final_response
+    
+    async def aquery(self, user_query: str, filters: dict = None) -> str:
+        """
+        Async version of query; many queries can run concurrently on one
+        event loop against the same loaded index
         
-        # Format context
-        context = format_retrieved_context(retrieved_docs)
+        Args:
+            user_query: User's natural language query
+            filters: Metadata filter expression limiting retrieval (optional)
+            
+        Returns:
+            Generated response
+        """
+        await self.await_index()
+        if self.vector_db is None:
+            raise ValueError("No documents indexed. Please call index_documents() first.")
         
-        # Generate response
-        response = generate_response(processed_query, context)
+        logger.info("Processing query: %s", user_query)
         
-        # Post-process response
-        final_response = post_process_response(response)
+        with metrics.trace("query", query=user_query):
+            with metrics.timer("process_query"):
+                processed_query = process_query(user_query)
+            with metrics.timer("response_cache"):
+                cached, query_embedding = await self._acached_response(processed_query, filters)
+            if cached is not None:
+                return cached
+            
+            with metrics.timer("retrieve"):
+                retrieved_docs = await aretrieve_documents(
+                    processed_query, self.vector_db, query_embedding=query_embedding, filters=filters
+                )
+            with metrics.timer("format_context"):
+                context = format_retrieved_context(retrieved_docs)
+            with metrics.timer("generate"):
+                response = await agenerate_response(processed_query, context)
+            with metrics.timer("post_process"):
+                final_response = post_process_response(response)
+            self._cache_response(processed_query, query_embedding, final_response, filters)
         
-        logger.info("Query processing complete")
+        debug_log(logger, "Query processing complete")
         return final_response
     
-    def interactive_chat(self):
-        """Run interactive chat loop"""
+    def query_stream(self, user_query: str, filters: dict = None) -> Iterator[str]:
+        """
+        Process user query and stream the response as it is generated
+        
+        Args:
+            user_query: User's natural language query
+            filters: Metadata filter expression limiting retrieval (optional)
+            
+        Returns:
+            Iterator of post-processed response chunks
+        """
+        self.wait_for_index()
+        if self.vector_db is None:
+            raise ValueError("No documents indexed. Please call index_documents() first.")
+        
+        logger.info("Processing query: %s", user_query)
+        
+        with metrics.trace("query", query=user_query, stream=True):
+            with metrics.timer("process_query"):
+                processed_query = process_query(user_query)
+            with metrics.timer("response_cache"):
+                cached, query_embedding = self._cached_response(processed_query, filters)
+            if cached is not None:
+                yield cached
+                return
+            
+            with metrics.timer("retrieve"):
+                retrieved_docs = retrieve_documents(
+                    processed_query, self.vector_db, query_embedding=query_embedding, filters=filters
+                )
+            with metrics.timer("format_context"):
+                context = format_retrieved_context(retrieved_docs)
+            
+            # Only an answer streamed to its end is cached, never one cut short by an error
+            status = StreamStatus()
+            parts = []
+            for token in post_process_stream(stream_response(processed_query, context, status=status)):
+                parts.append(token)
+                yield token
+            if status.completed:
+                self._cache_response(processed_query, query_embedding, "".join(parts), filters)
+        
+        debug_log(logger, "Query processing complete")
+    
+    async def aquery_stream(self, user_query: str, filters: dict = None) -> AsyncIterator[str]:
+        """
+        Async version of query_stream
+        
+        Args:
+            user_query: User's natural language query
+            filters: Metadata filter expression limiting retrieval (optional)
+            
+        Returns:
+            Async iterator of post-processed response chunks
+        """
+        await self.await_index()
+        if self.vector_db is None:
+            raise ValueError("No documents indexed. Please call index_documents() first.")
+        
+        logger.info("Processing query: %s", user_query)
+        
+        with metrics.trace("query", query=user_query, stream=True):
+            with metrics.timer("process_query"):
+                processed_query = process_query(user_query)
+            with metrics.timer("response_cache"):
+                cached, query_embedding = await self._acached_response(processed_query, filters)
+            if cached is not None:
+                yield cached
+                return
+            
+            with metrics.timer("retrieve"):
+                retrieved_docs = await aretrieve_documents(
+                    processed_query, self.vector_db, query_embedding=query_embedding, filters=filters
+                )
+            with metrics.timer("format_context"):
+                context = format_retrieved_context(retrieved_docs)
+            
+            status = StreamStatus()
+            parts = []
+            async for token in apost_process_stream(astream_response(processed_query, context, status=status)):
+                parts.append(token)
+                yield token
+            if status.completed:
+                self._cache_response(processed_query, query_embedding, "".join(parts), filters)
+        
+        debug_log(logger, "Query processing complete")
+    
+    def interactive_chat(self, filters: dict = None):
+        """
+        Run interactive chat loop
+        
+        Args:
+            filters: Metadata filter expression applied to every query (optional)
+        """
         logger.info("Starting interactive chat")
         print("RAG Demo Chatbot")
         print("Type 'quit' to exit\n")
         
         # Check if documents are indexed
-        if self.vector_db is None:
+        if self._index_loading is not None:
+            print("Loading the document index in the background; the first answer waits for it.")
+        elif self.vector_db is None:
             print("Warning: No documents indexed. Responses will not use RAG.")
+        if filters:
+            print(f"Retrieving only from chunks matching: {filters}")
         
         while True:
             try:
@@ -92,8 +389,17 @@ class RAGPipeline:
                 if not user_input:
                     continue
                 
-                response = self.query(user_input)
-                print(f"Assistant: {response}\n")
+                if Config.STREAM_RESPONSES:
+                    # Print tokens as they arrive instead of waiting for the whole answer; the
+                    # prefix waits for the first one, so messages logged by retrieval come first
+                    prefix = "Assistant: "
+                    for token in self.query_stream(user_input, filters):
+                        print(prefix + token, end="", flush=True)
+                        prefix = ""
+                    print(prefix + "\n")
+                else:
+                    response = self.query(user_input, filters)
+                    print(f"Assistant: {response}\n")
                 
             except KeyboardInterrupt:
                 print("\nGoodbye!")
@@ -101,24 +407,50 @@ class RAGPipeline:
             except Exception as e:
                 logger.error(f"Error during chat: {str(e)}")
                 print(f"Error: {str(e)}")
+        
+        if self.response_cache is not None:
+            logger.info(f"Response cache stats: {self.response_cache.stats()}")
+        metrics.log_summary()
 
-def run_rag_demo(doc_path: str = None):
+def create_pipeline(doc_path: str = None, background: bool = False) -> RAGPipeline:
     """
-    Run RAG demo with optional document indexing
+    Create a RAG pipeline, indexing documents or reusing a saved index
     
     Args:
         doc_path: Path to document file or directory (optional)
+        background: Load a saved index in a background thread instead of
+            before returning; indexing documents always completes first
+        
+    Returns:
+        Initialized RAGPipeline
     """
-    logger.info("Running RAG demo")
-    
     # Initialize pipeline
     pipeline = RAGPipeline()
     
-    # Index documents if provided
+    # Index documents if provided, otherwise reuse a saved index
     if doc_path:
         pipeline.index_documents(doc_path)
+    elif VectorDatabase.exists():
+        if background:
+            pipeline.load_index_in_background()
+        else:
+            pipeline.load_index()
+    return pipeline
+
+def run_rag_demo(doc_path: str = None, filters: dict = None):
+    """
+    Run RAG demo with optional document indexing
+    
+    Args:
+        doc_path: Path to document file or directory (optional)
+        filters: Metadata filter expression for every chat query (optional)
+    """
+    logger.info("Running RAG demo")
+    
+    # The prompt appears while a saved index is still loading
+    pipeline = create_pipeline(doc_path, background=Config.BACKGROUND_INDEX_LOAD)
     
     # Run interactive chat
-    pipeline.interactive_chat()
+    pipeline.interactive_chat(filters)
     
     logger.info("RAG demo complete")
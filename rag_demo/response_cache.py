@@ -0,0 +1,215 @@
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a query for exact cache lookups
+    
+    Args:
+        query: Processed user query
+    
+    Returns:
+        Lowercased words joined by single spaces, punctuation removed
+    """
+    return " ".join(re.findall(r"\w+", query.lower()))
+
+class ResponseCache:
+    """
+    Cache of generated responses for repeated and near-duplicate queries
+    
+    Entries are found by the hash of the normalized query (exact hits) or by
+    cosine similarity of the query embedding to cached query embeddings
+    (semantic hits). Every lookup carries the version of the index the answer
+    would be retrieved from; a new version invalidates all entries. Entries
+    expire after a TTL and the least recently used entry is evicted when the
+    cache is full.
+    """
+    
+    def __init__(self, max_entries: int = None, ttl: float = None, similarity_threshold: float = None):
+        """
+        Initialize response cache
+        
+        Args:
+            max_entries: Maximum cached responses (uses config default if None)
+            ttl: Seconds an entry stays valid, 0 for no expiry (uses config default if None)
+            similarity_threshold: Minimum cosine similarity of a semantic hit (uses config default if None)
+        """
+        self.max_entries = max_entries or Config.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = Config.RESPONSE_CACHE_TTL if ttl is None else ttl
+        self.similarity_threshold = (
+            Config.RESPONSE_CACHE_SIMILARITY if similarity_threshold is None else similarity_threshold
+        )
+        
+        # key -> (slot, response), ordered from least to most recently used
+        self._entries = OrderedDict()
+        # Normalized query embeddings, expiry times and occupancy by slot
+        self._embeddings = None
+        self._expires = np.zeros(self.max_entries)
+        self._used = np.zeros(self.max_entries, dtype=bool)
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+        self._version = None
+        self._lock = threading.Lock()
+        
+        self.lookups = 0
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def _key(query: str) -> bytes:
+        return hashlib.sha256(normalize_query(query).encode("utf-8")).digest()
+    
+    def _check_version(self, version: Hashable):
+        """Drop every entry if the index changed since they were cached"""
+        if version != self._version:
+            if self._entries:
+                self.invalidations += len(self._entries)
+                debug_log(logger, "Index version changed; invalidating %s cached responses", len(self._entries))
+                self._clear()
+            self._version = version
+    
+    def _remove(self, key: bytes):
+        slot, _ = self._entries.pop(key)
+        self._used[slot] = False
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+    
+    def _expired(self, slot: int) -> bool:
+        return self._expires[slot] <= time.monotonic()
+    
+    def _clear(self):
+        self._entries.clear()
+        self._used[:] = False
+        self._slot_keys = [None] * self.max_entries
+        self._free_slots = list(range(self.max_entries - 1, -1, -1))
+    
+    def get(self, query: str, version: Hashable) -> Optional[str]:
+        """
+        Look up an exact hit for a query
+        
+        Args:
+            query: Processed user query
+            version: Version of the index answers are retrieved from
+        
+        Returns:
+            Cached response, or None
+        """
+        key = self._key(query)
+        with self._lock:
+            self._check_version(version)
+            self.lookups += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if self._expired(entry[0]):
+                self._remove(key)
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            self.exact_hits += 1
+            return entry[1]
+    
+    def get_similar(self, embedding: np.ndarray, version: Hashable) -> Optional[Tuple[str, float]]:
+        """
+        Look up a semantic hit for a query that had no exact hit
+        
+        Args:
+            embedding: Query embedding
+            version: Version of the index answers are retrieved from
+        
+        Returns:
+            Tuple of (cached response, cosine similarity), or None
+        """
+        with self._lock:
+            self._check_version(version)
+            if not self._entries or self._embeddings is None or len(embedding) != self._embeddings.shape[1]:
+                return None
+            
+            now = time.monotonic()
+            for slot in np.flatnonzero(self._used & (self._expires <= now)):
+                self._remove(self._slot_keys[slot])
+                self.expirations += 1
+            
+            query = np.asarray(embedding, dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            scores = self._embeddings @ query
+            scores[~self._used] = -np.inf
+            slot = int(np.argmax(scores))
+            similarity = float(scores[slot])
+            if similarity < self.similarity_threshold:
+                return None
+            
+            key = self._slot_keys[slot]
+            self._entries.move_to_end(key)
+            self.semantic_hits += 1
+            return self._entries[key][1], similarity
+    
+    def put(self, query: str, embedding: Optional[np.ndarray], response: str, version: Hashable):
+        """
+        Cache a generated response
+        
+        Args:
+            query: Processed user query
+            embedding: Query embedding, or None to allow exact hits only
+            response: Generated response
+            version: Version of the index the response was retrieved from
+        """
+        key = self._key(query)
+        with self._lock:
+            self._check_version(version)
+            if key in self._entries:
+                self._remove(key)
+            if not self._free_slots:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+            
+            slot = self._free_slots.pop()
+            if embedding is not None:
+                vector = np.asarray(embedding, dtype=np.float32)
+                if self._embeddings is None or self._embeddings.shape[1] != len(vector):
+                    self._embeddings = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+                self._embeddings[slot] = vector / (np.linalg.norm(vector) or 1.0)
+            elif self._embeddings is not None:
+                self._embeddings[slot] = 0
+            
+            self._expires[slot] = time.monotonic() + self.ttl if self.ttl else np.inf
+            self._slot_keys[slot] = key
+            self._used[slot] = True
+            self._entries[key] = (slot, response)
+    
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._clear()
+    
+    def stats(self) -> dict:
+        """
+        Cache hit/miss counters
+        
+        Returns:
+            Dictionary with lookups, exact_hits, semantic_hits, misses, hit_rate,
+            evictions, expirations, invalidations and entries
+        """
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            return {
+                "lookups": self.lookups,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.lookups - hits,
+                "hit_rate": hits / self.lookups if self.lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "entries": len(self._entries)
+            }
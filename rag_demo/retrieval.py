@@ -1,55 +1,360 @@
+import asyncio
 from typing import List, Tuple
+import numpy as np
 from .logger import logger, debug_log
 from .config import Config
+from .document_preparation import CHARS_PER_TOKEN, read_chunk_text
+from .embedding import estimate_tokens, get_embedding_engine
+from .metrics import metrics
 
-def retrieve_documents(query: str, vector_db, k: int = None) -> List[Tuple[dict, float]]:
+# Smallest budget left for which a span that does not fit is truncated rather than skipped
+MIN_TRUNCATED_TOKENS = 32
+
+def reciprocal_rank_fusion(result_lists: List[List[Tuple[dict, float]]], k: int, rrf_k: int = None) -> List[Tuple[dict, float]]:
+    """
+    Merge ranked result lists by reciprocal-rank fusion
+    
+    Each document scores sum(1 / (rrf_k + rank)) over the lists it appears in,
+    so documents ranked highly by several retrievers come first regardless
+    of how each retriever scales its scores.
+    
+    Args:
+        result_lists: Ranked lists of (document_metadata, score) tuples
+        k: Number of fused results
+        rrf_k: Rank offset damping the weight of top ranks (uses config default if None)
+        
+    Returns:
+        List of (document_metadata, fused_score) tuples, best first
+    """
+    if rrf_k is None:
+        rrf_k = Config.RRF_K
+    
+    fused = {}
+    for results in result_lists:
+        for rank, (metadata, _) in enumerate(results, start=1):
+            doc_id = metadata["document_index"]
+            entry = fused.setdefault(doc_id, [metadata, 0.0])
+            entry[1] += 1.0 / (rrf_k + rank)
+    
+    ranked = sorted(fused.values(), key=lambda entry: entry[1], reverse=True)
+    return [(metadata, score) for metadata, score in ranked[:k]]
+
+def maximal_marginal_relevance(relevance: np.ndarray, vectors: np.ndarray, k: int, lambda_mult: float = None) -> List[int]:
+    """
+    Select a relevant and diverse subset of candidates by maximal marginal relevance
+    
+    Candidates are picked greedily by lambda * relevance - (1 - lambda) *
+    (highest cosine similarity to an already picked candidate). Each pick
+    costs one matrix-vector product over the candidates, which updates their
+    running maximum similarity to the picked set, so k picks from n
+    candidates of dimension d cost O(k * n * d) without an n x n matrix.
+    
+    Args:
+        relevance: Relevance of each candidate to the query, higher is better
+        vectors: Unit-length candidate embeddings of shape (n, dim)
+        k: Number of candidates to select
+        lambda_mult: Weight of relevance against novelty (uses config default if None)
+    
+    Returns:
+        Positions of the selected candidates, in selection order
+    """
+    if lambda_mult is None:
+        lambda_mult = Config.MMR_LAMBDA
+    k = min(k, len(relevance))
+    selected = []
+    if k <= 0:
+        return selected
+    
+    gain = lambda_mult * np.asarray(relevance, dtype=np.float32)
+    redundancy = np.zeros(len(gain), dtype=np.float32)
+    available = np.ones(len(gain), dtype=bool)
+    for _ in range(k):
+        scores = np.where(available, gain - (1.0 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, vectors @ vectors[best], out=redundancy)
+    return selected
+
+def rerank_diverse(results: List[Tuple[dict, float]], vector_db, k: int) -> List[Tuple[dict, float]]:
+    """
+    Re-rank over-fetched results down to k by maximal marginal relevance
+    
+    Candidate embeddings are read back from the vector index, so no API call
+    is made. Scores are divided by the best score to serve as relevance,
+    which works for cosine, BM25 and fused scores alike. Results keep their
+    original scores.
+    
+    Args:
+        results: Ranked (document_metadata, score) candidates
+        vector_db: Vector database the candidates came from
+        k: Number of results to keep
+    
+    Returns:
+        The k selected (document_metadata, score) tuples, in selection order
+    """
+    if len(results) <= k:
+        return results
+    
+    with metrics.timer("rerank"):
+        ids = np.array([metadata["document_index"] for metadata, _ in results], dtype=np.int64)
+        scores = np.array([score for _, score in results], dtype=np.float32)
+        top = float(scores.max())
+        relevance = scores / top if top > 0 else np.ones_like(scores)
+        selected = maximal_marginal_relevance(relevance, vector_db.reconstruct(ids), k)
+    
+    debug_log(logger, "MMR kept %s of %s candidates", len(selected), len(results))
+    return [results[position] for position in selected]
+
+def _candidate_count(k: int) -> int:
+    """Results fetched for a final top k: over-fetched for MMR re-ranking when enabled"""
+    return max(k, Config.MMR_CANDIDATES) if Config.MMR_ENABLED else k
+
+def _rerank(results: List[Tuple[dict, float]], vector_db, k: int) -> List[Tuple[dict, float]]:
+    """Apply MMR re-ranking when enabled"""
+    return rerank_diverse(results, vector_db, k) if Config.MMR_ENABLED else results[:k]
+
+def _log_results(results: List[Tuple[dict, float]]):
+    debug_log(logger, "Retrieved %s documents", len(results))
+    
+    # Log top results
+    for i, (metadata, score) in enumerate(results):
+        debug_log(logger, "Result %s: Score=%.4f, Text=%s...", i+1, score, metadata.get('text', '')[:100])
+
+def retrieve_documents(query: str, vector_db, k: int = None, query_embedding=None, mode: str = None,
+                       filters: dict = None) -> List[Tuple[dict, float]]:
     """
     Retrieve relevant documents for a query from the vector database
     
+    With MMR_ENABLED, MMR_CANDIDATES results are fetched and re-ranked down
+    to k by maximal marginal relevance, so near-copies of one passage do not
+    fill the top k.
+    
     Args:
         query: Processed user query
         vector_db: Vector database instance
         k: Number of documents to retrieve (uses config default if None)
+        query_embedding: Precomputed embedding of the query (optional)
+        mode: vector, lexical or hybrid, see RETRIEVAL_MODE (uses config default if None)
+        filters: Metadata filter expression such as {"collection": "manuals"}; only
+            matching chunks are searched, see FILTER_FIELDS (optional)
         
     Returns:
-        List of (document_metadata, similarity_score) tuples
+        List of (document_metadata, score) tuples; scores are cosine similarities,
+        BM25 scores or fused reciprocal-rank scores depending on the mode
     """
     if k is None:
         k = Config.TOP_K_RESULTS
+    mode = mode or Config.RETRIEVAL_MODE
     
-    logger.info(f"Retrieving top {k} documents for query: {query}")
+    debug_log(logger, "Retrieving top %s documents (%s, filters %s) for query: %s", k, mode, filters, query)
     
-    # Search vector database for similar documents
-    results = vector_db.search(query, k)
+    fetch = _candidate_count(k)
+    if mode == "lexical":
+        # Keyword search only; the query is never embedded
+        results = vector_db.search_lexical(query, fetch, filters)
+    elif mode == "hybrid":
+        candidates = max(fetch, Config.RRF_CANDIDATES)
+        results = reciprocal_rank_fusion([
+            vector_db.search(query, candidates, query_embedding, filters),
+            vector_db.search_lexical(query, candidates, filters)
+        ], fetch)
+    else:
+        # Search vector database for similar documents
+        results = vector_db.search(query, fetch, query_embedding, filters)
+    results = _rerank(results, vector_db, k)
     
-    logger.info(f"Retrieved {len(results)} documents")
+    _log_results(results)
+    return results
+
+async def aretrieve_documents(query: str, vector_db, k: int = None, query_embedding=None, mode: str = None,
+                              filters: dict = None) -> List[Tuple[dict, float]]:
+    """
+    Async version of retrieve_documents
     
-    # Log top results
-    for i, (metadata, score) in enumerate(results):
-        debug_log(logger, f"Result {i+1}: Score={score:.4f}, Text={metadata.get('text', '')[:100]}...")
+    Args:
+        query: Processed user query
+        vector_db: Vector database instance
+        k: Number of documents to retrieve (uses config default if None)
+        query_embedding: Precomputed embedding of the query (optional)
+        mode: vector, lexical or hybrid, see RETRIEVAL_MODE (uses config default if None)
+        filters: Metadata filter expression (optional)
+        
+    Returns:
+        List of (document_metadata, score) tuples
+    """
+    if k is None:
+        k = Config.TOP_K_RESULTS
+    mode = mode or Config.RETRIEVAL_MODE
+    
+    debug_log(logger, "Retrieving top %s documents (%s, filters %s) for query: %s", k, mode, filters, query)
     
+    fetch = _candidate_count(k)
+    if mode == "lexical":
+        results = await asyncio.to_thread(vector_db.search_lexical, query, fetch, filters)
+    elif mode == "hybrid":
+        # The keyword search runs while the query is being embedded
+        candidates = max(fetch, Config.RRF_CANDIDATES)
+        result_lists = await asyncio.gather(
+            vector_db.asearch(query, candidates, query_embedding, filters),
+            asyncio.to_thread(vector_db.search_lexical, query, candidates, filters)
+        )
+        results = reciprocal_rank_fusion(result_lists, fetch)
+    else:
+        results = await vector_db.asearch(query, fetch, query_embedding, filters)
+    results = _rerank(results, vector_db, k)
+    
+    _log_results(results)
     return results
 
-def format_retrieved_context(retrieved_docs: List[Tuple[dict, float]]) -> str:
+def retrieve_documents_many(queries: List[str], vector_db, k: int = None, query_embeddings=None, mode: str = None,
+                            filters: dict = None) -> List[List[Tuple[dict, float]]]:
+    """
+    Retrieve documents for a block of queries at once
+    
+    The queries are embedded in batched requests and scored against the
+    vector index in one matrix-matrix product; keyword searches run per query.
+    
+    Args:
+        queries: Processed user queries
+        vector_db: Vector database instance
+        k: Number of documents per query (uses config default if None)
+        query_embeddings: Precomputed query embeddings of shape (len(queries), dim) (optional)
+        mode: vector, lexical or hybrid, see RETRIEVAL_MODE (uses config default if None)
+        filters: Metadata filter expression applied to every query (optional)
+        
+    Returns:
+        One list of (document_metadata, score) tuples per query
+    """
+    if k is None:
+        k = Config.TOP_K_RESULTS
+    mode = mode or Config.RETRIEVAL_MODE
+    if not queries:
+        return []
+    
+    debug_log(logger, "Retrieving top %s documents (%s, filters %s) for %s queries", k, mode, filters, len(queries))
+    
+    fetch = _candidate_count(k)
+    if mode == "lexical":
+        return [_rerank(vector_db.search_lexical(query, fetch, filters), vector_db, k) for query in queries]
+    
+    if query_embeddings is None:
+        with metrics.timer("embed_query"):
+            query_embeddings = get_embedding_engine().embed(queries)
+    if mode == "hybrid":
+        candidates = max(fetch, Config.RRF_CANDIDATES)
+        with metrics.timer("vector_search"):
+            vector_results = vector_db.search_many_by_vector(query_embeddings, candidates, filters)
+        result_lists = [
+            reciprocal_rank_fusion([results, vector_db.search_lexical(query, candidates, filters)], fetch)
+            for query, results in zip(queries, vector_results)
+        ]
+    else:
+        with metrics.timer("vector_search"):
+            result_lists = vector_db.search_many_by_vector(query_embeddings, fetch, filters)
+    return [_rerank(results, vector_db, k) for results in result_lists]
+
+def merge_chunks(retrieved_docs: List[Tuple[dict, float]]) -> List[Tuple[dict, float]]:
+    """
+    Merge overlapping and adjacent chunks of the same source file into spans
+    
+    Chunks of one file are adjacent when their ids are consecutive, since
+    chunks are indexed in file order. A merged span is read from the source
+    file once, so text repeated by chunk overlap appears only once. Chunks
+    without a source byte range are only deduplicated by exact text.
+    
+    Args:
+        retrieved_docs: List of (document_metadata, score) tuples
+        
+    Returns:
+        List of (span_metadata, score) tuples, best first; the score of a span
+        is the best score of its chunks and "chunks" counts the merged chunks
+    """
+    by_source = {}
+    spans = []
+    seen_texts = set()
+    for metadata, score in retrieved_docs:
+        if "byte_start" in metadata:
+            by_source.setdefault(metadata["source"], []).append((metadata, score))
+        elif metadata.get("text", "") not in seen_texts:
+            seen_texts.add(metadata.get("text", ""))
+            spans.append(({**metadata, "chunks": 1}, score))
+    
+    for source, chunks in by_source.items():
+        chunks.sort(key=lambda chunk: chunk[0]["byte_start"])
+        groups = [[chunks[0]]]
+        for metadata, score in chunks[1:]:
+            previous = groups[-1][-1][0]
+            if (metadata["byte_start"] <= previous["byte_end"]
+                    or metadata["document_index"] == previous["document_index"] + 1):
+                groups[-1].append((metadata, score))
+            else:
+                groups.append([(metadata, score)])
+        
+        for group in groups:
+            first = group[0][0]
+            span = {**first, "chunks": len(group)}
+            if len(group) > 1:
+                span["byte_end"] = max(metadata["byte_end"] for metadata, _ in group)
+                try:
+                    span["text"] = read_chunk_text(span)
+                except OSError:
+                    span["text"] = "\n".join(metadata.get("text", "") for metadata, _ in group)
+            spans.append((span, max(score for _, score in group)))
+    
+    spans.sort(key=lambda span: span[1], reverse=True)
+    return spans
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens estimated tokens at a word boundary"""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > 0 else limit].rstrip() + " ..."
+
+def format_retrieved_context(retrieved_docs: List[Tuple[dict, float]], max_tokens: int = None) -> str:
     """
     Format retrieved documents as context for the LLM
     
+    Overlapping chunks are merged first, then spans are added from the most
+    relevant down while they fit the token budget. A span that does not fit
+    is truncated if enough budget is left, otherwise skipped.
+    
     Args:
         retrieved_docs: List of (document_metadata, similarity_score) tuples
+        max_tokens: Estimated token budget of the context (uses config default if None)
         
     Returns:
         Formatted context string
     """
-    logger.info("Formatting retrieved documents as context")
+    if max_tokens is None:
+        max_tokens = Config.CONTEXT_MAX_TOKENS
+    
+    debug_log(logger, "Formatting retrieved documents as context")
+    
+    spans = merge_chunks(retrieved_docs)
     
     context_parts = []
-    for i, (metadata, score) in enumerate(retrieved_docs):
+    used_tokens = 0
+    for metadata, score in spans:
+        header = f"[Document {len(context_parts)+1} (Relevance: {score:.4f})]: "
         text = metadata.get('text', '')
-        context_parts.append(f"[Document {i+1} (Relevance: {score:.4f})]: {text}")
+        available = max_tokens - used_tokens - estimate_tokens(header)
+        if estimate_tokens(text) > available:
+            if available < MIN_TRUNCATED_TOKENS:
+                continue
+            text = _truncate(text, available)
+        context_parts.append(header + text)
+        used_tokens += estimate_tokens(context_parts[-1])
     
     context = "\n\n".join(context_parts)
+    metrics.observe("rag_context_tokens", used_tokens)
+    metrics.observe("rag_context_spans", len(context_parts))
     
-    debug_log(logger, f"Formatted context length: {len(context)} characters")
-    logger.info("Context formatting complete")
+    debug_log(logger, "Packed %s chunks into %s spans (~%s of %s tokens)",
+              len(retrieved_docs), len(context_parts), used_tokens, max_tokens)
+    debug_log(logger, "Formatted context length: %s characters", len(context))
+    debug_log(logger, "Context formatting complete")
     
     return context
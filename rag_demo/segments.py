@@ -0,0 +1,304 @@
+import json
+import os
+import re
+import struct
+import zlib
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, Iterator, List, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+from .lexical_index import tokenize
+from .metadata_index import metadata_mask
+from .storage import RowBuffer, tombstone_range
+from .vector_index import top_k_indices
+
+# Write-ahead logs of the in-memory segments, numbered in order of creation
+WAL_FILE_PATTERN = re.compile(r"^wal-(\d+)\.log$")
+
+# Frame header of a log record: payload length and CRC-32 of the payload
+_FRAME = struct.Struct("<II")
+
+def wal_path(db_path: str, sequence: int) -> str:
+    """Path of the write-ahead log with the given sequence number"""
+    return os.path.join(db_path, f"wal-{sequence:06d}.log")
+
+def list_wal_files(db_path: str) -> List[Tuple[int, str]]:
+    """
+    Find the write-ahead logs of a database directory
+    
+    Args:
+        db_path: Vector database directory
+    
+    Returns:
+        List of (sequence number, path), oldest first
+    """
+    if not os.path.isdir(db_path):
+        return []
+    logs = []
+    for name in os.listdir(db_path):
+        match = WAL_FILE_PATTERN.match(name)
+        if match:
+            logs.append((int(match.group(1)), os.path.join(db_path, name)))
+    return sorted(logs)
+
+class WriteAheadLog:
+    """
+    Append-only log of the writes held by an in-memory segment
+    
+    Every record is a JSON header plus an optional binary payload, framed by
+    its length and CRC-32 and written with a single write() followed by
+    fsync (unless WAL_FSYNC is off), so a write acknowledged to the caller
+    survives a crash. A record torn by a crash fails its checksum and is
+    dropped on replay, together with anything after it.
+    """
+    
+    def __init__(self, path: str):
+        """
+        Initialize log; the file is created by the first append
+        
+        Args:
+            path: Log file
+        """
+        self.path = path
+    
+    def append(self, record: dict, payload: bytes = b""):
+        """
+        Durably append a record
+        
+        Args:
+            record: JSON-serializable record header
+            payload: Binary data stored after the header, e.g. vectors
+        """
+        body = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n" + payload
+        with open(self.path, "ab") as f:
+            f.write(_FRAME.pack(len(body), zlib.crc32(body)) + body)
+            f.flush()
+            if Config.WAL_FSYNC:
+                os.fsync(f.fileno())
+    
+    def replay(self) -> Iterator[Tuple[dict, bytes]]:
+        """
+        Read back the complete records, truncating an incomplete tail
+        
+        Yields:
+            (record header, payload) tuples in the order they were appended
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            data = f.read()
+        
+        offset = 0
+        while offset + _FRAME.size <= len(data):
+            length, checksum = _FRAME.unpack_from(data, offset)
+            body = data[offset + _FRAME.size:offset + _FRAME.size + length]
+            if len(body) < length or zlib.crc32(body) != checksum:
+                break
+            newline = body.index(b"\n")
+            yield json.loads(body[:newline]), body[newline + 1:]
+            offset += _FRAME.size + length
+        
+        if offset < len(data):
+            logger.warning(f"Dropping an incomplete record ({len(data) - offset} bytes) at the end of {self.path}")
+            with open(self.path, "r+b") as f:
+                f.truncate(offset)
+    
+    def remove(self):
+        """Delete the log once its writes are in the saved index"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class Segment:
+    """
+    In-memory segment holding the newest vectors of a database
+    
+    Vector ids continue where the previous segment ends, so they never
+    change when the segment is merged into the saved index. One writer at a
+    time appends (VectorDatabase serializes writes); readers never lock.
+    Every per-vector list only grows, and the vector rows are published as a
+    single (rows, count) tuple once everything else is in place, so a
+    snapshot() always describes a complete prefix of the segment, even
+    while a write is in progress. Segments are small (LIVE_SEGMENT_MAX_VECTORS),
+    so vectors are scored exactly and BM25 postings are plain lists.
+    """
+    
+    def __init__(self, start: int, log: WriteAheadLog = None):
+        """
+        Initialize an empty segment
+        
+        Args:
+            start: Id of the segment's first vector
+            log: Write-ahead log receiving the segment's writes (optional)
+        """
+        self.start = start
+        # Logs holding the segment's writes, removed once it is merged; new writes go to the last
+        self.logs = [log] if log is not None else []
+        # Frozen segments take no more writes and wait to be merged
+        self.frozen = False
+        
+        self._rows = RowBuffer(np.float32)
+        self._metadatas = []
+        self._texts = []
+        self._lengths = []
+        # Term -> [(local id, term frequency)], ascending by id
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._published = (self._rows.data, 0)
+    
+    def __len__(self) -> int:
+        return self._published[1]
+    
+    @property
+    def log(self) -> WriteAheadLog:
+        """Write-ahead log receiving new writes"""
+        return self.logs[-1]
+    
+    def append(self, vectors: np.ndarray, metadatas: List[dict], texts: List[str]):
+        """
+        Append vectors and publish them to readers
+        
+        Args:
+            vectors: Normalized float32 array of shape (n, dim)
+            metadatas: Metadata dictionaries with their document_index already set
+            texts: Chunk texts for BM25
+        """
+        local_id = len(self._metadatas)
+        for meta, text in zip(metadatas, texts):
+            tokens = tokenize(text)
+            for term, tf in Counter(tokens).items():
+                self._postings.setdefault(term, []).append((local_id, tf))
+            self._lengths.append(len(tokens))
+            self._metadatas.append(meta)
+            self._texts.append(text)
+            local_id += 1
+        self._rows.append(vectors)
+        # Rows are never rewritten in place (growing the buffer copies them), so
+        # a published view stays valid while later rows are appended
+        self._published = (self._rows.data, len(self._rows))
+    
+    def snapshot(self) -> "SegmentSnapshot":
+        """Read view of the vectors published so far"""
+        rows, count = self._published
+        return SegmentSnapshot(self, rows, count)
+
+class SegmentSnapshot:
+    """Immutable view of the first `count` vectors of a segment, taken once per search"""
+    
+    def __init__(self, segment: Segment, rows: np.ndarray, count: int):
+        self.segment = segment
+        self.start = segment.start
+        self.rows = rows
+        self.count = count
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    @property
+    def metadatas(self) -> List[dict]:
+        return self.segment._metadatas[:self.count]
+    
+    @property
+    def texts(self) -> List[str]:
+        return self.segment._texts[:self.count]
+    
+    def metadata(self, doc_id: int) -> dict:
+        """Metadata of a vector of this segment, by global id"""
+        return self.segment._metadatas[doc_id - self.start]
+    
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """Stored vectors of the given global ids"""
+        return self.rows[np.asarray(ids, dtype=np.int64) - self.start]
+    
+    def allowed(self, deleted: np.ndarray = None, filters: dict = None) -> np.ndarray:
+        """
+        Boolean mask of the searchable vectors of the snapshot
+        
+        Args:
+            deleted: Tombstone mask over global ids (optional)
+            filters: Metadata filter expression (optional)
+        
+        Returns:
+            Mask over local ids, or None when every vector is searchable
+        """
+        allowed = None
+        if deleted is not None:
+            allowed = ~tombstone_range(deleted, self.start, self.count)
+        if filters:
+            matches = metadata_mask(filters, self.metadatas)
+            allowed = matches if allowed is None else allowed & matches
+        return allowed
+    
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact vector search over the snapshot
+        
+        Args:
+            queries: Normalized float32 array of shape (num_queries, dim)
+            k: Number of results per query
+            allowed: Mask over local ids, see allowed() (optional)
+        
+        Returns:
+            Tuple of (scores, ids) arrays of shape (num_queries, k'), global
+            ids, best first, padded with id -1 and score -inf
+        """
+        if self.count == 0 or k <= 0:
+            return (np.empty((len(queries), 0), dtype=np.float32),
+                    np.empty((len(queries), 0), dtype=np.int64))
+        scores = queries @ self.rows.T
+        if allowed is not None:
+            scores[:, ~allowed] = -np.inf
+        ids = top_k_indices(scores, k)
+        top_scores = np.take_along_axis(scores, ids, axis=1)
+        ids = np.where(np.isneginf(top_scores), -1, ids + self.start).astype(np.int64)
+        return top_scores, ids
+    
+    def term_statistics(self, terms: List[str]) -> Tuple[int, int, dict]:
+        """Number of documents, their total length and the document frequency of each term, like LexicalIndex.term_statistics"""
+        postings = self.segment._postings
+        frequencies = {term: bisect_left(postings.get(term, ()), (self.count,)) for term in terms}
+        return self.count, sum(self.segment._lengths[:self.count]), frequencies
+    
+    def search_lexical(self, terms: List[str], k: int, statistics: Tuple[int, float, dict],
+                       k1: float, b: float, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 search over the snapshot
+        
+        Documents are scored with corpus statistics of the whole database, so
+        their scores are comparable with those of the saved index.
+        
+        Args:
+            terms: Distinct query terms
+            k: Number of results
+            statistics: (number of documents, average length, document frequency per term)
+            k1: BM25 term frequency saturation
+            b: BM25 document length normalization
+            allowed: Mask over local ids, see allowed() (optional)
+        
+        Returns:
+            Tuple of (scores, ids) arrays of shape (1, k'), global ids, best
+            first; only documents containing a query term are returned
+        """
+        documents, average_length, frequencies = statistics
+        lengths = np.asarray(self.segment._lengths[:self.count], dtype=np.float32)
+        scores = np.zeros(self.count, dtype=np.float32)
+        matched = np.zeros(self.count, dtype=bool)
+        for term in terms:
+            postings = self.segment._postings.get(term, ())
+            postings = postings[:bisect_left(postings, (self.count,))]
+            if not postings:
+                continue
+            doc_ids = np.fromiter((doc_id for doc_id, _ in postings), dtype=np.int64, count=len(postings))
+            tfs = np.fromiter((tf for _, tf in postings), dtype=np.float32, count=len(postings))
+            df = frequencies[term]
+            idf = np.log(1.0 + (documents - df + 0.5) / (df + 0.5))
+            norm = k1 * (1.0 - b + b * lengths[doc_ids] / average_length)
+            scores[doc_ids] += idf * tfs * (k1 + 1.0) / (tfs + norm)
+            matched[doc_ids] = True
+        if allowed is not None:
+            matched &= allowed
+        
+        candidates = np.flatnonzero(matched)
+        best = top_k_indices(scores[candidates][None, :], k)[0] if len(candidates) and k > 0 else candidates[:0]
+        debug_log(logger, "Segment lexical search matched %s of %s documents", len(candidates), self.count)
+        return scores[candidates[best]][None, :], (candidates[best] + self.start)[None, :]
@@ -0,0 +1,294 @@
+import asyncio
+import json
+import time
+from typing import Optional, Tuple
+from .logger import logger, debug_log
+from .config import Config
+from .document_preparation import split_text_into_chunks
+from .metadata_index import normalize_filters
+from .metrics import metrics
+from .rag_pipeline import RAGPipeline, create_pipeline
+
+# Largest accepted request body in bytes
+MAX_BODY_BYTES = 1 << 20
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+           500: "Internal Server Error"}
+
+class RequestTooLarge(Exception):
+    """Raised when a request body exceeds MAX_BODY_BYTES"""
+
+class StreamedQuery:
+    """Marker returned by request dispatch for a query answered as a stream"""
+    
+    def __init__(self, query: str, filters: dict = None):
+        self.query = query
+        self.filters = filters
+
+class RAGServer:
+    """
+    Minimal asyncio HTTP/1.1 server answering queries with one shared pipeline
+    
+    Endpoints:
+        POST /query   {"query": "..."} -> {"response": "...", "latency_ms": ...}
+        POST /query   {"query": "...", "stream": true} -> response text, sent in
+                      chunks (Transfer-Encoding: chunked) as it is generated
+        POST /query   {"query": "...", "filters": {"collection": "manuals"}} -> answer
+                      retrieved only from chunks whose metadata matches
+        POST /documents {"documents": [{"text": "...", "metadata": {"collection": "news"}}]}
+                      -> {"added": chunks, "vectors": N}; documents are chunked,
+                      embedded and searchable as soon as the call returns
+        GET  /health  -> {"status": "ok", "vectors": N, "live_vectors": L, "response_cache": {...}}
+        GET  /metrics -> stage latency histograms and counters in the Prometheus
+                      text format (empty unless METRICS_ENABLED)
+    
+    All connections are served by one event loop; queries run concurrently
+    through RAGPipeline.aquery, bounded by `max_concurrency`. Documents are
+    added as live updates of the index (see VectorDatabase), so queries keep
+    being served while they are indexed.
+    """
+    
+    def __init__(self, pipeline: RAGPipeline, host: str = None, port: int = None, max_concurrency: int = None):
+        """
+        Initialize server
+        
+        Args:
+            pipeline: Pipeline with a loaded index
+            host: Interface to bind (uses config default if None)
+            port: Port to bind, 0 for any free port (uses config default if None)
+            max_concurrency: Queries processed at once (uses config default if None)
+        """
+        self.pipeline = pipeline
+        self.host = host or Config.SERVER_HOST
+        self.port = Config.SERVER_PORT if port is None else port
+        self.max_concurrency = max_concurrency or Config.SERVER_MAX_CONCURRENCY
+        self.requests_served = 0
+        self._server = None
+        self._semaphore = None
+    
+    async def start(self):
+        """Bind the listening socket and start accepting connections"""
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port, backlog=1024)
+        self.port = self._server.sockets[0].getsockname()[1]
+        logger.info(f"Serving RAG queries on http://{self.host}:{self.port}")
+    
+    async def serve_forever(self):
+        """Start the server and serve until cancelled"""
+        await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+    
+    async def stop(self):
+        """Stop accepting connections"""
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+    
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, dict, bytes]]:
+        """
+        Read one HTTP request from a connection
+        
+        Returns:
+            Tuple of (method, path, headers, body), or None when the client closed the connection
+        
+        Raises:
+            RequestTooLarge: If the body is longer than MAX_BODY_BYTES
+            ValueError: If the request line or Content-Length is malformed
+        """
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode("latin-1").split(" ", 2)
+        
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        length = int(headers.get("content-length", 0))
+        if length < 0:
+            raise ValueError("Negative Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise RequestTooLarge("Request body too large")
+        body = await reader.readexactly(length) if length else b""
+        return method, path, headers, body
+    
+    @staticmethod
+    def _write_response(writer: asyncio.StreamWriter, status: int, payload, keep_alive: bool):
+        if isinstance(payload, str):
+            body = payload.encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            body = json.dumps(payload).encode("utf-8")
+            content_type = "application/json"
+        head = (
+            f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        )
+        writer.write(head.encode("latin-1") + body)
+    
+    async def _write_stream(self, writer: asyncio.StreamWriter, query: StreamedQuery, keep_alive: bool):
+        """Stream a query's response to the client with chunked transfer encoding"""
+        writer.write((
+            "HTTP/1.1 200 OK\r\n"
+            "Content-Type: text/plain; charset=utf-8\r\n"
+            "Transfer-Encoding: chunked\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+        ).encode("latin-1"))
+        
+        start = time.perf_counter()
+        async with self._semaphore:
+            try:
+                async for token in self.pipeline.aquery_stream(query.query, query.filters):
+                    data = token.encode("utf-8")
+                    writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+                    await writer.drain()
+            except ConnectionError:
+                raise
+            except Exception as e:
+                # Headers are already sent; end the body with the error text
+                logger.error(f"Error serving query: {str(e)}")
+                data = f"\n[error: {e}]".encode("utf-8")
+                writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        self.requests_served += 1
+        debug_log(logger, "Streamed query in %.1f ms", (time.perf_counter() - start) * 1000)
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one keep-alive connection until it closes"""
+        try:
+            while True:
+                try:
+                    request = await self._read_request(reader)
+                except RequestTooLarge:
+                    self._write_response(writer, 413, {"error": "Request body too large"}, False)
+                    await writer.drain()
+                    break
+                except ValueError:
+                    self._write_response(writer, 400, {"error": "Malformed HTTP request"}, False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                status, payload = await self._dispatch(method, path, body)
+                if isinstance(payload, StreamedQuery):
+                    await self._write_stream(writer, payload, keep_alive)
+                else:
+                    self._write_response(writer, status, payload, keep_alive)
+                    await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+    
+    async def _dispatch(self, method: str, path: str, body: bytes) -> Tuple[int, object]:
+        """Route a request and return (status, JSON payload, text payload or StreamedQuery)"""
+        if method == "GET" and path == "/health":
+            vector_db = self.pipeline.vector_db
+            payload = {"status": "ok", "vectors": len(vector_db) if vector_db is not None else 0}
+            if vector_db is not None:
+                payload["live_vectors"] = vector_db.live_count
+            if self.pipeline.response_cache is not None:
+                payload["response_cache"] = self.pipeline.response_cache.stats()
+            return 200, payload
+        
+        if method == "GET" and path == "/metrics":
+            return 200, metrics.render_prometheus()
+        
+        if method == "POST" and path == "/query":
+            try:
+                request = json.loads(body)
+                query = request["query"]
+                if not isinstance(query, str) or not query.strip():
+                    raise ValueError
+            except (ValueError, KeyError, TypeError):
+                return 400, {"error": "Expected a JSON body with a non-empty 'query' string"}
+            filters = request.get("filters") or None
+            if filters is not None:
+                try:
+                    filters = normalize_filters(filters)
+                    unknown = [field for field in filters if field not in Config.FILTER_FIELDS]
+                    if unknown:
+                        raise ValueError(f"Cannot filter on {', '.join(unknown)}; filterable fields: {', '.join(Config.FILTER_FIELDS)}")
+                except ValueError as e:
+                    return 400, {"error": str(e)}
+            if request.get("stream"):
+                return 200, StreamedQuery(query, filters)
+            
+            start = time.perf_counter()
+            async with self._semaphore:
+                try:
+                    response = await self.pipeline.aquery(query, filters)
+                except Exception as e:
+                    logger.error(f"Error serving query: {str(e)}")
+                    return 500, {"error": str(e)}
+            latency_ms = (time.perf_counter() - start) * 1000
+            self.requests_served += 1
+            debug_log(logger, "Served query in %.1f ms", latency_ms)
+            return 200, {"response": response, "latency_ms": round(latency_ms, 2)}
+        
+        if method == "POST" and path == "/documents":
+            return await self._add_documents(body)
+        
+        return 404, {"error": f"Unknown endpoint {method} {path}"}
+    
+    async def _add_documents(self, body: bytes) -> Tuple[int, object]:
+        """Chunk, embed and add posted documents to the index while queries are served"""
+        try:
+            documents = json.loads(body)["documents"]
+            texts, metadatas = [], []
+            for document in documents:
+                text, metadata = document["text"], document.get("metadata") or {}
+                if not isinstance(text, str) or not isinstance(metadata, dict):
+                    raise TypeError
+                for chunk in split_text_into_chunks(text):
+                    texts.append(chunk)
+                    metadatas.append(dict(metadata))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {"error": "Expected a JSON body with a 'documents' list of {\"text\": ..., \"metadata\": {...}} objects"}
+        
+        await self.pipeline.await_index()
+        vector_db = self.pipeline.vector_db
+        if vector_db is None or not vector_db.segments:
+            return 400, {"error": "The index does not take live updates (WAL_ENABLED is off or it was never saved)"}
+        try:
+            await asyncio.to_thread(vector_db.add_documents, texts, metadatas)
+        except Exception as e:
+            logger.error(f"Error adding documents: {str(e)}")
+            return 500, {"error": str(e)}
+        return 200, {"added": len(texts), "vectors": len(vector_db)}
+
+def run_rag_server(doc_path: str = None, host: str = None, port: int = None):
+    """
+    Index or load documents once, then serve queries over HTTP until interrupted
+    
+    Args:
+        doc_path: Path to document file or directory (optional)
+        host: Interface to bind (uses config default if None)
+        port: Port to bind (uses config default if None)
+    """
+    logger.info("Running RAG server")
+    
+    pipeline = create_pipeline(doc_path)
+    if pipeline.vector_db is None:
+        raise ValueError("No documents indexed. Pass --docs or build an index first.")
+    
+    server = RAGServer(pipeline, host, port)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    
+    logger.info(f"RAG server stopped after {server.requests_served} queries")
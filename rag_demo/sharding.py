@@ -0,0 +1,227 @@
+import atexit
+import heapq
+import itertools
+import multiprocessing
+import os
+import threading
+from typing import List, Tuple
+import numpy as np
+from .logger import logger, debug_log
+from .config import Config
+from .metadata_index import MetadataIndex
+from .storage import read_header, read_tombstones
+from .vector_index import create_vector_index
+
+# BLAS thread pools are limited to one thread in shard workers, since the
+# shards themselves already use every core
+_WORKER_ENVIRONMENT = {
+    "OMP_NUM_THREADS": "1",
+    "OPENBLAS_NUM_THREADS": "1",
+    "MKL_NUM_THREADS": "1"
+}
+
+# Guards os.environ while worker processes are being started
+_environment_lock = threading.Lock()
+
+def shard_ranges(count: int, shards: int) -> List[Tuple[int, int]]:
+    """
+    Split vector ids 0..count into contiguous, nearly equal ranges
+    
+    Args:
+        count: Number of vectors
+        shards: Number of ranges
+    
+    Returns:
+        List of (start, end) id ranges, without empty ranges
+    """
+    bounds = np.linspace(0, count, max(shards, 1) + 1).astype(np.int64)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def merge_shard_results(shard_results: List[Tuple[np.ndarray, np.ndarray]], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge the per-shard top-k of a block of queries into the global top-k
+    
+    Each shard's results are already sorted best first, so a k-way heap
+    merge only looks at the heads of the shard lists.
+    
+    Args:
+        shard_results: (scores, ids) arrays of shape (num_queries, k') from each shard, global ids
+        k: Number of results per query
+    
+    Returns:
+        Tuple of (scores, ids) arrays of shape (num_queries, k), padded with id -1 and score -inf
+    """
+    num_queries = len(shard_results[0][0])
+    scores = np.full((num_queries, k), -np.inf, dtype=np.float32)
+    ids = np.full((num_queries, k), -1, dtype=np.int64)
+    for row in range(num_queries):
+        streams = [
+            zip(shard_scores[row].tolist(), shard_ids[row].tolist())
+            for shard_scores, shard_ids in shard_results
+        ]
+        merged = heapq.merge(*streams, key=lambda item: -item[0])
+        for column, (score, doc_id) in enumerate(itertools.islice(merged, k)):
+            if doc_id < 0:
+                break
+            scores[row, column], ids[row, column] = score, doc_id
+    return scores, ids
+
+def _shard_worker(connection, db_path: str, start: int, end: int):
+    """
+    Serve searches over one id range of a saved index (runs in a worker process)
+    
+    The saved index is opened memory-mapped, so every worker maps the same
+    files and the OS page cache holds a single copy of the vectors.
+    
+    Args:
+        connection: Pipe end receiving (queries, k, filters) and sending (scores, ids) with global ids
+        db_path: Saved vector database directory
+        start: First vector id of the shard
+        end: Vector id after the last one
+    """
+    header = read_header(db_path)
+    index = create_vector_index(header.get("index_type", "flat"))
+    index.load(db_path, header)
+    shard = index.shard(start, end)
+    deleted = read_tombstones(db_path, header)
+    allowed = ~deleted[start:end] if deleted is not None else None
+    filter_index = None
+    if MetadataIndex.exists(db_path):
+        try:
+            filter_index = MetadataIndex()
+            filter_index.load(db_path, header["count"])
+            filter_index = filter_index.shard(start, end)
+        except ValueError:
+            filter_index = None
+    connection.send("ready")
+    
+    while True:
+        try:
+            request = connection.recv()
+        except EOFError:
+            return
+        if request is None:
+            return
+        queries, k, filters = request
+        try:
+            shard_allowed = allowed
+            if filters:
+                if filter_index is None:
+                    raise RuntimeError("The saved index has no metadata index to filter on")
+                matches = filter_index.mask(filters)
+                shard_allowed = matches if allowed is None else allowed & matches
+            scores, ids = shard.search(queries, k, shard_allowed)
+            connection.send((scores, np.where(ids >= 0, ids + start, -1)))
+        except Exception as e:
+            connection.send(e)
+
+class ShardedSearcher:
+    """
+    Scatter-gather vector search over a saved index split across processes
+    
+    The id space of the saved index is split into contiguous shards and each
+    shard is served by its own worker process, which memory-maps the saved
+    files read-only and searches only its rows. A query block is sent to all
+    shards at once, every shard returns its local top-k and the results are
+    merged with a heap. Shards are addressed only by (db_path, id range) and
+    talk over pipes, so a shard could later live on another node.
+    """
+    
+    def __init__(self, db_path: str, shards: int = None):
+        """
+        Start the shard workers for a saved index
+        
+        Args:
+            db_path: Saved vector database directory
+            shards: Number of worker processes (uses config default if None)
+        """
+        if shards is None:
+            shards = Config.SEARCH_SHARDS
+        header = read_header(db_path)
+        self.db_path = db_path
+        self.generation = header.get("generation", 0)
+        self.ranges = shard_ranges(header["count"], shards)
+        
+        self._lock = threading.Lock()
+        self._connections = []
+        self._processes = []
+        
+        # Spawned (not forked) workers start from a clean interpreter and read
+        # the BLAS thread limits from their environment at import
+        context = multiprocessing.get_context("spawn")
+        with _environment_lock:
+            saved = {name: os.environ.get(name) for name in _WORKER_ENVIRONMENT}
+            os.environ.update(_WORKER_ENVIRONMENT)
+            try:
+                for start, end in self.ranges:
+                    parent, child = context.Pipe()
+                    process = context.Process(
+                        target=_shard_worker, args=(child, db_path, start, end),
+                        name=f"shard-{start}-{end}", daemon=True
+                    )
+                    process.start()
+                    child.close()
+                    self._connections.append(parent)
+                    self._processes.append(process)
+            finally:
+                for name, value in saved.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+        
+        try:
+            for connection in self._connections:
+                connection.recv()
+        except EOFError:
+            self.close()
+            raise RuntimeError(f"A search shard of {db_path} failed to start")
+        atexit.register(self.close)
+        logger.info(f"Started {len(self.ranges)} search shards over {header['count']} vectors")
+    
+    def search(self, queries: np.ndarray, k: int, filters: dict = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Search all shards in parallel and merge their results
+        
+        Args:
+            queries: Normalized float32 array of shape (num_queries, dim)
+            k: Number of results per query
+            filters: Metadata filter expression, evaluated by each shard over its own rows (optional)
+        
+        Returns:
+            Tuple of (scores, ids) arrays of shape (num_queries, k), best first;
+            missing results are padded with id -1 and score -inf
+        """
+        with self._lock:
+            if not self._connections:
+                raise RuntimeError("Sharded searcher is closed")
+            try:
+                # Scatter to every shard before gathering, so the shards search concurrently
+                for connection in self._connections:
+                    connection.send((queries, k, filters))
+                shard_results = [connection.recv() for connection in self._connections]
+            except (EOFError, OSError) as e:
+                raise RuntimeError(f"A search shard stopped: {str(e)}") from e
+        
+        for result in shard_results:
+            if isinstance(result, Exception):
+                raise result
+        debug_log(logger, "Merged results of %s shards for %s queries", len(shard_results), len(queries))
+        return merge_shard_results(shard_results, k)
+    
+    def close(self):
+        """Stop the shard workers"""
+        atexit.unregister(self.close)
+        with self._lock:
+            connections, self._connections = self._connections, []
+            processes, self._processes = self._processes, []
+        for connection in connections:
+            try:
+                connection.send(None)
+            except OSError:
+                pass
+            connection.close()
+        for process in processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
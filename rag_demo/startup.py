@@ -0,0 +1,143 @@
+import importlib.abc
+import sys
+import threading
+import time
+from collections import defaultdict
+from typing import List, Tuple
+
+# Packages listed individually in the import breakdown; the rest are summed as "other"
+TOP_PACKAGES = 10
+
+class _TimedLoader:
+    """Loader proxy timing module creation and execution, restoring the real loader afterwards"""
+    
+    def __init__(self, loader, profiler: "StartupProfiler", name: str):
+        self._loader = loader
+        self._profiler = profiler
+        self._name = name
+    
+    def __getattr__(self, attribute):
+        return getattr(self._loader, attribute)
+    
+    def create_module(self, spec):
+        with self._profiler._timing(self._name):
+            return self._loader.create_module(spec)
+    
+    def exec_module(self, module):
+        try:
+            with self._profiler._timing(self._name):
+                self._loader.exec_module(module)
+        finally:
+            module.__loader__ = self._loader
+            if getattr(module, "__spec__", None) is not None:
+                module.__spec__.loader = self._loader
+
+class _TimingFinder(importlib.abc.MetaPathFinder):
+    """Meta path finder wrapping the loader found by the other finders"""
+    
+    def __init__(self, profiler: "StartupProfiler"):
+        self._profiler = profiler
+    
+    def find_spec(self, fullname, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                if spec.loader is not None and hasattr(spec.loader, "exec_module"):
+                    spec.loader = _TimedLoader(spec.loader, self._profiler, fullname)
+                return spec
+        return None
+
+class StartupProfiler:
+    """
+    Import-time and startup-stage breakdown printed by --profile-startup
+    
+    While installed, a meta path finder times the loading of every newly
+    imported module, like `python -X importtime`: each module's self time
+    excludes the modules it imports, so the self times add up to the total
+    import time and can be summed per top-level package. Startup stages are
+    marked with their time since the profiler's start.
+    """
+    
+    def __init__(self, start: float = None):
+        """
+        Initialize profiler
+        
+        Args:
+            start: time.perf_counter() value that stage times are relative to (default: now)
+        """
+        self.start = time.perf_counter() if start is None else start
+        self.stages: List[Tuple[str, float]] = []
+        self.import_seconds = defaultdict(float)
+        self._finder = _TimingFinder(self)
+        self._local = threading.local()
+    
+    def install(self):
+        """Start timing imports"""
+        if self._finder not in sys.meta_path:
+            sys.meta_path.insert(0, self._finder)
+    
+    def uninstall(self):
+        """Stop timing imports"""
+        if self._finder in sys.meta_path:
+            sys.meta_path.remove(self._finder)
+    
+    def _timing(self, name: str):
+        return _ImportTimer(self, name)
+    
+    def mark(self, stage: str):
+        """
+        Record that a startup stage has completed
+        
+        Args:
+            stage: Stage name
+        """
+        self.stages.append((stage, time.perf_counter() - self.start))
+    
+    def report(self) -> str:
+        """
+        Format the breakdown
+        
+        Returns:
+            Multi-line report of import time per package and of the startup stages
+        """
+        total = sum(self.import_seconds.values())
+        by_package = defaultdict(float)
+        for name, seconds in self.import_seconds.items():
+            by_package[name.split(".")[0]] += seconds
+        ranked = sorted(by_package.items(), key=lambda item: item[1], reverse=True)
+        
+        lines = [f"Imports: {total * 1000:.1f} ms in {len(self.import_seconds)} modules (self time per package)"]
+        for package, seconds in ranked[:TOP_PACKAGES]:
+            lines.append(f"  {package:<28} {seconds * 1000:>8.1f} ms")
+        if len(ranked) > TOP_PACKAGES:
+            rest = sum(seconds for _, seconds in ranked[TOP_PACKAGES:])
+            lines.append(f"  {f'other ({len(ranked) - TOP_PACKAGES} packages)':<28} {rest * 1000:>8.1f} ms")
+        
+        lines.append("")
+        lines.append(f"  {'stage':<40} {'at ms':>8} {'took ms':>8}")
+        previous = 0.0
+        for stage, at in self.stages:
+            lines.append(f"  {stage:<40} {at * 1000:>8.1f} {(at - previous) * 1000:>8.1f}")
+            previous = at
+        return "\n".join(lines)
+
+class _ImportTimer:
+    """Context manager accumulating one module's self time on a per-thread stack"""
+    
+    def __init__(self, profiler: StartupProfiler, name: str):
+        self.profiler = profiler
+        self.name = name
+    
+    def __enter__(self):
+        stack = self.profiler._local.__dict__.setdefault("stack", [])
+        stack.append([time.perf_counter(), 0.0])
+    
+    def __exit__(self, *exc_info):
+        stack = self.profiler._local.stack
+        started, children = stack.pop()
+        elapsed = time.perf_counter() - started
+        self.profiler.import_seconds[self.name] += elapsed - children
+        if stack:
+            stack[-1][1] += elapsed
@@ -0,0 +1,576 @@
+import contextlib
+import json
+import mmap
+import os
+import threading
+from typing import Iterator, List
+import numpy as np
+from .logger import logger, debug_log
+
+# On-disk layout of a saved vector database directory
+HEADER_FILE = "header.json"
+VECTORS_FILE = "vectors.f32"
+METADATA_FILE = "metadata.bin"
+OFFSETS_FILE = "metadata.idx"
+DELETED_FILE = "deleted.bits"
+# Header of a save whose staged files are being moved into place, see save_transaction
+PENDING_HEADER_FILE = "header.pending.json"
+STAGED_SUFFIX = ".staged"
+
+FORMAT_NAME = "rag_demo.vector_db"
+FORMAT_VERSION = 1
+
+# Files replaced and removed by the save in progress on this thread, see save_transaction
+_transaction = threading.local()
+
+class MetadataStore:
+    """
+    List-like store of per-vector metadata dictionaries
+    
+    Records loaded from disk stay encoded in a memory-mapped file and are
+    decoded on access; records appended afterwards are kept in memory.
+    Dictionaries returned for on-disk records are fresh copies, so mutating
+    them does not change the store.
+    """
+    
+    def __init__(self, records: List[dict] = None):
+        """
+        Initialize metadata store
+        
+        Args:
+            records: Initial in-memory records (optional)
+        """
+        self._mmap = None
+        self._offsets = np.zeros(1, dtype=np.uint64)
+        self._appended = list(records) if records else []
+        
+        # Files this store was loaded from or last saved to, and how many
+        # records they hold; later saves to the same files only append
+        self._saved_paths = None
+        self._saved_count = 0
+        self._saved_size = 0
+    
+    @classmethod
+    def open(cls, metadata_path: str, offsets_path: str, count: int) -> "MetadataStore":
+        """
+        Open a saved metadata store without decoding its records
+        
+        Args:
+            metadata_path: File of concatenated UTF-8 JSON records
+            offsets_path: File of uint64 record offsets
+            count: Number of records described by the header
+        
+        Returns:
+            MetadataStore backed by the memory-mapped files
+        """
+        store = cls()
+        # Files may carry a tail from an interrupted save; the header count is authoritative
+        store._offsets = np.fromfile(offsets_path, dtype=np.uint64, count=count + 1)
+        if len(store._offsets) != count + 1:
+            raise ValueError(f"Corrupt metadata index {offsets_path}: expected {count + 1} offsets")
+        if store._offsets[-1] > 0:
+            with open(metadata_path, "rb") as f:
+                store._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        store._saved_paths = (metadata_path, offsets_path)
+        store._saved_count = count
+        store._saved_size = int(store._offsets[-1])
+        return store
+    
+    @property
+    def _stored_count(self) -> int:
+        return len(self._offsets) - 1
+    
+    def __len__(self) -> int:
+        return self._stored_count + len(self._appended)
+    
+    def __getitem__(self, index: int) -> dict:
+        if index < 0:
+            index += len(self)
+        if index < self._stored_count:
+            start, end = int(self._offsets[index]), int(self._offsets[index + 1])
+            return json.loads(self._mmap[start:end])
+        return self._appended[index - self._stored_count]
+    
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+    
+    def append(self, record: dict):
+        """Append a record"""
+        self._appended.append(record)
+    
+    @staticmethod
+    def _encode(record: dict) -> bytes:
+        return json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    
+    def save(self, metadata_path: str, offsets_path: str):
+        """
+        Write all records as concatenated JSON with a uint64 offsets index
+        
+        When the files already hold a prefix of this store (it was loaded
+        from or saved to them), only the new records are appended; otherwise
+        both files are rewritten and atomically replaced.
+        
+        Args:
+            metadata_path: Destination of the concatenated records
+            offsets_path: Destination of the uint64 offsets
+        """
+        if self._saved_paths == (metadata_path, offsets_path) and os.path.exists(metadata_path):
+            new_records = [self[i] for i in range(self._saved_count, len(self))]
+            base_size, base_count = self._saved_size, self._saved_count
+        else:
+            new_records = list(self)
+            base_size, base_count = 0, 0
+        
+        encoded = [self._encode(record) for record in new_records]
+        offsets = base_size + np.cumsum([len(e) for e in encoded], dtype=np.uint64)
+        
+        if base_count == 0:
+            write_bytes(metadata_path, b"".join(encoded))
+            write_array(offsets_path, np.concatenate(([0], offsets)).astype(np.uint64))
+        else:
+            append_bytes(metadata_path, b"".join(encoded), base_size)
+            append_bytes(offsets_path, offsets.astype(np.uint64).tobytes(), (base_count + 1) * 8)
+        
+        self._saved_paths = (metadata_path, offsets_path)
+        self._saved_count = len(self)
+        self._saved_size = int(offsets[-1]) if len(offsets) else base_size
+
+class RowBuffer:
+    """
+    Append-only 2-D array with amortized growth
+    
+    Rows live in a preallocated array whose capacity grows geometrically,
+    or, for a buffer opened from disk, in its file: appending to an opened
+    buffer writes the rows after the ones the file holds and remaps it
+    read-only, so the saved rows are never copied into memory. Saving to the
+    file a buffer was opened from (or last saved to) only appends the rows
+    the file does not hold yet.
+    """
+    
+    # Initial row capacity; grown geometrically
+    INITIAL_CAPACITY = 1024
+    GROWTH_FACTOR = 2
+    
+    def __init__(self, dtype, width: int = 0):
+        """
+        Initialize an empty buffer
+        
+        Args:
+            dtype: Element type
+            width: Row width, or 0 to take it from the first append
+        """
+        self.dtype = np.dtype(dtype)
+        self._width = width
+        # Only the first self._count rows are valid, the rest is spare capacity
+        self._array = None
+        self._count = 0
+        
+        # File this buffer was opened from or saved to, and its row count
+        self._saved_path = None
+        self._saved_count = 0
+        # (path, (st_dev, st_ino)) of the file whose memory map holds the rows
+        # of an opened buffer; appends extend that file
+        self._file = None
+    
+    @classmethod
+    def open(cls, path: str, dtype, count: int, width: int) -> "RowBuffer":
+        """
+        Memory-map a saved buffer read-only
+        
+        Args:
+            path: File written by save()
+            dtype: Element type
+            count: Number of rows
+            width: Row width
+            
+        Returns:
+            RowBuffer backed by the file
+        """
+        buffer = cls(dtype, width)
+        buffer._array = open_array(path, dtype, (count, width))
+        buffer._count = count
+        buffer._saved_path, buffer._saved_count = path, count
+        stat = os.stat(path)
+        buffer._file = (path, (stat.st_dev, stat.st_ino))
+        return buffer
+    
+    def __len__(self) -> int:
+        return self._count
+    
+    @property
+    def width(self) -> int:
+        return self._width
+    
+    @property
+    def data(self) -> np.ndarray:
+        """Valid rows, shape (len, width)"""
+        if self._array is None:
+            return np.empty((0, self._width), dtype=self.dtype)
+        return self._array[:self._count]
+    
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the valid rows"""
+        return self._count * self._width * self.dtype.itemsize
+    
+    def view(self, start: int, end: int) -> "RowBuffer":
+        """
+        Read-only buffer over rows [start, end) sharing this buffer's memory
+        
+        Args:
+            start: First row
+            end: Row after the last one
+        
+        Returns:
+            RowBuffer without a backing file; appending to it copies its rows
+        """
+        buffer = RowBuffer(self.dtype, self._width)
+        buffer._array = self.data[start:end]
+        buffer._array.flags.writeable = False
+        buffer._count = len(buffer._array)
+        return buffer
+    
+    def _reserve(self, extra: int):
+        """Make room for at least `extra` more rows"""
+        needed = self._count + extra
+        if self._array is None:
+            self._array = np.empty((max(self.INITIAL_CAPACITY, extra), self._width), dtype=self.dtype)
+            return
+        
+        capacity = self._array.shape[0]
+        # Views and buffers whose file was replaced are read-only; copy them on first write
+        if needed <= capacity and self._array.flags.writeable:
+            return
+        capacity = max(capacity, self.INITIAL_CAPACITY)
+        while capacity < needed:
+            capacity *= self.GROWTH_FACTOR
+        grown = np.empty((capacity, self._width), dtype=self.dtype)
+        grown[:self._count] = self._array[:self._count]
+        self._array = grown
+        debug_log(logger, "Grew %s row buffer capacity to %s rows", self.dtype, capacity)
+    
+    def _file_is_current(self) -> bool:
+        """
+        Check that the backing file is still the one that was opened
+        
+        A file replaced in the meantime (e.g. by a compacting save) no longer
+        holds this buffer's rows; the buffer then keeps them in memory.
+        """
+        path, identity = self._file
+        try:
+            stat = os.stat(path)
+        except OSError:
+            stat = None
+        if stat is None or (stat.st_dev, stat.st_ino) != identity:
+            self._file = None
+            self._saved_path = None
+            return False
+        return True
+    
+    def _append_to_file(self, rows: np.ndarray) -> bool:
+        """
+        Write rows after those of the backing file and remap it
+        
+        Past the rows a saved header describes, the file may be extended
+        while it is memory-mapped, by this or another process.
+        
+        Returns:
+            False if the file was replaced since it was opened
+        """
+        if not self._file_is_current():
+            return False
+        path = self._file[0]
+        row_bytes = self._width * self.dtype.itemsize
+        append_bytes(path, np.ascontiguousarray(rows, dtype=self.dtype).tobytes(), self._count * row_bytes)
+        self._count += len(rows)
+        self._array = open_array(path, self.dtype, (self._count, self._width))
+        debug_log(logger, "Appended %s rows to %s", len(rows), path)
+        return True
+    
+    def append(self, rows: np.ndarray):
+        """
+        Append rows
+        
+        Args:
+            rows: Array of shape (n, width)
+        """
+        if len(rows) == 0:
+            return
+        if self._count == 0:
+            self._width = rows.shape[1]
+            if self._array is not None and self._array.shape[1] != self._width:
+                self._array = None
+                self._file = None
+        elif rows.shape[1] != self._width:
+            raise ValueError(f"Row width mismatch: buffer has {self._width}, got {rows.shape[1]}")
+        
+        if self._file is not None and self._append_to_file(rows):
+            return
+        self._reserve(len(rows))
+        self._array[self._count:self._count + len(rows)] = rows
+        self._count += len(rows)
+    
+    def save(self, path: str):
+        """
+        Write the rows as a raw binary file
+        
+        Args:
+            path: Destination file
+        """
+        if self._file is not None and path == self._file[0] and self._file_is_current():
+            # Appended rows were written to the file already
+            pass
+        elif path == self._saved_path and 0 < self._saved_count <= self._count and os.path.exists(path):
+            # Rows are append-only, so the file already holds a prefix of them
+            row_bytes = self._width * self.dtype.itemsize
+            new_rows = np.ascontiguousarray(self._array[self._saved_count:self._count])
+            append_bytes(path, new_rows.tobytes(), self._saved_count * row_bytes)
+        else:
+            write_array(path, self.data)
+        self._saved_path, self._saved_count = path, self._count
+
+def index_exists(db_path: str) -> bool:
+    """
+    Check whether a saved vector database exists at a path
+    
+    Args:
+        db_path: Vector database directory
+    
+    Returns:
+        True if a complete saved index is present (possibly a committed save that load completes)
+    """
+    return (os.path.isfile(os.path.join(db_path, HEADER_FILE))
+            or os.path.isfile(os.path.join(db_path, PENDING_HEADER_FILE)))
+
+@contextlib.contextmanager
+def save_transaction(db_path: str) -> Iterator[None]:
+    """
+    Make the header written by write_header the commit point of a save
+    
+    Within the transaction, files replaced by write_bytes/write_array are
+    written under a staged name and files removed by remove_file are kept,
+    so a crash before the header is written leaves the previous saved index
+    intact (appends only go past the end its header describes). write_header
+    first writes a pending header listing the staged files, then moves them
+    into place and replaces the header; a crash after the pending header is
+    written is rolled forward by complete_pending_save.
+    
+    Args:
+        db_path: Vector database directory; staged files left there by an
+            interrupted save are removed first
+    """
+    for name in os.listdir(db_path):
+        if name.endswith(STAGED_SUFFIX):
+            os.remove(os.path.join(db_path, name))
+    _transaction.staged, _transaction.removed = [], []
+    try:
+        yield
+    finally:
+        _transaction.staged = _transaction.removed = None
+
+def _replacement_path(path: str) -> str:
+    """File to write a new version of path to: staged within a save transaction, else temporary"""
+    staged = getattr(_transaction, "staged", None)
+    if staged is None:
+        return path + ".tmp"
+    if path not in staged:
+        staged.append(path)
+    return path + STAGED_SUFFIX
+
+def _replace(temporary: str, path: str):
+    if not temporary.endswith(STAGED_SUFFIX):
+        os.replace(temporary, path)
+
+def write_bytes(path: str, data: bytes):
+    """
+    Atomically replace a file's contents
+    
+    The data is written to a temporary name and renamed into place, so the
+    file is never seen half-written and processes that still memory-map the
+    previous version keep reading it unchanged. Within a save_transaction the
+    rename waits for the header.
+    
+    Args:
+        path: Destination file
+        data: File contents
+    """
+    temporary = _replacement_path(path)
+    with open(temporary, "wb") as f:
+        f.write(data)
+    _replace(temporary, path)
+
+def write_array(path: str, array: np.ndarray):
+    """
+    Atomically write an array as a raw binary file
+    
+    Args:
+        path: Destination file
+        array: Array to write in C order
+    """
+    temporary = _replacement_path(path)
+    np.ascontiguousarray(array).tofile(temporary)
+    _replace(temporary, path)
+
+def remove_file(path: str):
+    """
+    Remove a data file that the index no longer uses, once the header is written within a save_transaction
+    
+    Args:
+        path: File to remove (missing files are ignored)
+    """
+    removed = getattr(_transaction, "removed", None)
+    if removed is not None:
+        removed.append(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def append_bytes(path: str, data: bytes, offset: int):
+    """
+    Append data after the first `offset` bytes of a file
+    
+    Anything past `offset` (left by an interrupted save) is discarded first.
+    Readers only look at the prefix their header describes, so appending in
+    place is safe while other processes memory-map the file.
+    
+    Args:
+        path: File to extend
+        data: Bytes to append
+        offset: Length of the valid prefix
+    """
+    with open(path, "r+b") as f:
+        f.truncate(offset)
+        f.seek(offset)
+        f.write(data)
+
+def open_array(path: str, dtype, shape: tuple, offset: int = 0) -> np.ndarray:
+    """
+    Memory-map a raw binary array file read-only
+    
+    Args:
+        path: File written by write_array
+        dtype: Element type
+        shape: Array shape
+        offset: Byte offset of the array in the file
+    
+    Returns:
+        Read-only array; pages are read lazily and shared between processes
+    """
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape, offset=offset)
+
+def read_tombstones(db_path: str, header: dict) -> np.ndarray:
+    """
+    Read the deleted-vector mask of a saved database
+    
+    Args:
+        db_path: Vector database directory
+        header: Saved header
+    
+    Returns:
+        Boolean array with True for deleted ids, or None when nothing is deleted
+    """
+    if not header.get("deleted"):
+        return None
+    bits = np.fromfile(os.path.join(db_path, DELETED_FILE), dtype=np.uint8)
+    return np.unpackbits(bits, count=header["count"]).astype(bool)
+
+def tombstone_range(deleted: np.ndarray, start: int, count: int) -> np.ndarray:
+    """
+    Deleted flags of the ids start..start + count
+    
+    Args:
+        deleted: Boolean tombstone mask, which may not cover the newest ids yet
+        start: First id
+        count: Number of ids
+    
+    Returns:
+        Boolean array of length count; ids past the end of the mask are not deleted
+    """
+    flags = deleted[start:start + count]
+    if len(flags) < count:
+        flags = np.concatenate((flags, np.zeros(count - len(flags), dtype=bool)))
+    return flags
+
+def write_header(db_path: str, header: dict):
+    """
+    Write the database header
+    
+    The header is written last by a save and describes only complete data,
+    so it is what makes a save visible to readers. Within a save_transaction,
+    writing the pending header commits the save and the staged files are
+    moved into place afterwards.
+    
+    Args:
+        db_path: Vector database directory
+        header: Header fields (format and version are added)
+    """
+    header = dict(header, format=FORMAT_NAME, version=FORMAT_VERSION)
+    staged = getattr(_transaction, "staged", None)
+    if staged is None:
+        write_bytes(os.path.join(db_path, HEADER_FILE), json.dumps(header, indent=2).encode("utf-8"))
+    else:
+        pending = {
+            "header": header,
+            "staged": [os.path.basename(path) for path in staged],
+            "removed": [os.path.basename(path) for path in _transaction.removed]
+        }
+        with open(os.path.join(db_path, PENDING_HEADER_FILE) + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(pending, f)
+        os.replace(os.path.join(db_path, PENDING_HEADER_FILE) + ".tmp", os.path.join(db_path, PENDING_HEADER_FILE))
+        # Committed: what remains is repeatable, and must not be staged again
+        _transaction.staged = _transaction.removed = None
+        complete_pending_save(db_path)
+    debug_log(logger, "Wrote header for %s vectors to %s", header.get('count'), db_path)
+
+def complete_pending_save(db_path: str) -> bool:
+    """
+    Finish a committed save: move its staged files into place, then write its header
+    
+    Every step can be repeated, so a save interrupted at any point after its
+    pending header was written is completed by calling this again (load
+    does). A save interrupted before that leaves only unused staged files.
+    
+    Args:
+        db_path: Vector database directory
+    
+    Returns:
+        True if a pending save was completed
+    """
+    pending_path = os.path.join(db_path, PENDING_HEADER_FILE)
+    if not os.path.exists(pending_path):
+        return False
+    with open(pending_path, "r", encoding="utf-8") as f:
+        pending = json.load(f)
+    for name in pending["staged"]:
+        path = os.path.join(db_path, name)
+        if os.path.exists(path + STAGED_SUFFIX):
+            os.replace(path + STAGED_SUFFIX, path)
+    for name in pending["removed"]:
+        if os.path.exists(os.path.join(db_path, name)):
+            os.remove(os.path.join(db_path, name))
+    write_bytes(os.path.join(db_path, HEADER_FILE), json.dumps(pending["header"], indent=2).encode("utf-8"))
+    os.remove(pending_path)
+    return True
+
+def read_header(db_path: str) -> dict:
+    """
+    Read and validate the database header
+    
+    Args:
+        db_path: Vector database directory
+    
+    Returns:
+        Header dictionary
+    """
+    with open(os.path.join(db_path, HEADER_FILE), "r", encoding="utf-8") as f:
+        header = json.load(f)
+    
+    if header.get("format") != FORMAT_NAME:
+        raise ValueError(f"Not a vector database: {db_path}")
+    if header.get("version") != FORMAT_VERSION:
+        raise ValueError(
+            f"Unsupported vector database version {header.get('version')} (expected {FORMAT_VERSION})"
+        )
+    return header
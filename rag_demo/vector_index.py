@@ -0,0 +1,689 @@
+import json
+import os
+import threading
+import numpy as np
+from typing import Tuple
+from .logger import logger
+from .config import Config
+from .quantization import Float16Codec, ProductQuantizer, ScalarInt8Codec
+from .storage import VECTORS_FILE, RowBuffer, remove_file, write_array, write_bytes
+
+# Files written by the IVF backend next to the vectors
+IVF_CENTROIDS_FILE = "ivf_centroids.f32"
+IVF_ASSIGNMENTS_FILE = "ivf_assignments.i32"
+
+# Files written by the compressed backends
+QUANT_INFO_FILE = "quant.json"
+QUANT_CODES_FILE = "quant_codes.bin"
+QUANT_CODEBOOK_FILE = "quant_codebook.f32"
+
+# Searches whose allowed mask (e.g. a metadata filter) admits at most this
+# fraction of the vectors score only the allowed rows instead of scanning all
+FILTER_SCAN_FRACTION = 0.3
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """
+    L2-normalize each row of a matrix, leaving all-zero rows as zeros
+    
+    Args:
+        matrix: Array of shape (n, dim) or (dim,)
+    
+    Returns:
+        Float32 array of shape (n, dim)
+    """
+    matrix = np.atleast_2d(matrix).astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Indices of the k highest scores in each row, best first
+    
+    Args:
+        scores: Array of shape (num_queries, n)
+        k: Number of indices to keep per row
+    
+    Returns:
+        Integer array of shape (num_queries, min(k, n))
+    """
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        # O(n) selection of the top k, then sort only those k
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.broadcast_to(np.arange(n), (scores.shape[0], n))
+    candidate_scores = np.take_along_axis(scores, candidates, axis=1)
+    order = np.argsort(-candidate_scores, axis=1, kind="stable")
+    return np.take_along_axis(candidates, order, axis=1)
+
+def pad_results(scores: np.ndarray, ids: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Pad a single query's results to length k with id -1 and score -inf
+    
+    Args:
+        scores: Scores of the found neighbours, best first
+        ids: Ids of the found neighbours
+        k: Result length
+    
+    Returns:
+        Tuple of (scores, ids) arrays of length k
+    """
+    padded_scores = np.full(k, -np.inf, dtype=np.float32)
+    padded_ids = np.full(k, -1, dtype=np.int64)
+    padded_scores[:len(scores)] = scores
+    padded_ids[:len(ids)] = ids
+    return padded_scores, padded_ids
+
+def selective_candidates(allowed: np.ndarray, n: int) -> np.ndarray:
+    """
+    Ids admitted by a selective allowed mask
+    
+    Args:
+        allowed: Boolean mask over ids, or None
+        n: Number of indexed vectors
+    
+    Returns:
+        Ascending array of allowed ids, or None when there is no mask or it
+        admits more than FILTER_SCAN_FRACTION of the vectors
+    """
+    if allowed is None:
+        return None
+    allowed = allowed[:n]
+    if np.count_nonzero(allowed) > FILTER_SCAN_FRACTION * n:
+        return None
+    return np.flatnonzero(allowed)
+
+class VectorIndex:
+    """
+    Interface of vector index backends
+    
+    Backends store L2-normalized float32 vectors under consecutive integer
+    ids (in insertion order) and rank them by inner product, which equals
+    cosine similarity for normalized vectors.
+    """
+    
+    # Name recorded in the saved header and used by VECTOR_DB_TYPE
+    name = None
+    
+    def __len__(self) -> int:
+        raise NotImplementedError
+    
+    @property
+    def dim(self) -> int:
+        """Vector dimension, or 0 while empty"""
+        raise NotImplementedError
+    
+    def add(self, vectors: np.ndarray):
+        """
+        Append normalized vectors; they receive the next consecutive ids
+        
+        Args:
+            vectors: Float32 array of shape (n, dim)
+        """
+        raise NotImplementedError
+    
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k best-scoring vectors for each query
+        
+        Args:
+            queries: Normalized float32 array of shape (num_queries, dim)
+            k: Number of neighbours per query
+            allowed: Boolean mask over ids; False ids are never returned (optional)
+        
+        Returns:
+            Tuple of (scores, ids) arrays of shape (num_queries, k'), best first;
+            missing neighbours are padded with id -1 and score -inf
+        """
+        raise NotImplementedError
+    
+    def shard(self, start: int, end: int) -> "VectorIndex":
+        """
+        Searchable read-only view of the vectors with ids in [start, end)
+        
+        The view shares the stored (possibly memory-mapped) data instead of
+        copying it; its ids are relative to `start`.
+        
+        Args:
+            start: First vector id
+            end: Vector id after the last one
+        
+        Returns:
+            VectorIndex of the same type over the id range
+        """
+        raise NotImplementedError
+    
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        """
+        Return the stored vectors for the given ids
+        
+        Args:
+            ids: Integer array of vector ids
+        
+        Returns:
+            Float32 array of shape (len(ids), dim)
+        """
+        raise NotImplementedError
+    
+    def save(self, db_path: str):
+        """
+        Write the backend's files into a database directory
+        
+        Args:
+            db_path: Vector database directory
+        """
+        raise NotImplementedError
+    
+    def load(self, db_path: str, header: dict):
+        """
+        Open the backend's files from a database directory
+        
+        Args:
+            db_path: Vector database directory
+            header: Saved database header
+        """
+        raise NotImplementedError
+
+class FlatIndex(VectorIndex):
+    """Exact brute-force index over a contiguous, growable float32 matrix"""
+    
+    name = "flat"
+    
+    # Rows gathered per block when scoring a subset, so each block stays in cache
+    GATHER_BLOCK_SIZE = 4096
+    
+    def __init__(self):
+        """Initialize an empty flat index"""
+        self._rows = RowBuffer(np.float32)
+    
+    def __len__(self) -> int:
+        return len(self._rows)
+    
+    @property
+    def dim(self) -> int:
+        return self._rows.width
+    
+    @property
+    def vectors(self) -> np.ndarray:
+        """Stored vectors as a read-only view of shape (n, dim)"""
+        view = self._rows.data
+        view.flags.writeable = False
+        return view
+    
+    def add(self, vectors: np.ndarray):
+        self._rows.append(vectors)
+    
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        if len(self) == 0 or k <= 0:
+            return (np.empty((len(queries), 0), dtype=np.float32),
+                    np.empty((len(queries), 0), dtype=np.int64))
+        
+        candidates = selective_candidates(allowed, len(self))
+        if candidates is not None:
+            return self._search_rows(queries, k, candidates)
+        
+        # Rows are pre-normalized, so one GEMM yields all cosine similarities
+        scores = queries @ self._rows.data.T
+        if allowed is not None:
+            scores[:, ~allowed[:len(self)]] = -np.inf
+        ids = top_k_indices(scores, k)
+        top_scores = np.take_along_axis(scores, ids, axis=1)
+        ids = np.where(np.isneginf(top_scores), -1, ids).astype(np.int64)
+        return top_scores, ids
+    
+    def _search_rows(self, queries: np.ndarray, k: int, candidates: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Exact search over the candidate rows only, so the cost scales with their number"""
+        width = min(k, len(self))
+        all_scores = np.full((len(queries), width), -np.inf, dtype=np.float32)
+        all_ids = np.full((len(queries), width), -1, dtype=np.int64)
+        if len(candidates):
+            rows = self._rows.data
+            scores = np.empty((len(queries), len(candidates)), dtype=np.float32)
+            for start in range(0, len(candidates), self.GATHER_BLOCK_SIZE):
+                block = candidates[start:start + self.GATHER_BLOCK_SIZE]
+                scores[:, start:start + len(block)] = queries @ rows[block].T
+            best = top_k_indices(scores, width)
+            all_scores[:, :best.shape[1]] = np.take_along_axis(scores, best, axis=1)
+            all_ids[:, :best.shape[1]] = candidates[best]
+        return all_scores, all_ids
+    
+    def shard(self, start: int, end: int) -> "FlatIndex":
+        shard = FlatIndex()
+        shard._rows = self._rows.view(start, end)
+        return shard
+    
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        return np.asarray(self._rows.data[np.asarray(ids, dtype=np.int64)], dtype=np.float32)
+    
+    def save(self, db_path: str):
+        self._rows.save(os.path.join(db_path, VECTORS_FILE))
+    
+    def load(self, db_path: str, header: dict):
+        self._rows = RowBuffer.open(os.path.join(db_path, VECTORS_FILE), np.float32, header["count"], header["dim"])
+
+class IVFIndex(FlatIndex):
+    """
+    Approximate inverted-file index with k-means coarse quantization
+    
+    Vectors are assigned to their nearest of `nlist` centroids; a query only
+    scores the vectors in its `nprobe` closest lists. The centroids are
+    trained when an index of at least IVF_MIN_TRAIN_SIZE vectors is saved
+    (or by train()), so nlist fits the whole index and the result is saved
+    with it; until then search is an exact scan. Vectors added later are
+    assigned to the trained lists.
+    """
+    
+    name = "ivf"
+    
+    def __init__(self, nlist: int = None, nprobe: int = None):
+        """
+        Initialize an empty IVF index
+        
+        Args:
+            nlist: Number of inverted lists, 0 for sqrt(n) (uses config default if None)
+            nprobe: Lists scanned per query (uses config default if None)
+        """
+        super().__init__()
+        self.nlist = Config.IVF_NLIST if nlist is None else nlist
+        self.nprobe = nprobe or Config.IVF_NPROBE
+        
+        self.centroids = None
+        # Nearest-centroid list of each vector, one int32 row per vector
+        self._assignments = RowBuffer(np.int32, 1)
+        # (vectors covered, centroids, list ids, list offsets), published as one
+        # tuple; inverted lists are in CSR form: ids of list j are
+        # list_ids[list_offsets[j]:list_offsets[j + 1]]
+        self._lists = None
+        self._lists_lock = threading.Lock()
+    
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+    
+    def train(self, iterations: int = None, sample_size: int = None, seed: int = 0):
+        """
+        Learn the coarse centroids with spherical k-means and assign all vectors
+        
+        Args:
+            iterations: k-means iterations (uses config default if None)
+            sample_size: Vectors sampled for training (default 64 per list)
+            seed: Random seed for sampling and initialization
+        """
+        if len(self) == 0:
+            raise ValueError("Cannot train an empty IVF index")
+        
+        nlist = self.nlist or int(np.sqrt(len(self)))
+        nlist = max(1, min(nlist, len(self)))
+        iterations = iterations or Config.IVF_TRAIN_ITERATIONS
+        sample_size = min(len(self), sample_size or nlist * 64)
+        
+        rng = np.random.default_rng(seed)
+        sample_ids = np.sort(rng.choice(len(self), size=sample_size, replace=False))
+        sample = np.asarray(self._rows.data[sample_ids], dtype=np.float32)
+        
+        logger.info(f"Training IVF index: {nlist} lists on {sample_size} sampled vectors")
+        centroids = kmeans(sample, nlist, iterations, rng)
+        assignments = RowBuffer(np.int32, 1)
+        assignments.append(self._assign(self._rows.data, centroids)[:, None])
+        lists = self._build_lists(centroids, assignments.data[:, 0])
+        # Searches see either the untrained index or all of the trained state
+        self._assignments = assignments
+        self.centroids = centroids
+        self._lists = lists
+    
+    @staticmethod
+    def _assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 65536) -> np.ndarray:
+        """Nearest-centroid list of each vector, computed in blocks"""
+        assignments = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), block_size):
+            block = np.asarray(vectors[start:start + block_size], dtype=np.float32)
+            assignments[start:start + len(block)] = np.argmax(block @ centroids.T, axis=1)
+        return assignments
+    
+    @staticmethod
+    def _build_lists(centroids: np.ndarray, assignments: np.ndarray) -> tuple:
+        """Group vector ids by list into CSR arrays, see _lists"""
+        list_ids = np.argsort(assignments, kind="stable").astype(np.int64)
+        counts = np.bincount(assignments, minlength=len(centroids))
+        list_offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return len(assignments), centroids, list_ids, list_offsets
+    
+    def _inverted_lists(self) -> tuple:
+        """Inverted lists covering every assigned vector, built by one thread on the first search after a load or adds"""
+        lists = self._lists
+        if lists is None or lists[0] != len(self._assignments):
+            with self._lists_lock:
+                lists = self._lists
+                assignments = self._assignments.data[:, 0]
+                if lists is None or lists[0] != len(assignments):
+                    lists = self._lists = self._build_lists(self.centroids, assignments)
+        return lists
+    
+    def add(self, vectors: np.ndarray):
+        super().add(vectors)
+        if self.is_trained and len(vectors):
+            # The inverted lists are rebuilt on the next search
+            self._assignments.append(self._assign(vectors, self.centroids)[:, None])
+    
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.is_trained or k <= 0:
+            return super().search(queries, k, allowed)
+        candidates = selective_candidates(allowed, len(self))
+        if candidates is not None:
+            # Probing would mostly find filtered-out vectors; the allowed rows are few enough to score exactly
+            return self._search_rows(queries, k, candidates)
+        _, centroids, list_ids, list_offsets = self._inverted_lists()
+        
+        nprobe = min(self.nprobe, len(centroids))
+        probes = top_k_indices(queries @ centroids.T, nprobe)
+        
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_ids = np.empty((len(queries), k), dtype=np.int64)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([
+                list_ids[list_offsets[j]:list_offsets[j + 1]] for j in lists
+            ])
+            if allowed is not None:
+                candidates = candidates[allowed[candidates]]
+            candidates.sort()  # Sequential access into the (possibly memory-mapped) matrix
+            scores = self._rows.data[candidates] @ query
+            best = top_k_indices(scores[None, :], k)[0]
+            all_scores[row], all_ids[row] = pad_results(scores[best], candidates[best], k)
+        return all_scores, all_ids
+    
+    def shard(self, start: int, end: int) -> "IVFIndex":
+        shard = IVFIndex(self.nlist, self.nprobe)
+        shard._rows = self._rows.view(start, end)
+        if self.is_trained:
+            # Shared centroids; the shard's inverted lists are built on its first search
+            shard.centroids = self.centroids
+            shard._assignments = self._assignments.view(start, end)
+        return shard
+    
+    def save(self, db_path: str):
+        if not self.is_trained and len(self) >= Config.IVF_MIN_TRAIN_SIZE:
+            self.train()
+        super().save(db_path)
+        if self.is_trained:
+            write_array(os.path.join(db_path, IVF_CENTROIDS_FILE), self.centroids)
+            self._assignments.save(os.path.join(db_path, IVF_ASSIGNMENTS_FILE))
+    
+    def load(self, db_path: str, header: dict):
+        super().load(db_path, header)
+        centroids_path = os.path.join(db_path, IVF_CENTROIDS_FILE)
+        if os.path.exists(centroids_path):
+            self.centroids = np.fromfile(centroids_path, dtype=np.float32).reshape(-1, header["dim"])
+            # Memory-mapped like the vectors; the inverted lists are built on the first search
+            self._assignments = RowBuffer.open(
+                os.path.join(db_path, IVF_ASSIGNMENTS_FILE), np.int32, header["count"], 1
+            )
+
+def kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """
+    Spherical k-means: centroids are re-normalized and assignment is by inner product
+    
+    Args:
+        data: Normalized float32 array of shape (n, dim), n >= k
+        k: Number of centroids
+        iterations: Number of Lloyd iterations
+        rng: Random generator used for initialization
+    
+    Returns:
+        Normalized float32 centroids of shape (k, dim)
+    """
+    centroids = data[rng.choice(len(data), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(data @ centroids.T, axis=1)
+        counts = np.bincount(assignments, minlength=k)
+        
+        # Per-cluster sums via one sort and a segmented reduction
+        order = np.argsort(assignments, kind="stable")
+        starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        sums = np.zeros_like(centroids)
+        nonempty = counts > 0
+        sums[nonempty] = np.add.reduceat(data[order], starts[nonempty], axis=0)
+        
+        # Re-seed empty clusters with random points
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = data[rng.choice(len(data), size=int(empty.sum()), replace=False)]
+        centroids = normalize_rows(sums)
+    return centroids
+
+class CompressedIndex(VectorIndex):
+    """
+    Exhaustive index over compressed vectors with optional float32 re-ranking
+    
+    Once enough vectors are present to train the codec, every vector is
+    stored as a compact code and queries are scored directly against the
+    codes. With re-ranking enabled the `k * rerank_factor` best candidates
+    are re-scored exactly against the float32 vectors, which stay on disk
+    and are memory-mapped after a load, so only candidate rows are paged in.
+    With re-ranking disabled the float32 vectors are dropped after training.
+    """
+    
+    codec_class = None
+    
+    # Codes scored per block, bounding the temporary score matrix
+    BLOCK_SIZE = 16384
+    
+    def __init__(self, rerank_factor: int = None):
+        """
+        Initialize an empty compressed index
+        
+        Args:
+            rerank_factor: Candidates re-ranked per result, 0 to disable (uses config default if None)
+        """
+        self.rerank_factor = Config.QUANT_RERANK_FACTOR if rerank_factor is None else rerank_factor
+        self.codec = None
+        self._codes = None
+        # Full-precision vectors: needed until the codec is trained, kept
+        # afterwards only for re-ranking
+        self._raw = FlatIndex()
+        self._dim = 0
+    
+    def _make_codec(self, dim: int):
+        return self.codec_class(dim)
+    
+    @property
+    def is_trained(self) -> bool:
+        return self._codes is not None
+    
+    def __len__(self) -> int:
+        return len(self._codes) if self.is_trained else len(self._raw)
+    
+    @property
+    def dim(self) -> int:
+        return self._dim
+    
+    @property
+    def code_bytes(self) -> int:
+        """Bytes of compressed codes held by the index"""
+        return self._codes.nbytes if self.is_trained else 0
+    
+    def train(self, sample_size: int = None, seed: int = 0):
+        """
+        Learn the codec on a sample of the stored vectors and encode them all
+        
+        Args:
+            sample_size: Vectors sampled for training (default Config.QUANT_MIN_TRAIN_SIZE)
+            seed: Random seed for sampling and codec initialization
+        """
+        if len(self) == 0:
+            raise ValueError(f"Cannot train an empty {self.name} index")
+        
+        rng = np.random.default_rng(seed)
+        sample_size = min(len(self), sample_size or max(Config.QUANT_MIN_TRAIN_SIZE, 256))
+        sample_ids = np.sort(rng.choice(len(self), size=sample_size, replace=False))
+        
+        logger.info(f"Training {self.name} codec on {sample_size} sampled vectors")
+        codec = self._make_codec(self._dim)
+        codec.train(self._raw.reconstruct(sample_ids), rng)
+        
+        codes = RowBuffer(codec.code_dtype, codec.code_width)
+        vectors = self._raw.vectors
+        for start in range(0, len(vectors), self.BLOCK_SIZE):
+            codes.append(codec.encode(vectors[start:start + self.BLOCK_SIZE]))
+        self.codec, self._codes = codec, codes
+        
+        if not self.rerank_factor:
+            self._raw = None
+    
+    def add(self, vectors: np.ndarray):
+        if len(vectors) == 0:
+            return
+        self._dim = vectors.shape[1]
+        if self._raw is not None:
+            self._raw.add(vectors)
+        if self.is_trained:
+            self._codes.append(self.codec.encode(vectors))
+        elif len(self) >= Config.QUANT_MIN_TRAIN_SIZE:
+            self.train()
+    
+    def _scan(self, queries: np.ndarray, depth: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Top `depth` approximate scores and ids per query over all codes, or only the allowed ones if few"""
+        prepared = self.codec.prepare(queries)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_ids = np.empty((len(queries), 0), dtype=np.int64)
+        codes = self._codes.data
+        candidates = selective_candidates(allowed, len(codes))
+        total = len(codes) if candidates is None else len(candidates)
+        for start in range(0, total, self.BLOCK_SIZE):
+            if candidates is None:
+                block = codes[start:start + self.BLOCK_SIZE]
+                block_ids = np.arange(start, start + len(block))
+            else:
+                block_ids = candidates[start:start + self.BLOCK_SIZE]
+                block = codes[block_ids]
+            scores = self.codec.score(prepared, block)
+            if allowed is not None and candidates is None:
+                scores[:, ~allowed[start:start + len(block)]] = -np.inf
+            # Merge the block into the running top candidates
+            block_ids = np.broadcast_to(block_ids, scores.shape)
+            scores = np.concatenate((best_scores, scores), axis=1)
+            ids = np.concatenate((best_ids, block_ids), axis=1)
+            top = top_k_indices(scores, depth)
+            best_scores = np.take_along_axis(scores, top, axis=1)
+            best_ids = np.take_along_axis(ids, top, axis=1)
+        return best_scores, np.where(np.isneginf(best_scores), -1, best_ids)
+    
+    def search(self, queries: np.ndarray, k: int, allowed: np.ndarray = None) -> Tuple[np.ndarray, np.ndarray]:
+        if not self.is_trained or k <= 0:
+            return self._raw.search(queries, k, allowed)
+        
+        if self._raw is None:
+            scores, ids = self._scan(queries, k, allowed)
+            return scores.astype(np.float32), ids.astype(np.int64)
+        
+        candidate_scores, candidate_ids = self._scan(queries, k * max(1, self.rerank_factor), allowed)
+        all_scores = np.empty((len(queries), k), dtype=np.float32)
+        all_ids = np.empty((len(queries), k), dtype=np.int64)
+        for row, (query, candidates) in enumerate(zip(queries, candidate_ids)):
+            candidates = np.sort(candidates[candidates >= 0])  # Sequential reads from the memory map
+            scores = self._raw.reconstruct(candidates) @ query
+            best = top_k_indices(scores[None, :], k)[0]
+            all_scores[row], all_ids[row] = pad_results(scores[best], candidates[best], k)
+        return all_scores, all_ids
+    
+    def shard(self, start: int, end: int) -> "CompressedIndex":
+        shard = type(self)(self.rerank_factor)
+        shard._dim = self._dim
+        shard._raw = self._raw.shard(start, end) if self._raw is not None else None
+        if self.is_trained:
+            shard.codec = self.codec
+            shard._codes = self._codes.view(start, end)
+        return shard
+    
+    def reconstruct(self, ids: np.ndarray) -> np.ndarray:
+        if self._raw is not None:
+            return self._raw.reconstruct(ids)
+        return self.codec.decode(self._codes.data[np.asarray(ids, dtype=np.int64)])
+    
+    def save(self, db_path: str):
+        vectors_path = os.path.join(db_path, VECTORS_FILE)
+        if self._raw is not None:
+            self._raw.save(db_path)
+        else:
+            remove_file(vectors_path)
+        
+        if self.is_trained:
+            self._codes.save(os.path.join(db_path, QUANT_CODES_FILE))
+            write_array(os.path.join(db_path, QUANT_CODEBOOK_FILE), self.codec.state())
+        info = {
+            "codec": self.name,
+            "trained": self.is_trained,
+            "code_width": self._codes.width if self.is_trained else 0,
+            "float32_vectors": self._raw is not None
+        }
+        write_bytes(os.path.join(db_path, QUANT_INFO_FILE), json.dumps(info).encode("utf-8"))
+    
+    def load(self, db_path: str, header: dict):
+        with open(os.path.join(db_path, QUANT_INFO_FILE), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self._dim = header["dim"]
+        
+        self._raw = None
+        if info["float32_vectors"]:
+            self._raw = FlatIndex()
+            self._raw.load(db_path, header)
+        
+        if info["trained"]:
+            codec = self._make_codec(self._dim)
+            codec.load_state(np.fromfile(os.path.join(db_path, QUANT_CODEBOOK_FILE), dtype=np.float32))
+            self.codec = codec
+            self._codes = RowBuffer.open(
+                os.path.join(db_path, QUANT_CODES_FILE), codec.code_dtype, header["count"], info["code_width"]
+            )
+
+class Float16Index(CompressedIndex):
+    """Compressed index storing vectors as float16 (2 bytes per dimension)"""
+    
+    name = "fp16"
+    codec_class = Float16Codec
+
+class ScalarInt8Index(CompressedIndex):
+    """Compressed index storing 8-bit scalar-quantized vectors (1 byte per dimension)"""
+    
+    name = "sq8"
+    codec_class = ScalarInt8Codec
+
+class ProductQuantizedIndex(CompressedIndex):
+    """Compressed index storing product-quantized vectors (1 byte per subvector)"""
+    
+    name = "pq"
+    codec_class = ProductQuantizer
+    
+    def _make_codec(self, dim: int):
+        return ProductQuantizer(dim, Config.PQ_SUBVECTORS)
+
+# Backends selectable through Config.VECTOR_DB_TYPE
+INDEX_TYPES = {
+    "flat": FlatIndex,
+    # No FAISS dependency is bundled; its exact IndexFlatIP is equivalent to "flat"
+    "faiss": FlatIndex,
+    "ivf": IVFIndex,
+    "fp16": Float16Index,
+    "sq8": ScalarInt8Index,
+    "pq": ProductQuantizedIndex
+}
+
+def create_vector_index(index_type: str = None) -> VectorIndex:
+    """
+    Create an empty vector index backend
+    
+    Args:
+        index_type: Backend name (uses config default if None)
+    
+    Returns:
+        VectorIndex instance
+    """
+    if index_type is None:
+        index_type = Config.VECTOR_DB_TYPE
+    index_class = INDEX_TYPES.get(index_type.lower())
+    if index_class is None:
+        raise ValueError(
+            f"Unknown VECTOR_DB_TYPE '{index_type}'. Available: {', '.join(sorted(INDEX_TYPES))}"
+        )
+    return index_class()